@@ -1,10 +1,24 @@
 # app/__init__.py
 import os
+import time
+import click
 from flask import Flask
 from flask_restful import Api
 
 from config import Config
-from .database import db, ma
+from .database import db, ma, init_sqlite_profile
+from .cache_service import DataVersion
+from .index_service import IndexService
+from .schema_service import SchemaService
+from .export_job_service import ExportJobService
+from .delta_export_service import DeltaExportService
+from .search_service import SearchService
+from .services import ReceiptService
+from .file_service import ImageDerivativeService, UploadRequest
+from .models import Receipt, StorageUsage
+from .storage_service import StorageService, StorageLedger
+from .image_gc_service import ImageGCService
+from .duplicate_service import DuplicateService
 from .frontend import frontend_bp
 from .category_api import category_bp
 from .category_frontend import category_frontend_bp
@@ -16,10 +30,18 @@ from .resources import (
     ReceiptResource,
     ReceiptRecognizeResource,
     ReceiptBatchUploadResource,
+    ReceiptDuplicateReportResource,
     ReceiptItemListResource,
     ItemListResource,
     ItemResource,
     ExportResource,
+    ExportCsvResource,
+    ExportNdjsonResource,
+    ExportColumnarResource,
+    ExportDeltaResource,
+    ExportJobListResource,
+    ExportJobResource,
+    ExportJobDownloadResource,
     AnalyticsDashboardResource,
     AnalyticsTrendResource,
     AnalyticsDailyItemsResource,
@@ -29,6 +51,7 @@ from .resources import (
     DataMiningComparisonResource,
     DataMiningGroupResource,
     DataMiningGroupDetailResource,
+    AnalyticsCacheResource,
 )
 
 
@@ -38,6 +61,8 @@ def create_app(config_class=Config):
 
     app = Flask(__name__)
     app.config.from_object(config_instance)
+    # 上传文件分块缓存到临时文件，同时计算原始内容的MD5
+    app.request_class = UploadRequest
 
     # 确保上传目录存在
     if not os.path.exists(app.config["UPLOAD_FOLDER"]):
@@ -45,9 +70,18 @@ def create_app(config_class=Config):
 
     # 初始化扩展
     db.init_app(app)
+    init_sqlite_profile(app)
     ma.init_app(app)
     api = Api(app)
 
+    # 追踪数据写入，用于分析缓存失效
+    DataVersion.register_session_events()
+    # 记录删除的小票和商品，供增量导出使用
+    DeltaExportService.register_session_events()
+    # 建表时同时创建全文检索索引，并随写入维护 n-gram 索引
+    SearchService.register_ddl_events()
+    SearchService.register_session_events()
+
     # 注册 Blueprint
     app.register_blueprint(frontend_bp)
     app.register_blueprint(category_bp)
@@ -65,11 +99,149 @@ def create_app(config_class=Config):
             db.create_all()
             print("数据库已初始化。")
 
+    @app.cli.command("upgrade-db")
+    def upgrade_db_command():
+        """将已有数据库升级到当前的表结构（补建表、列和索引并回填）。"""
+        with app.app_context():
+            result = SchemaService.upgrade()
+            print(f"新增列: {', '.join(result['added_columns']) or '无'}")
+            print(f"新建索引: {', '.join(result['created_indexes']) or '无'}")
+            if result["rebuilt_search_index"]:
+                print("已重建全文检索索引。")
+            if result["cleared_image_hashes"]:
+                print(
+                    f"清除了 {result['cleared_image_hashes']} 条旧格式的图片哈希，"
+                    "可运行 flask backfill-image-hashes 重新计算。"
+                )
+
+    @app.cli.command("create-indexes")
+    def create_indexes_command():
+        """为已有数据库补建缺失的索引。"""
+        with app.app_context():
+            created = IndexService.create_missing_indexes()
+            for name in created:
+                print(f"已创建索引: {name}")
+            print(f"索引迁移完成，新建 {len(created)} 个索引。")
+
+    @app.cli.command("check-query-plans")
+    def check_query_plans_command():
+        """检查服务查询的执行计划，发现全表扫描时返回非零状态。"""
+        with app.app_context():
+            problems = IndexService.check_query_plans()
+            for problem in problems:
+                print(f"[{problem['name']}] 全表扫描: {', '.join(problem['full_scans'])}")
+                print(f"    {' '.join(problem['statement'].split())}")
+            if problems:
+                raise SystemExit(1)
+            print("所有查询均使用索引。")
+
+    @app.cli.command("rebuild-search-index")
+    def rebuild_search_index_command():
+        """创建并重建全文检索索引。"""
+        with app.app_context():
+            if SearchService.rebuild_indexes():
+                print("全文检索索引已重建。")
+            else:
+                print("当前SQLite不支持FTS5，搜索将使用模糊匹配。")
+
+    @app.cli.command("backfill-receipt-totals")
+    def backfill_receipt_totals_command():
+        """按商品重新计算所有小票的商品数量和合计金额。"""
+        with app.app_context():
+            updated = ReceiptService.backfill_totals()
+            print(f"已更新 {updated} 张小票的商品数量和合计金额。")
+
+    @app.cli.command("generate-image-derivatives")
+    def generate_image_derivatives_command():
+        """为已有小票图片生成缩略图和预览图。"""
+        with app.app_context():
+            filenames = [
+                filename
+                for (filename,) in db.session.query(Receipt.image_filename)
+                .filter(Receipt.image_filename.isnot(None))
+                .distinct()
+            ]
+            generated = sum(
+                ImageDerivativeService.generate_all(filename) for filename in filenames
+            )
+            print(f"已为 {len(filenames)} 张图片生成 {generated} 个缩略图/预览图。")
+
+    @app.cli.command("migrate-storage")
+    def migrate_storage_command():
+        """将平铺存放的图片移动到分级目录，并重建存储用量台账。"""
+        with app.app_context():
+            StorageUsage.__table__.create(db.engine, checkfirst=True)
+            moved = StorageService.migrate_flat_files()
+            file_count, total_bytes = StorageLedger.get_usage()
+            print(f"已移动 {moved} 个图片文件。")
+            print(f"存储用量: {file_count} 个文件，共 {total_bytes / 1024 / 1024:.1f} MB。")
+
+    @app.cli.command("gc-images")
+    @click.option("--dry-run", is_flag=True, help="只输出报告，不删除文件")
+    @click.option("--grace", type=int, default=None, help="宽限期（秒）")
+    @click.option(
+        "--interval", type=int, default=0, help="定时运行的间隔（秒），0 表示只运行一次"
+    )
+    def gc_images_command(dry_run, grace, interval):
+        """回收未被小票引用的图片文件。"""
+        while True:
+            with app.app_context():
+                report = ImageGCService.collect(dry_run=dry_run, grace_period=grace)
+            for orphan in report["orphans"]:
+                print(
+                    f"  {orphan['filename']}  {orphan['size']} 字节  "
+                    f"{orphan['age_seconds'] // 3600} 小时前"
+                )
+            print(
+                f"扫描 {report['scanned_count']} 个文件，引用 {report['referenced_count']} 个，"
+                f"孤立 {report['orphan_count']} 个（{report['orphan_bytes'] / 1024 / 1024:.1f} MB），"
+                f"宽限期内 {report['recent_count']} 个，"
+                f"等待压缩 {report['pending_count']} 个。"
+            )
+            if dry_run:
+                print(f"可清理派生图片 {report['derivatives_deleted']} 个（未删除）。")
+            else:
+                print(
+                    f"已删除 {report['deleted_count']} 个图片"
+                    f"（{report['freed_bytes'] / 1024 / 1024:.1f} MB），"
+                    f"{report['derivatives_deleted']} 个派生图片。"
+                )
+            if interval <= 0:
+                break
+            time.sleep(interval)
+
+    @app.cli.command("backfill-image-hashes")
+    @click.option("--flag", is_flag=True, help="同时将相近的小票标记为重复")
+    def backfill_image_hashes_command(flag):
+        """为已有小票计算用于重复检测的图片哈希。"""
+        with app.app_context():
+            hashed, flagged = DuplicateService.backfill(flag=flag)
+            print(f"已为 {hashed} 张小票计算图片哈希。")
+            if flag:
+                print(f"标记了 {flagged} 张重复小票。")
+
+    @app.cli.command("cleanup-exports")
+    def cleanup_exports_command():
+        """清理超过保留时间的导出文件。"""
+        with app.app_context():
+            removed = ExportJobService.cleanup_expired()
+            print(f"已清理 {removed} 个过期导出文件。")
+
+    @app.cli.command("prune-deleted-records")
+    @click.option("--days", type=int, default=None, help="保留天数")
+    def prune_deleted_records_command(days):
+        """清理超过保留期的删除记录（增量导出墓碑）。"""
+        with app.app_context():
+            removed = DeltaExportService.prune_deleted_records(retention_days=days)
+            print(f"已清理 {removed} 条删除记录。")
+
     # 注册 API 资源
     # 获取小票列表
     api.add_resource(ReceiptListResource, "/api/receipts")
     # 批量上传小票
     api.add_resource(ReceiptBatchUploadResource, "/api/receipts/batch_upload")
+    # 可能重复的小票（图片相近）
+    api.add_resource(ReceiptDuplicateReportResource, "/api/receipts/duplicates")
     # 获取小票详情
     api.add_resource(ReceiptResource, "/api/receipts/<int:receipt_id>")
     # 重新处理小票
@@ -84,6 +256,17 @@ def create_app(config_class=Config):
     api.add_resource(ItemResource, "/api/items/<int:item_id>")
     # 导出接口
     api.add_resource(ExportResource, "/api/export")
+    # 流式导出接口
+    api.add_resource(ExportCsvResource, "/api/export.csv")
+    api.add_resource(ExportNdjsonResource, "/api/export.ndjson")
+    api.add_resource(ExportColumnarResource, "/api/export/columnar")
+    api.add_resource(ExportDeltaResource, "/api/export/delta")
+    # 后台导出任务
+    api.add_resource(ExportJobListResource, "/api/export/jobs")
+    api.add_resource(ExportJobResource, "/api/export/jobs/<string:job_id>")
+    api.add_resource(
+        ExportJobDownloadResource, "/api/export/jobs/<string:job_id>/download"
+    )
 
     # 数据分析接口
     api.add_resource(AnalyticsDashboardResource, "/api/analytics/dashboard")
@@ -96,6 +279,7 @@ def create_app(config_class=Config):
         AnalyticsCategoryItemsResource,
         "/api/analytics/category/<string:category>/items",
     )
+    api.add_resource(AnalyticsCacheResource, "/api/analytics/cache")
 
     # 数据挖掘API
     api.add_resource(DataMiningCategoryTreeResource, "/api/data-mining/category-tree")
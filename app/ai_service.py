@@ -1,6 +1,7 @@
 # app/ai_service.py
 import base64
 import json
+import time
 from openai import OpenAI
 from flask import current_app
 from .category_service import CategoryService
@@ -11,6 +12,8 @@ class AIService:
 
     def __init__(self):
         self.client = None  # 延迟初始化
+        # 最近一次识别请求的图片大小（base64字节数）、耗时和输入token数
+        self.last_stats = None
         # 移除硬编码的分类定义，改为从数据库动态获取
 
     def _get_category_structure_with_ids(self):
@@ -157,8 +160,10 @@ class AIService:
         try:
             client = self._get_client()
 
+            image_payload_bytes = 0
             if image_path:
                 base64_image = self._encode_image(image_path)
+                image_payload_bytes = len(base64_image)
                 messages = [
                     {
                         "role": "system",
@@ -184,11 +189,24 @@ class AIService:
                 ]
             print("AI Prompt:", prompt)
 
+            start = time.perf_counter()
             response = client.chat.completions.create(
                 model=self.model_name,
                 messages=messages,  # type: ignore
                 temperature=self.temperature,
             )
+            self.last_stats = {
+                "image_payload_bytes": image_payload_bytes,
+                "latency": time.perf_counter() - start,
+                "prompt_tokens": (
+                    response.usage.prompt_tokens if response.usage else None
+                ),
+            }
+            current_app.logger.info(
+                f"小票识别: 图片 {image_payload_bytes} 字节（base64），"
+                f"耗时 {self.last_stats['latency']:.2f}s，"
+                f"输入token {self.last_stats['prompt_tokens']}"
+            )
 
             response_content = response.choices[0].message.content
             if response_content is None or response_content.strip() == "":
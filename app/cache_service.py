@@ -0,0 +1,283 @@
+# app/cache_service.py
+import copy
+import json
+import threading
+import functools
+from collections import OrderedDict
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import Session
+from .database import db
+from .models import DataVersionCounter
+
+
+class DataVersion:
+    """全局数据版本号
+
+    任何写入小票、商品、耐用品、分类的事务在同一事务内将版本号加一，
+    缓存键中包含版本号，因此旧版本的缓存条目自然失效。
+    版本号保存在数据库 data_version 表的单行记录中，一个工作进程的写入提交后，
+    其他工作进程读取到新的版本号，各自的缓存同样失效；每个请求只读取一次。
+    """
+
+    # 影响分析结果的表
+    TRACKED_TABLES = {"receipts", "items", "durable_goods", "categories"}
+
+    ROW_ID = 1
+
+    @classmethod
+    def get(cls):
+        """当前已提交的版本号，请求内缓存在 flask.g 中"""
+        if has_request_context() and "data_version" in g:
+            return g.data_version
+        version = cls.read()
+        if has_request_context():
+            g.data_version = version
+        return version
+
+    @classmethod
+    def read(cls):
+        """在会话的当前事务中读取版本号（不使用请求内缓存）"""
+        version = db.session.execute(
+            select(DataVersionCounter.version).where(
+                DataVersionCounter.id == cls.ROW_ID
+            )
+        ).scalar()
+        return version or 0
+
+    @classmethod
+    def _forget(cls):
+        if has_request_context():
+            g.pop("data_version", None)
+
+    @staticmethod
+    def _increment(connection, at_least=0):
+        """在连接当前的事务中将版本号加一（不小于 at_least + 1），返回新版本号"""
+        version = connection.execute(
+            update(DataVersionCounter)
+            .where(DataVersionCounter.id == DataVersion.ROW_ID)
+            .values(version=func.max(DataVersionCounter.version, at_least) + 1)
+            .returning(DataVersionCounter.version)
+        ).scalar()
+        if version is None:
+            version = at_least + 1
+            connection.execute(
+                insert(DataVersionCounter).values(id=DataVersion.ROW_ID, version=version)
+            )
+        return version
+
+    @classmethod
+    def bump(cls, at_least=0):
+        """
+        在独立的事务中将版本号加一，用于不经过会话写入的数据变化（如恢复备份）
+
+        Args:
+            at_least: 新版本号至少为该值加一（数据库被替换后避免版本号回退）
+        """
+        with db.engine.begin() as connection:
+            version = cls._increment(connection, at_least)
+        cls._forget()
+        return version
+
+    @classmethod
+    def for_session(cls, session):
+        """
+        会话当前事务的版本号：首次调用时在同一事务内将版本号加一（每个事务一次）
+
+        SQLite 同一时间只有一个写事务，加一后该事务持有写锁直到提交，
+        因此各事务的版本号与提交顺序一致，可用作增量同步的水位线。
+        """
+        if "data_version" not in session.info:
+            session.info["data_version"] = cls._increment(session.connection())
+        return session.info["data_version"]
+
+    @classmethod
+    def _is_tracked(cls, obj):
+        return getattr(obj, "__tablename__", None) in cls.TRACKED_TABLES
+
+    @classmethod
+    def register_session_events(cls):
+        """注册SQLAlchemy会话事件，自动追踪数据写入"""
+        if getattr(cls, "_events_registered", False):
+            return
+        cls._events_registered = True
+
+        @event.listens_for(Session, "before_flush")
+        def _bump_on_flush(session, flush_context, instances):
+            for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+                if cls._is_tracked(obj):
+                    cls.for_session(session)
+                    return
+
+        @event.listens_for(Session, "do_orm_execute")
+        def _bump_on_bulk(orm_execute_state):
+            # 处理 Query.delete()/update() 等批量语句
+            if orm_execute_state.is_update or orm_execute_state.is_delete:
+                mapper = orm_execute_state.bind_mapper
+                table = getattr(mapper, "local_table", None) if mapper else None
+                if table is None or table.name in cls.TRACKED_TABLES:
+                    cls.for_session(orm_execute_state.session)
+
+        @event.listens_for(Session, "after_commit")
+        def _forget_on_commit(session):
+            # 本请求随后读取提交后的版本号
+            if "data_version" in session.info:
+                cls._forget()
+
+        @event.listens_for(Session, "after_rollback")
+        def _forget_on_rollback(session):
+            cls._forget()
+
+        @event.listens_for(Session, "after_transaction_end")
+        def _reset_on_transaction_end(session, transaction):
+            # 下一个事务写入时重新加一
+            if transaction.parent is None:
+                session.info.pop("data_version", None)
+
+
+class AnalyticsCache:
+    """分析结果缓存，LRU淘汰并限制内存占用
+
+    缓存键由方法名、规范化后的参数和全局数据版本号组成。
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _config(key, default):
+        if has_app_context():
+            return current_app.config.get(key, default)
+        return default
+
+    def is_enabled(self):
+        return self._config("ANALYTICS_CACHE_ENABLED", True)
+
+    @staticmethod
+    def _normalize(value):
+        """将参数规范化为可稳定序列化的结构"""
+        if value is None:
+            return None
+        if hasattr(value, "to_dict") and hasattr(value, "getlist"):
+            # werkzeug MultiDict（request.args）
+            value = value.to_dict()
+        if isinstance(value, dict):
+            return {
+                str(k): AnalyticsCache._normalize(v)
+                for k, v in value.items()
+                if v is not None and v != ""
+            }
+        if isinstance(value, (list, tuple)):
+            return [AnalyticsCache._normalize(v) for v in value]
+        return value
+
+    def make_key(self, name, args, kwargs):
+        payload = {
+            "args": self._normalize(list(args)),
+            "kwargs": self._normalize(kwargs),
+        }
+        normalized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return (name, DataVersion.get(), normalized)
+
+    @staticmethod
+    def _estimate_size(value):
+        try:
+            return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        except (TypeError, ValueError):
+            return 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self._estimate_size(value)
+        max_bytes = self._config("ANALYTICS_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+        max_entries = self._config("ANALYTICS_CACHE_MAX_ENTRIES", 256)
+
+        # 单个结果超过上限时不缓存
+        if size > max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+
+            self._entries[key] = (value, size)
+            self._total_bytes += size
+
+            # 丢弃旧版本数据并按LRU顺序淘汰
+            current_version = DataVersion.get()
+            for stale_key in [k for k in self._entries if k[1] != current_version]:
+                self._total_bytes -= self._entries.pop(stale_key)[1]
+                self.evictions += 1
+
+            while self._entries and (
+                self._total_bytes > max_bytes or len(self._entries) > max_entries
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def get_stats(self):
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self._config("ANALYTICS_CACHE_ENABLED", True),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total * 100, 2) if total else 0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "memory_bytes": self._total_bytes,
+                "max_entries": self._config("ANALYTICS_CACHE_MAX_ENTRIES", 256),
+                "max_bytes": self._config(
+                    "ANALYTICS_CACHE_MAX_BYTES", 32 * 1024 * 1024
+                ),
+                "data_version": DataVersion.get(),
+            }
+
+    def cached(self, name):
+        """缓存装饰器，用于分析服务的静态方法"""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.is_enabled():
+                    return func(*args, **kwargs)
+
+                key = self.make_key(name, args, kwargs)
+                value = self.get(key)
+                if value is not None:
+                    return copy.deepcopy(value)
+
+                value = func(*args, **kwargs)
+                # 计算期间数据发生变化时，结果可能已过期，不写入缓存
+                if key[1] == DataVersion.get():
+                    self.set(key, copy.deepcopy(value))
+                return value
+
+            return wrapper
+
+        return decorator
+
+
+analytics_cache = AnalyticsCache()
@@ -0,0 +1,263 @@
+# app/columnar_export_service.py
+import csv
+import io
+import json
+import zipfile
+from .database import db
+from .models import RecognitionStatus
+from .services import ExportService, get_user_timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 为可选依赖
+    pa = None
+    pc = None
+    pq = None
+
+
+class _ChunkSink:
+    """只追加的写入目标，写入的数据可以分段取出用于流式响应"""
+
+    def __init__(self):
+        self._chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ColumnarExportService:
+    """列式导出服务：直接由SQL结果批次按列构建，供pandas等分析工具读取"""
+
+    # (字段名, 逻辑类型)，顺序与 ExportService.EXPORT_FIELDS 一致
+    SCHEMA = [
+        ("receipt_id", "int64"),
+        ("receipt_name", "string"),
+        ("store_name", "string"),
+        ("store_category", "string"),
+        ("transaction_time", "timestamp"),
+        ("receipt_created_at", "timestamp"),
+        ("receipt_status", "dictionary"),
+        ("receipt_notes", "string"),
+        ("item_id", "int64"),
+        ("item_name_ja", "string"),
+        ("item_name_zh", "string"),
+        ("price_jpy", "float64"),
+        ("price_cny", "float64"),
+        ("category_id", "int64"),
+        ("category_path", "dictionary"),
+        ("special_info", "string"),
+        ("is_special_offer", "bool"),
+        ("item_notes", "string"),
+    ]
+
+    # 查询结果中各列的位置（查询不含 category_path）
+    TIME_COLUMNS = (4, 5)
+    STATUS_COLUMN = 6
+    CATEGORY_COLUMN = 13
+    BOOL_COLUMN = 15
+
+    FORMATS = {
+        "arrow": ("arrow", "application/vnd.apache.arrow.stream"),
+        "parquet": ("parquet", "application/vnd.apache.parquet"),
+        "csv": ("zip", "application/zip"),
+    }
+
+    @staticmethod
+    def is_arrow_available():
+        """是否安装了 pyarrow"""
+        return pa is not None
+
+    @staticmethod
+    def default_format():
+        return "arrow" if pa is not None else "csv"
+
+    @staticmethod
+    def _dictionaries():
+        """
+        固定的字典编码表，所有批次共用
+
+        Returns:
+            tuple: (分类ID列表, 分类路径列表, 状态列表)
+        """
+        path_map = ExportService.get_category_path_map()
+        category_ids = sorted(path_map)
+        category_paths = [path_map[category_id] for category_id in category_ids]
+        statuses = [status.value for status in RecognitionStatus]
+        return category_ids, category_paths, statuses
+
+    @staticmethod
+    def _iter_column_batches(args, batch_size):
+        """按批次读取查询结果，并转置为列元组"""
+        query = ExportService.build_export_rows_query(args)
+        result = db.session.execute(
+            query.statement, execution_options={"yield_per": batch_size}
+        )
+        for partition in result.partitions():
+            yield list(zip(*partition))
+
+    @staticmethod
+    def iter_export(export_format, args, batch_size=10000):
+        """
+        生成列式导出文件的数据块
+
+        Args:
+            export_format: arrow / parquet（需要 pyarrow）或 csv（类型化CSV + schema，打包为zip）
+            args: 与 ExportService 相同的筛选、排序参数
+            batch_size: 每个记录批次的行数
+
+        Yields:
+            bytes: 文件数据块
+        """
+        if export_format == "csv":
+            return ColumnarExportService._iter_typed_csv(args, batch_size)
+        return ColumnarExportService._iter_arrow(export_format, args, batch_size)
+
+    @staticmethod
+    def _arrow_schema(user_timezone):
+        timestamp = pa.timestamp("us", tz=user_timezone)
+        types = {
+            "int64": pa.int64(),
+            "string": pa.string(),
+            "timestamp": timestamp,
+            "float64": pa.float64(),
+            "bool": pa.bool_(),
+        }
+        fields = []
+        for name, logical_type in ColumnarExportService.SCHEMA:
+            if logical_type == "dictionary":
+                fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                fields.append(pa.field(name, types[logical_type]))
+        return pa.schema(fields)
+
+    @staticmethod
+    def _iter_arrow(export_format, args, batch_size):
+        user_timezone = get_user_timezone()
+        schema = ColumnarExportService._arrow_schema(user_timezone)
+        category_ids, category_paths, statuses = ColumnarExportService._dictionaries()
+        category_id_set = pa.array(category_ids, pa.int64())
+        category_dictionary = pa.array(category_paths, pa.string())
+        status_set = pa.array(statuses, pa.string())
+
+        sink = _ChunkSink()
+        if export_format == "parquet":
+            writer = pq.ParquetWriter(sink, schema)
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+
+        for columns in ColumnarExportService._iter_column_batches(args, batch_size):
+            arrays = []
+            for index, values in enumerate(columns):
+                if index == ColumnarExportService.STATUS_COLUMN:
+                    status_values = pa.array(
+                        [status.value if status else None for status in values],
+                        pa.string(),
+                    )
+                    arrays.append(
+                        pa.DictionaryArray.from_arrays(
+                            pc.index_in(status_values, value_set=status_set),
+                            status_set,
+                        )
+                    )
+                    continue
+
+                field = schema.field(len(arrays))
+                # 时间以UTC存储（无时区信息），由列类型上的时区标注本地时间
+                arrays.append(pa.array(values, field.type))
+
+                if index == ColumnarExportService.CATEGORY_COLUMN:
+                    arrays.append(
+                        pa.DictionaryArray.from_arrays(
+                            pc.index_in(arrays[-1], value_set=category_id_set),
+                            category_dictionary,
+                        )
+                    )
+
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield sink.drain()
+
+        writer.close()
+        yield sink.drain()
+
+    @staticmethod
+    def build_csv_schema(category_paths, statuses):
+        """类型化CSV的schema说明（随数据一起打包为 schema.json）"""
+        columns = []
+        for name, logical_type in ColumnarExportService.SCHEMA:
+            column = {"name": name, "type": logical_type}
+            if logical_type == "timestamp":
+                column["timezone"] = "UTC"
+            if logical_type == "dictionary":
+                column["index_type"] = "int32"
+            columns.append(column)
+        return {
+            "format": "typed-csv",
+            "data_file": "data.csv",
+            "display_timezone": get_user_timezone(),
+            "columns": columns,
+            # 字典编码列在CSV中存储为字典下标
+            "dictionaries": {
+                "receipt_status": statuses,
+                "category_path": category_paths,
+            },
+            "bool_encoding": "0/1",
+        }
+
+    @staticmethod
+    def _iter_typed_csv(args, batch_size):
+        category_ids, category_paths, statuses = ColumnarExportService._dictionaries()
+        category_codes = {category_id: i for i, category_id in enumerate(category_ids)}
+        status_codes = {status: i for i, status in enumerate(RecognitionStatus)}
+        schema = ColumnarExportService.build_csv_schema(category_paths, statuses)
+
+        sink = _ChunkSink()
+        archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+        archive.writestr(
+            "schema.json", json.dumps(schema, ensure_ascii=False, indent=2)
+        )
+        data_file = io.TextIOWrapper(
+            archive.open("data.csv", "w", force_zip64=True),
+            encoding="utf-8",
+            newline="",
+        )
+        writer = csv.writer(data_file)
+        writer.writerow([name for name, _ in ColumnarExportService.SCHEMA])
+        yield sink.drain()
+
+        for columns in ColumnarExportService._iter_column_batches(args, batch_size):
+            columns = list(columns)
+            for index in ColumnarExportService.TIME_COLUMNS:
+                columns[index] = [
+                    value.isoformat() if value is not None else None
+                    for value in columns[index]
+                ]
+            status = ColumnarExportService.STATUS_COLUMN
+            columns[status] = [status_codes.get(value) for value in columns[status]]
+            flag = ColumnarExportService.BOOL_COLUMN
+            columns[flag] = [None if value is None else int(value) for value in columns[flag]]
+            category = ColumnarExportService.CATEGORY_COLUMN
+            columns.insert(
+                category + 1, [category_codes.get(value) for value in columns[category]]
+            )
+            writer.writerows(zip(*columns))
+            data_file.flush()
+            yield sink.drain()
+
+        data_file.close()
+        archive.close()
+        yield sink.drain()
@@ -1,6 +1,37 @@
 # app/database.py
 from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
+from sqlalchemy import event
 
 db = SQLAlchemy()
 ma = Marshmallow()
+
+
+def init_sqlite_profile(app):
+    """为SQLite引擎设置连接级PRAGMA（WAL、busy_timeout等）
+
+    需在 db.init_app(app) 之后、首次连接数据库之前调用。
+    """
+    if not app.config.get("SQLITE_PROFILE_ENABLED", True):
+        return
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = [
+        ("journal_mode", app.config.get("SQLITE_JOURNAL_MODE", "WAL")),
+        ("busy_timeout", app.config.get("SQLITE_BUSY_TIMEOUT", 30000)),
+        ("synchronous", app.config.get("SQLITE_SYNCHRONOUS", "NORMAL")),
+        ("cache_size", app.config.get("SQLITE_CACHE_SIZE", -64000)),
+        ("mmap_size", app.config.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    ]
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            if value is not None:
+                cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
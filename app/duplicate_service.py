@@ -0,0 +1,441 @@
+# app/duplicate_service.py
+import itertools
+import math
+import operator
+import threading
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from PIL import Image
+from .database import db
+from .models import Receipt, RecognitionStatus
+from .cache_service import analytics_cache
+from .file_service import AIImageService, FileService, ImageCompressionService
+
+
+# DCT 的余弦系数表：(边长, 系数个数) -> [[cos], ...]
+_DCT_TABLES = {}
+
+
+def _dct_table(size, count):
+    table = _DCT_TABLES.get((size, count))
+    if table is None:
+        table = [
+            [math.cos(math.pi * (2 * x + 1) * u / (2 * size)) for x in range(size)]
+            for u in range(count)
+        ]
+        _DCT_TABLES[(size, count)] = table
+    return table
+
+
+def phash(image, size=32, count=16):
+    """
+    感知哈希（pHash）
+
+    缩小为 size x size 的灰度图做二维DCT，取左上角 count x count 个低频系数，
+    大于中位数（不含直流分量）的系数记为1，得到 count*count 位整数。
+    低频系数反映文字行、段落的排布和深浅，对缩放、重新压缩、模糊和整体明暗
+    变化不敏感，位数足够时也能区分版式相同、内容不同的小票。
+    """
+    pixels = image.convert("L").resize((size, size), Image.Resampling.LANCZOS).tobytes()
+    table = _dct_table(size, count)
+    # 先对每行做一维DCT，再对结果的每列做一维DCT
+    rows = []
+    for y in range(size):
+        line = pixels[y * size : (y + 1) * size]
+        rows.append([sum(map(operator.mul, cosines, line)) for cosines in table])
+    coefficients = [
+        sum(cosines[y] * rows[y][u] for y in range(size))
+        for cosines in table
+        for u in range(count)
+    ]
+    ac = sorted(coefficients[1:])
+    median = ac[len(ac) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+class HammingIndex:
+    """
+    定长位数哈希的多索引哈希（multi-index hashing）
+
+    哈希分为 chunks 段，每段建一个 段值 -> 键集合 的表。海明距离不超过 d 的两个哈希
+    至少有一段的距离不超过 d // chunks（鸽巢原理），查询时在每段枚举距离不超过
+    该值的段值取出候选，再计算完整距离，结果与逐个比较相同。
+    段数取 阈值 // 2 + 1 时每段只需枚举距离0和1的段值。
+    """
+
+    def __init__(self, chunks=4, bits=64):
+        base, extra = divmod(bits, chunks)
+        self._widths = [base + (1 if n < extra else 0) for n in range(chunks)]
+        self._offsets = list(itertools.accumulate([0] + self._widths[:-1]))
+        self._tables = [{} for _ in range(chunks)]
+        self._flip_masks = {}
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def _chunks(self, value):
+        return [
+            (value >> offset) & ((1 << width) - 1)
+            for offset, width in zip(self._offsets, self._widths)
+        ]
+
+    def add(self, key, value):
+        """添加或替换键对应的哈希"""
+        old = self.values.get(key)
+        if old == value:
+            return
+        if old is not None:
+            self.remove(key)
+        self.values[key] = value
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            table.setdefault(chunk, set()).add(key)
+
+    def remove(self, key):
+        value = self.values.pop(key, None)
+        if value is None:
+            return
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            keys = table.get(chunk)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del table[chunk]
+
+    def _masks(self, width, radius):
+        """width 位的段内距离不超过 radius 的所有翻转掩码"""
+        masks = self._flip_masks.get((width, radius))
+        if masks is None:
+            masks = [0]
+            for count in range(1, radius + 1):
+                for bits in itertools.combinations(range(width), count):
+                    masks.append(sum(1 << bit for bit in bits))
+            self._flip_masks[(width, radius)] = masks
+        return masks
+
+    def search(self, value, max_distance):
+        """
+        查找海明距离不超过 max_distance 的键
+
+        Returns:
+            list: [(距离, 键), ...]，按距离和键排序
+        """
+        radius = max_distance // len(self._tables)
+        candidates = set()
+        for table, chunk, width in zip(
+            self._tables, self._chunks(value), self._widths
+        ):
+            for mask in self._masks(width, radius):
+                keys = table.get(chunk ^ mask)
+                if keys:
+                    candidates.update(keys)
+        matches = []
+        for key in candidates:
+            distance = (self.values[key] ^ value).bit_count()
+            if distance <= max_distance:
+                matches.append((distance, key))
+        matches.sort()
+        return matches
+
+
+class DuplicateService:
+    """
+    重复小票检测
+
+    同一张小票重新拍照后文件内容不同，原始内容MD5去重无法识别。上传时对小票的文字
+    区域计算256位感知哈希（pHash）保存在 receipts.image_phash，在进程内的多索引哈希中
+    查找海明距离不超过 DUPLICATE_PHASH_THRESHOLD 的更早的小票，找到时记录到
+    receipts.duplicate_of_id，并（DUPLICATE_SKIP_RECOGNITION 开启时）跳过AI识别。
+    被跳过的小票保持待处理状态，可以手动重新识别或取消标记后识别。
+    """
+
+    # 哈希位数（十六进制保存为 HASH_BITS // 4 个字符）
+    HASH_BITS = 256
+    # 计算哈希时使用的缩小尺寸
+    HASH_SIZE = 1024
+    INDEX_KEY = "receipt_phash_index"
+    # 增量同步时向前多取的时间，覆盖同步时尚未提交的事务
+    SYNC_OVERLAP = timedelta(seconds=60)
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def is_enabled():
+        return current_app.config.get("DUPLICATE_DETECTION_ENABLED", True)
+
+    @staticmethod
+    def compute_hash(filename):
+        """
+        计算图片中小票文字区域的感知哈希
+
+        Returns:
+            str: 十六进制哈希；未启用、图片不存在或无法解码时返回None
+        """
+        if not filename or not DuplicateService.is_enabled():
+            return None
+        source_path = FileService.get_image_path(filename)
+        if not source_path:
+            return None
+
+        size = DuplicateService.HASH_SIZE
+        try:
+            with ImageCompressionService.decode_slot(), Image.open(
+                source_path
+            ) as image:
+                # JPEG 只按检测尺寸解码亮度通道
+                image.draft("L", (size, size))
+                return DuplicateService.hash_image(
+                    ImageCompressionService.to_rgb(image)
+                )
+        except Exception as e:
+            current_app.logger.error(f"Error hashing image {filename}: {e}")
+            return None
+
+    @staticmethod
+    def hash_image(image):
+        """
+        计算 PIL 图片中小票文字区域的感知哈希
+
+        校正倾斜后裁剪到小票，再裁剪到文字区域：同一张小票不同角度、距离的照片
+        得到相近的哈希，哈希的位也都用于区分文字内容而不是纸张边缘和背景。
+
+        Returns:
+            str: 十六进制哈希
+        """
+        size = DuplicateService.HASH_SIZE
+        image = image.convert("L")
+        image.thumbnail((size, size))
+        angle = AIImageService.find_skew_angle(image)
+        if angle:
+            image = image.rotate(
+                angle, resample=Image.Resampling.BILINEAR, expand=True
+            )
+        for find_box in (AIImageService.find_receipt_box, AIImageService.find_text_box):
+            box = find_box(image)
+            if box:
+                image = image.crop(box)
+        return format(phash(image), f"0{DuplicateService.HASH_BITS // 4}x")
+
+    @staticmethod
+    def _sync_index():
+        """
+        当前应用的哈希索引，按 updated_at 增量加载数据库中的哈希（调用方持有 _lock）
+
+        已删除的小票在查找时校验后移出索引。
+        """
+        app = current_app._get_current_object()
+        state = app.extensions.get(DuplicateService.INDEX_KEY)
+        if state is None:
+            threshold = app.config.get("DUPLICATE_PHASH_THRESHOLD", 24)
+            state = {
+                "index": HammingIndex(threshold // 2 + 1, DuplicateService.HASH_BITS),
+                "synced_at": None,
+            }
+            app.extensions[DuplicateService.INDEX_KEY] = state
+
+        now = datetime.now(timezone.utc)
+        query = db.session.query(Receipt.id, Receipt.image_phash).filter(
+            Receipt.image_phash.isnot(None)
+        )
+        if state["synced_at"] is not None:
+            query = query.filter(
+                Receipt.updated_at >= state["synced_at"] - DuplicateService.SYNC_OVERLAP
+            )
+        index = state["index"]
+        for receipt_id, phash in query:
+            index.add(receipt_id, int(phash, 16))
+        state["synced_at"] = now
+        return index
+
+    @staticmethod
+    def find_duplicate(phash, before_id=None, threshold=None):
+        """
+        查找与哈希相近的更早的小票
+
+        Args:
+            phash: 十六进制哈希
+            before_id: 只查找ID小于该值的小票，为None时查找全部
+            threshold: 最大海明距离，为None时读取 DUPLICATE_PHASH_THRESHOLD
+
+        Returns:
+            tuple: (小票ID, 海明距离)，没有时返回None
+        """
+        if not phash:
+            return None
+        if threshold is None:
+            threshold = current_app.config.get("DUPLICATE_PHASH_THRESHOLD", 24)
+        value = int(phash, 16)
+
+        with DuplicateService._lock:
+            index = DuplicateService._sync_index()
+            matches = [
+                (distance, receipt_id)
+                for distance, receipt_id in index.search(value, threshold)
+                if before_id is None or receipt_id < before_id
+            ]
+        if not matches:
+            return None
+
+        # 校验索引中的小票仍然存在且哈希未变
+        current = dict(
+            db.session.query(Receipt.id, Receipt.image_phash).filter(
+                Receipt.id.in_([receipt_id for _, receipt_id in matches])
+            )
+        )
+        with DuplicateService._lock:
+            for _, receipt_id in matches:
+                if current.get(receipt_id) is None:
+                    index.remove(receipt_id)
+                else:
+                    index.add(receipt_id, int(current[receipt_id], 16))
+        verified = sorted(
+            ((int(current[receipt_id], 16) ^ value).bit_count(), receipt_id)
+            for _, receipt_id in matches
+            if current.get(receipt_id) is not None
+        )
+        verified = [match for match in verified if match[0] <= threshold]
+        if not verified:
+            return None
+        distance, receipt_id = verified[0]
+        return receipt_id, distance
+
+    @staticmethod
+    def flag(receipt, phash):
+        """
+        记录小票图片的哈希，与更早的小票相近时标记为重复（随调用方的事务提交）
+
+        Returns:
+            bool: 是否标记为重复
+        """
+        if not phash:
+            return False
+        receipt.image_phash = phash
+        match = DuplicateService.find_duplicate(phash, before_id=receipt.id)
+        receipt.duplicate_of_id = match[0] if match else None
+        if match:
+            current_app.logger.info(
+                f"Receipt {receipt.id or '(new)'} looks like a duplicate of "
+                f"receipt {match[0]} (distance {match[1]})"
+            )
+        return match is not None
+
+    @staticmethod
+    def backfill(flag=False, batch_size=200):
+        """
+        按ID顺序为已有小票计算图片哈希
+
+        Args:
+            flag: 为True时同时将与更早的小票相近的小票标记为重复
+            batch_size: 每批提交的小票数
+
+        Returns:
+            tuple: (计算了哈希的小票数, 标记为重复的小票数)
+        """
+        hashed = flagged = 0
+        last_id = 0
+        while True:
+            receipts = (
+                Receipt.query.filter(
+                    Receipt.id > last_id,
+                    Receipt.image_filename.isnot(None),
+                    Receipt.image_phash.is_(None),
+                )
+                .order_by(Receipt.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not receipts:
+                break
+            for receipt in receipts:
+                last_id = receipt.id
+                phash = DuplicateService.compute_hash(receipt.image_filename)
+                if not phash:
+                    continue
+                hashed += 1
+                if flag:
+                    flagged += DuplicateService.flag(receipt, phash)
+                else:
+                    receipt.image_phash = phash
+            db.session.commit()
+        return hashed, flagged
+
+    @staticmethod
+    def should_recognize(receipt):
+        """小票是否需要触发AI识别（标记为重复的小票按配置跳过）"""
+        if receipt.status != RecognitionStatus.PENDING:
+            return False
+        if receipt.duplicate_of_id is None:
+            return True
+        return not current_app.config.get("DUPLICATE_SKIP_RECOGNITION", False)
+
+    @staticmethod
+    @analytics_cache.cached("duplicate_report")
+    def duplicate_report(threshold=None):
+        """
+        按哈希相近程度将小票分组
+
+        Args:
+            threshold: 最大海明距离，为None时读取 DUPLICATE_PHASH_THRESHOLD
+
+        Returns:
+            dict: groups 为小票ID（升序）列表和组内相连小票间的最大距离，最新的组在前
+        """
+        if threshold is None:
+            threshold = current_app.config.get("DUPLICATE_PHASH_THRESHOLD", 24)
+
+        parent = {}
+
+        def find(key):
+            root = key
+            while parent.get(root, root) != root:
+                root = parent[root]
+            parent[key] = root
+            return root
+
+        distances = {}
+        with DuplicateService._lock:
+            index = DuplicateService._sync_index()
+            existing = {
+                receipt_id
+                for (receipt_id,) in db.session.query(Receipt.id).filter(
+                    Receipt.image_phash.isnot(None)
+                )
+            }
+            for receipt_id in [key for key in index.values if key not in existing]:
+                index.remove(receipt_id)
+            hashed_count = len(index)
+            for receipt_id, value in index.values.items():
+                for distance, other_id in index.search(value, threshold):
+                    if other_id >= receipt_id:
+                        continue
+                    root, other_root = find(receipt_id), find(other_id)
+                    if root != other_root:
+                        parent[max(root, other_root)] = min(root, other_root)
+                    distances[receipt_id] = max(distances.get(receipt_id, 0), distance)
+
+        groups = {}
+        for receipt_id in parent:
+            groups.setdefault(find(receipt_id), set()).add(receipt_id)
+        result = []
+        for root, members in groups.items():
+            members.add(root)
+            receipt_ids = sorted(members)
+            result.append(
+                {
+                    "receipt_ids": receipt_ids,
+                    "max_distance": max(
+                        distances.get(receipt_id, 0) for receipt_id in receipt_ids
+                    ),
+                }
+            )
+        result.sort(key=lambda group: group["receipt_ids"][-1], reverse=True)
+        return {
+            "threshold": threshold,
+            "hashed_count": hashed_count,
+            "group_count": len(result),
+            "duplicate_count": sum(len(group["receipt_ids"]) - 1 for group in result),
+            "groups": result,
+        }
@@ -0,0 +1,451 @@
+# app/export_job_service.py
+import csv
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+from flask import current_app
+from .database import db
+from .services import ExportService
+
+
+class ExportJobStatus:
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+
+# XML 1.0 不允许出现的字符（制表符、换行、回车以外的控制字符等），写入前删除
+_XML_INVALID_CHARS = re.compile(
+    r"[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]"
+)
+
+
+class XlsxStreamWriter:
+    """最小化的XLSX写入器，逐行写入工作表，不在内存中保留整个表格"""
+
+    CONTENT_TYPES = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    )
+    ROOT_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    )
+    WORKBOOK = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="export" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    )
+    WORKBOOK_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    )
+
+    def __init__(self, path):
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        self._zip.writestr("[Content_Types].xml", self.CONTENT_TYPES)
+        self._zip.writestr("_rels/.rels", self.ROOT_RELS)
+        self._zip.writestr("xl/workbook.xml", self.WORKBOOK)
+        self._zip.writestr("xl/_rels/workbook.xml.rels", self.WORKBOOK_RELS)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            b"<sheetData>"
+        )
+
+    @staticmethod
+    def _cell(value):
+        if value is None:
+            return "<c/>"
+        if isinstance(value, bool):
+            return f'<c t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)):
+            return f"<c><v>{value}</v></c>"
+        text = _XML_INVALID_CHARS.sub("", str(value))
+        return f'<c t="inlineStr"><is><t>{escape(text)}</t></is></c>'
+
+    def writerows(self, rows):
+        """写入多行"""
+        parts = []
+        for row in rows:
+            parts.append("<row>")
+            parts.extend(self._cell(value) for value in row)
+            parts.append("</row>")
+        self._sheet.write("".join(parts).encode("utf-8"))
+
+    def close(self):
+        self._sheet.write(b"</sheetData></worksheet>")
+        self._sheet.close()
+        self._zip.close()
+
+
+class ExportJobService:
+    """
+    后台导出任务服务：在工作线程中分批写出导出文件，完成后提供下载
+
+    任务状态保存在导出文件旁的 <任务ID>.job.json 中，任何工作进程（包括重启后）都能
+    查询、下载和删除任务；状态由运行任务的线程更新，长时间未更新的运行中任务
+    视为所在进程已退出，报告为失败。
+    """
+
+    FORMATS = {
+        "csv": ("csv", "text/csv"),
+        "json": ("json", "application/json"),
+        "xlsx": (
+            "xlsx",
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        ),
+    }
+
+    STATUS_SUFFIX = ".job.json"
+    JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+    _lock = threading.Lock()
+    _executor = None
+
+    @classmethod
+    def _get_executor(cls, app):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=app.config.get("EXPORT_JOB_WORKERS", 2),
+                    thread_name_prefix="export-job",
+                )
+            return cls._executor
+
+    @staticmethod
+    def _export_folder(app):
+        folder = app.config["EXPORT_JOB_FOLDER"]
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    @classmethod
+    def _status_path(cls, folder, job_id):
+        return os.path.join(folder, job_id + cls.STATUS_SUFFIX)
+
+    @classmethod
+    def _save(cls, folder, job):
+        """写入任务状态文件（先写临时文件再替换，读取方不会读到写了一半的文件）"""
+        path = cls._status_path(folder, job["id"])
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def _load(cls, job_id, now=None):
+        """
+        读取任务状态
+
+        Returns:
+            dict: 任务状态，不存在或状态文件无效时返回None
+        """
+        folder = current_app.config.get("EXPORT_JOB_FOLDER")
+        if not folder or not cls.JOB_ID_PATTERN.fullmatch(job_id or ""):
+            return None
+        path = cls._status_path(folder, job_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                job = json.load(f)
+            updated_at = os.path.getmtime(path)
+        except (OSError, ValueError):
+            return None
+
+        # 运行任务的进程退出后状态不再更新
+        stale_after = current_app.config.get("EXPORT_JOB_STALE_TIMEOUT", 600)
+        if (
+            job["status"] == ExportJobStatus.RUNNING
+            and updated_at + stale_after <= (now or time.time())
+        ):
+            ttl = current_app.config.get("EXPORT_JOB_TTL", 3600)
+            job.update(
+                status=ExportJobStatus.FAILED,
+                error_message="导出任务所在的进程已退出",
+                expires_at_ts=updated_at + ttl,
+            )
+        return job
+
+    @classmethod
+    def _iter_jobs(cls, now=None):
+        folder = current_app.config.get("EXPORT_JOB_FOLDER")
+        if not folder or not os.path.isdir(folder):
+            return
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(cls.STATUS_SUFFIX):
+                job = cls._load(filename[: -len(cls.STATUS_SUFFIX)], now)
+                if job:
+                    yield job
+
+    @staticmethod
+    def _public_view(job):
+        """返回任务状态（不包含内部字段）"""
+        return {
+            key: value
+            for key, value in job.items()
+            if key not in ("file_path", "filters", "expires_at_ts")
+        }
+
+    @classmethod
+    def create_job(cls, export_format, filters):
+        """
+        创建导出任务并提交到后台线程池
+
+        Args:
+            export_format: 导出格式 (csv/json/xlsx)
+            filters: 与 ExportService 相同的筛选、排序参数
+
+        Returns:
+            tuple: (成功标志, 任务信息或错误消息)
+        """
+        if export_format not in cls.FORMATS:
+            return False, f"不支持的导出格式: {export_format}"
+
+        app = current_app._get_current_object()
+        cls.cleanup_expired()
+
+        # 统一为字符串，与查询参数的行为保持一致
+        filters = {
+            key: str(value).lower() if isinstance(value, bool) else str(value)
+            for key, value in (filters or {}).items()
+            if value is not None and key not in ("page", "per_page")
+        }
+
+        job_id = uuid.uuid4().hex
+        extension, _ = cls.FORMATS[export_format]
+        folder = cls._export_folder(app)
+        job = {
+            "id": job_id,
+            "format": export_format,
+            "status": ExportJobStatus.PENDING,
+            "rows_written": 0,
+            "total_rows": None,
+            "file_size": None,
+            "error_message": None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "completed_at": None,
+            "expires_at": None,
+            "expires_at_ts": None,
+            "file_path": os.path.join(folder, f"{job_id}.{extension}"),
+            "filters": filters,
+        }
+        cls._save(folder, job)
+
+        cls._get_executor(app).submit(cls._run_job, app, job_id)
+        return True, cls._public_view(job)
+
+    @classmethod
+    def get_job(cls, job_id):
+        """获取任务状态，不存在时返回None"""
+        job = cls._load(job_id)
+        return cls._public_view(job) if job else None
+
+    @classmethod
+    def list_jobs(cls):
+        """获取所有未过期的任务"""
+        cls.cleanup_expired()
+        return [cls._public_view(job) for job in cls._iter_jobs()]
+
+    @classmethod
+    def get_download(cls, job_id):
+        """
+        获取已完成任务的文件信息
+
+        Returns:
+            tuple: (文件路径, 下载文件名, MIME类型)，任务不存在或未完成时返回None
+        """
+        job = cls._load(job_id)
+        if not job or job["status"] != ExportJobStatus.COMPLETED:
+            return None
+        extension, mimetype = cls.FORMATS[job["format"]]
+        return job["file_path"], f"export_{job_id}.{extension}", mimetype
+
+    @classmethod
+    def delete_job(cls, job_id):
+        """删除任务及其文件，正在运行的任务无法删除"""
+        job = cls._load(job_id)
+        if not job:
+            return False, "导出任务不存在"
+        if job["status"] in (ExportJobStatus.PENDING, ExportJobStatus.RUNNING):
+            return False, "导出任务正在运行"
+        cls._remove_job(job)
+        return True, "导出任务已删除"
+
+    @classmethod
+    def _remove_job(cls, job):
+        """删除任务的导出文件和状态文件，返回删除的导出文件数"""
+        removed = cls._remove_file(job["file_path"])
+        cls._remove_file(job["file_path"] + ".part")
+        cls._remove_file(
+            cls._status_path(os.path.dirname(job["file_path"]), job["id"])
+        )
+        return removed
+
+    @classmethod
+    def cleanup_expired(cls, now=None):
+        """
+        清理超过保留时间的任务和导出文件
+
+        Returns:
+            int: 清理的文件数量
+        """
+        now = now or time.time()
+        removed = 0
+        active_paths = set()
+        for job in list(cls._iter_jobs(now)):
+            if job["expires_at_ts"] is not None and job["expires_at_ts"] <= now:
+                removed += cls._remove_job(job)
+            else:
+                active_paths.add(job["file_path"])
+                active_paths.add(
+                    cls._status_path(os.path.dirname(job["file_path"]), job["id"])
+                )
+
+        # 清理没有状态文件（或状态文件无效）的遗留文件
+        folder = current_app.config.get("EXPORT_JOB_FOLDER")
+        ttl = current_app.config.get("EXPORT_JOB_TTL", 3600)
+        if folder and os.path.isdir(folder):
+            for filename in os.listdir(folder):
+                path = os.path.join(folder, filename)
+                base_path = path[: -len(".part")] if path.endswith(".part") else path
+                if base_path in active_paths:
+                    continue
+                try:
+                    if os.path.getmtime(path) + ttl <= now:
+                        removed += cls._remove_file(path)
+                except OSError:
+                    continue
+        return removed
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    @classmethod
+    def _update(cls, job, **fields):
+        """更新任务状态并写入状态文件（只由运行任务的线程调用）"""
+        job.update(fields)
+        cls._save(os.path.dirname(job["file_path"]), job)
+
+    @classmethod
+    def _run_job(cls, app, job_id):
+        """工作线程：分批读取导出记录并写入临时文件"""
+        with app.app_context():
+            job = cls._load(job_id)
+            if not job:
+                return
+            part_path = job["file_path"] + ".part"
+            try:
+                cls._update(job, status=ExportJobStatus.RUNNING)
+                total_rows = ExportService.count_export_rows(job["filters"])
+                cls._update(job, total_rows=total_rows)
+
+                writer = cls._open_writer(job["format"], part_path)
+                try:
+                    rows_written = 0
+                    for batch in ExportService.iter_export_rows(job["filters"]):
+                        writer.writerows(batch)
+                        rows_written += len(batch)
+                        cls._update(job, rows_written=rows_written)
+                finally:
+                    writer.close()
+
+                os.replace(part_path, job["file_path"])
+                ttl = app.config.get("EXPORT_JOB_TTL", 3600)
+                finished = datetime.now(timezone.utc)
+                cls._update(
+                    job,
+                    status=ExportJobStatus.COMPLETED,
+                    file_size=os.path.getsize(job["file_path"]),
+                    completed_at=finished.isoformat(),
+                    expires_at=datetime.fromtimestamp(
+                        finished.timestamp() + ttl, timezone.utc
+                    ).isoformat(),
+                    expires_at_ts=finished.timestamp() + ttl,
+                )
+            except Exception as e:
+                app.logger.error(f"导出任务 {job_id} 失败: {e}")
+                cls._remove_file(part_path)
+                ttl = app.config.get("EXPORT_JOB_TTL", 3600)
+                cls._update(
+                    job,
+                    status=ExportJobStatus.FAILED,
+                    error_message=str(e),
+                    expires_at_ts=time.time() + ttl,
+                )
+            finally:
+                db.session.remove()
+
+    @staticmethod
+    def _open_writer(export_format, path):
+        """按格式创建写入器，写入器提供 writerows(rows) 和 close()"""
+        fields = ExportService.EXPORT_FIELDS
+
+        if export_format == "xlsx":
+            writer = XlsxStreamWriter(path)
+            writer.writerows([fields])
+            return writer
+
+        f = open(path, "w", encoding="utf-8", newline="")
+
+        if export_format == "csv":
+            # 带BOM便于Excel正确识别UTF-8
+            f.write("\ufeff")
+            csv_writer = csv.writer(f)
+            csv_writer.writerow(fields)
+
+            class CsvWriter:
+                def writerows(self, rows):
+                    csv_writer.writerows(rows)
+
+                def close(self):
+                    f.close()
+
+            return CsvWriter()
+
+        class JsonWriter:
+            """以JSON数组形式逐条写出记录"""
+
+            def __init__(self):
+                self.first = True
+                f.write("[")
+
+            def writerows(self, rows):
+                for row in rows:
+                    f.write("\n" if self.first else ",\n")
+                    f.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False))
+                    self.first = False
+
+            def close(self):
+                f.write("\n]\n")
+                f.close()
+
+        return JsonWriter()
@@ -1,15 +1,43 @@
 # app/file_service.py
+import math
 import os
+import re
 import hashlib
-from flask import current_app
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Request, current_app, url_for
 from werkzeug.utils import secure_filename
-from PIL import Image
+from PIL import Image, ImageChops, ImageFilter
 import io
+from .storage_service import StorageService
+
+# 以内容MD5命名的图片文件名
+MD5_FILENAME = re.compile(r"[0-9a-f]{32}\.jpg")
 
 
 class ImageCompressionService:
     """图片压缩服务"""
 
+    @staticmethod
+    def to_rgb(image):
+        """转换为RGB模式，透明部分填充白色背景"""
+        if image.mode in ("RGBA", "LA", "P"):
+            # 创建白色背景
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            if image.mode == "P":
+                image = image.convert("RGBA")
+            background.paste(
+                image, mask=image.split()[-1] if image.mode == "RGBA" else None
+            )
+            return background
+        if image.mode != "RGB":
+            return image.convert("RGB")
+        return image
+
     @staticmethod
     def compress_image(image_content, quality=80, max_size=(1920, 1080)):
         """压缩图片
@@ -23,21 +51,37 @@ class ImageCompressionService:
             bytes: 压缩后的图片内容
         """
         try:
-            # 从bytes创建PIL图片对象
-            image = Image.open(io.BytesIO(image_content))
+            return ImageCompressionService._compress(image_content, quality, max_size)
+        except Exception as e:
+            current_app.logger.error(f"Error compressing image: {e}")
+            return image_content  # 返回原始内容
+
+    @staticmethod
+    def _compress(image_content, quality, max_size):
+        """压缩图片，失败时抛出异常"""
+        output = io.BytesIO()
+        ImageCompressionService.compress_to(
+            io.BytesIO(image_content), output, quality, max_size
+        )
+        return output.getvalue()
+
+    @staticmethod
+    def compress_to(source, output, quality, max_size):
+        """
+        压缩图片并写入 output，失败时抛出异常（不依赖应用上下文，可在压缩进程中执行）
+
+        Args:
+            source: 图片文件路径或文件对象
+            output: 输出文件路径或文件对象
+            quality: JPEG压缩质量 (1-100)
+            max_size: 最大尺寸 (width, height)
+        """
+        with Image.open(source) as image:
+            # JPEG 按目标尺寸以降采样方式解码（1/2、1/4、1/8），不解码整张原图
+            image.draft("RGB", max_size)
 
             # 转换为RGB模式（处理RGBA等格式）
-            if image.mode in ("RGBA", "LA", "P"):
-                # 创建白色背景
-                background = Image.new("RGB", image.size, (255, 255, 255))
-                if image.mode == "P":
-                    image = image.convert("RGBA")
-                background.paste(
-                    image, mask=image.split()[-1] if image.mode == "RGBA" else None
-                )
-                image = background
-            elif image.mode != "RGB":
-                image = image.convert("RGB")
+            image = ImageCompressionService.to_rgb(image)
 
             # 计算缩放比例
             original_width, original_height = image.size
@@ -47,21 +91,87 @@ class ImageCompressionService:
                 ratio = min(max_width / original_width, max_height / original_height)
                 new_width = int(original_width * ratio)
                 new_height = int(original_height * ratio)
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                # 其他格式先按整数倍缩小（reduce）再精确缩放
+                image = image.resize(
+                    (new_width, new_height),
+                    Image.Resampling.LANCZOS,
+                    reducing_gap=3.0,
+                )
 
             # 保存为JPEG格式
-            output = io.BytesIO()
             image.save(output, format="JPEG", quality=quality, optimize=True)
-            return output.getvalue()
 
-        except Exception as e:
-            current_app.logger.error(f"Error compressing image: {e}")
-            return image_content  # 返回原始内容
+    @staticmethod
+    def decode_slot():
+        """
+        限制进程内同时解码的图片数（IMAGE_DECODE_CONCURRENCY），
+        并发上传时内存峰值不随请求数叠加
+        """
+        app = current_app._get_current_object()
+        slot = app.extensions.get("image_decode_slot")
+        if slot is None:
+            with _decode_slot_lock:
+                slot = app.extensions.get("image_decode_slot")
+                if slot is None:
+                    slot = threading.BoundedSemaphore(
+                        max(1, app.config.get("IMAGE_DECODE_CONCURRENCY", 2))
+                    )
+                    app.extensions["image_decode_slot"] = slot
+        return slot
+
+
+_decode_slot_lock = threading.Lock()
+
+
+def compress_image_file(source_path, output_path, quality, max_size):
+    """
+    在压缩进程中执行：压缩原图文件并写入 output_path（进程间只传递文件路径）
+
+    Returns:
+        str: 错误信息，压缩成功时为None
+    """
+    try:
+        ImageCompressionService.compress_to(source_path, output_path, quality, max_size)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+class HashingSpooledFile(tempfile.SpooledTemporaryFile):
+    """
+    上传文件的缓存：超过 max_size 后转存到临时文件，写入时同时计算MD5
+
+    表单解析器按块顺序写入上传内容，解析完成时原始内容的MD5也已算好，
+    不需要再读一遍文件。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.md5 = hashlib.md5()
+
+    def write(self, s):
+        self.md5.update(s)
+        return super().write(s)
+
+
+class UploadRequest(Request):
+    """上传文件缓存为 HashingSpooledFile 的请求类"""
+
+    # 上传文件在内存中缓存的上限（字节），超过后转存到临时文件
+    spool_max_size = 500 * 1024
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return HashingSpooledFile(max_size=self.spool_max_size, mode="rb+")
 
 
 class FileService:
     """处理文件相关操作的服务"""
 
+    # 分块读写文件的块大小
+    CHUNK_SIZE = 1024 * 1024
+
     @staticmethod
     def save_image_with_md5(
         image_file, compress=True, quality=80, max_size=(1920, 1080)
@@ -80,40 +190,111 @@ class FileService:
         if not image_file:
             return None
 
+        # 压缩结果写入临时文件，不在内存中保留整张图片
+        fd, temp_path = tempfile.mkstemp(suffix=".jpg")
+        os.close(fd)
         try:
-            # 读取文件内容
-            image_content = image_file.read()
-
-            # 如果启用压缩，先压缩图片
+            stream = image_file.stream
+            stream.seek(0)
             if compress:
-                image_content = ImageCompressionService.compress_image(
-                    image_content, quality, max_size
-                )
+                try:
+                    with ImageCompressionService.decode_slot():
+                        ImageCompressionService.compress_to(
+                            stream, temp_path, quality, max_size
+                        )
+                except Exception as e:
+                    current_app.logger.error(f"Error compressing image: {e}")
+                    compress = False  # 保存原始内容
+            if not compress:
+                stream.seek(0)
+                with open(temp_path, "wb") as f:
+                    shutil.copyfileobj(stream, f, FileService.CHUNK_SIZE)
+
+            return FileService.save_md5_file(temp_path)
+
+        except Exception as e:
+            current_app.logger.error(f"Error saving image file: {e}")
+            return None
+        finally:
+            os.remove(temp_path)
+
+    @staticmethod
+    def write_md5_file(image_content):
+        """
+        以内容的MD5命名保存图片，相同内容的文件已存在时不再写入
 
-            # 计算压缩后内容的MD5
-            md5_hash = hashlib.md5(image_content).hexdigest()
-            filename = f"{md5_hash}.jpg"
+        Returns:
+            str: 保存后的文件名
+        """
+        # 计算压缩后内容的MD5
+        md5_hash = hashlib.md5(image_content).hexdigest()
+        filename = f"{md5_hash}.jpg"
+        StorageService.save(filename, image_content)
+        return filename
 
-            # 保存文件
-            upload_folder = current_app.config.get("UPLOAD_FOLDER")
-            if not upload_folder:
-                raise ValueError("UPLOAD_FOLDER not configured")
+    @staticmethod
+    def save_md5_file(path):
+        """
+        以本地文件内容的MD5命名保存图片（分块读取），相同内容的文件已存在时不再写入
 
-            # 确保上传目录存在
-            os.makedirs(upload_folder, exist_ok=True)
+        Returns:
+            str: 保存后的文件名
+        """
+        with open(path, "rb") as f:
+            filename = f"{FileService.stream_md5(f)}.jpg"
+        StorageService.save_file(filename, path)
+        return filename
 
-            file_path = os.path.join(upload_folder, filename)
+    @staticmethod
+    def stream_md5(stream):
+        """分块计算文件对象剩余内容的MD5"""
+        md5_hash = hashlib.md5()
+        for chunk in iter(lambda: stream.read(FileService.CHUNK_SIZE), b""):
+            md5_hash.update(chunk)
+        return md5_hash.hexdigest()
 
-            # 直接写入压缩后的内容
-            with open(file_path, "wb") as f:
-                f.write(image_content)
+    @staticmethod
+    def hash_upload(image_file):
+        """
+        计算上传文件原始内容的MD5
+
+        上传文件由 UploadRequest 缓存时直接使用写入时算好的MD5，
+        否则分块读取计算，读取后将文件指针移回开头。
+        """
+        stream = image_file.stream
+        if isinstance(stream, HashingSpooledFile):
+            return stream.md5.hexdigest()
+        stream.seek(0)
+        md5_hash = FileService.stream_md5(stream)
+        stream.seek(0)
+        return md5_hash
 
+    @staticmethod
+    def save_original(image_file):
+        """
+        原样保存上传的图片，等待后台压缩
+
+        Returns:
+            str: 临时文件名，失败时返回None
+        """
+        if not image_file:
+            return None
+
+        try:
+            extension = os.path.splitext(secure_filename(image_file.filename or ""))[1]
+            filename = f"upload_{uuid.uuid4().hex}{extension.lower() or '.jpg'}"
+            StorageService.save_stream(filename, image_file.stream)
             return filename
 
         except Exception as e:
             current_app.logger.error(f"Error saving image file: {e}")
             return None
 
+    @staticmethod
+    def is_content_addressed(filename):
+        """文件名是否为内容的MD5（上传后尚未压缩的临时原图不是）"""
+        return bool(MD5_FILENAME.fullmatch(filename or ""))
+
     @staticmethod
     def get_image_path(filename):
         """获取图片的完整路径
@@ -122,16 +303,11 @@ class FileService:
             filename: 图片文件名
 
         Returns:
-            str: 图片的完整路径
+            str: 可直接读取的本地路径（远程存储先下载到本地缓存），不存在时返回None
         """
         if not filename:
             return None
-
-        upload_folder = current_app.config.get("UPLOAD_FOLDER")
-        if not upload_folder:
-            return None
-
-        return os.path.join(upload_folder, filename)
+        return StorageService.local_path(filename)
 
     @staticmethod
     def delete_image(filename):
@@ -147,10 +323,564 @@ class FileService:
             return True
 
         try:
-            file_path = FileService.get_image_path(filename)
-            if file_path and os.path.exists(file_path):
-                os.remove(file_path)
+            StorageService.delete(filename)
+            ImageDerivativeService.delete_derivatives(filename)
             return True
         except Exception as e:
             current_app.logger.error(f"Error deleting image file {filename}: {e}")
             return False
+
+
+class ImageCompressionPool:
+    """
+    后台图片压缩
+
+    压缩（解码、缩放、JPEG编码）在进程池中执行，不受GIL限制；
+    每个任务由一个等待线程提交并在完成后在应用上下文中执行回调。
+    """
+
+    _lock = threading.Lock()
+    _process_executor = None
+    _thread_executor = None
+    # 已提交、尚未完成（含回调）的原图文件名 -> 任务数
+    _pending = {}
+
+    @staticmethod
+    def is_enabled(app=None):
+        """启用图片压缩且配置了压缩进程数时在后台压缩"""
+        config = (app or current_app).config
+        return bool(
+            config.get("IMAGE_COMPRESSION_ENABLED", True)
+            and config.get("IMAGE_COMPRESSION_WORKERS", 0) > 0
+        )
+
+    @classmethod
+    def _get_executors(cls, app):
+        workers = app.config.get("IMAGE_COMPRESSION_WORKERS", 2)
+        with cls._lock:
+            if cls._process_executor is None:
+                cls._process_executor = ProcessPoolExecutor(max_workers=workers)
+            if cls._thread_executor is None:
+                cls._thread_executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="image-compress"
+                )
+            return cls._process_executor, cls._thread_executor
+
+    @classmethod
+    def _reset_process_executor(cls, executor):
+        """压缩进程异常退出后进程池不可再用，下次提交时重新创建"""
+        with cls._lock:
+            if cls._process_executor is executor:
+                cls._process_executor = None
+
+    @classmethod
+    def submit(cls, filename, on_done):
+        """
+        提交压缩任务
+
+        Args:
+            filename: 上传目录中待压缩的原图文件名
+            on_done: 回调 on_done(压缩后的文件名)，压缩失败时参数为None，
+                在等待线程的应用上下文中执行
+        """
+        app = current_app._get_current_object()
+        _, thread_executor = cls._get_executors(app)
+        with cls._lock:
+            cls._pending[filename] = cls._pending.get(filename, 0) + 1
+        try:
+            return thread_executor.submit(cls._run, app, filename, on_done)
+        except Exception:
+            cls._finish(filename)
+            raise
+
+    @classmethod
+    def pending_filenames(cls):
+        """本进程中排队或正在压缩的原图文件名，孤立图片回收时跳过"""
+        with cls._lock:
+            return set(cls._pending)
+
+    @classmethod
+    def _finish(cls, filename):
+        with cls._lock:
+            count = cls._pending.pop(filename, 0) - 1
+            if count > 0:
+                cls._pending[filename] = count
+
+    @classmethod
+    def _run(cls, app, filename, on_done):
+        try:
+            cls._compress(app, filename, on_done)
+        finally:
+            cls._finish(filename)
+
+    @classmethod
+    def _compress(cls, app, filename, on_done):
+        with app.app_context():
+            result = None
+            process_executor, _ = cls._get_executors(app)
+            fd, output_path = tempfile.mkstemp(suffix=".jpg")
+            os.close(fd)
+            try:
+                source_path = StorageService.local_path(filename)
+                if not source_path:
+                    raise FileNotFoundError(filename)
+                error = process_executor.submit(
+                    compress_image_file,
+                    source_path,
+                    output_path,
+                    app.config.get("IMAGE_COMPRESSION_QUALITY", 80),
+                    (
+                        app.config.get("IMAGE_MAX_WIDTH", 1920),
+                        app.config.get("IMAGE_MAX_HEIGHT", 1080),
+                    ),
+                ).result()
+                if error:
+                    # 压缩失败时保存原始内容
+                    app.logger.error(f"Error compressing image {filename}: {error}")
+                    result = FileService.save_md5_file(source_path)
+                else:
+                    result = FileService.save_md5_file(output_path)
+            except BrokenProcessPool as e:
+                cls._reset_process_executor(process_executor)
+                app.logger.error(f"Error compressing image {filename}: {e}")
+            except Exception as e:
+                app.logger.error(f"Error compressing image {filename}: {e}")
+            finally:
+                os.remove(output_path)
+
+            try:
+                on_done(result)
+            except Exception as e:
+                app.logger.error(f"Error finishing image {filename}: {e}")
+
+
+class ImageDerivativeService:
+    """
+    缩略图等派生图片服务
+
+    派生图片按原图文件名（即原图的MD5）和尺寸名称缓存在 IMAGE_DERIVATIVE_FOLDER，
+    上传时生成，缺失时在首次请求时生成。原图内容不会改变，缓存无需失效。
+    """
+
+    @staticmethod
+    def get_sizes():
+        """尺寸名称 -> (最大宽度, 最大高度)"""
+        return current_app.config.get("IMAGE_DERIVATIVE_SIZES", {})
+
+    @staticmethod
+    def derivative_filename(filename, size):
+        """派生图片的文件名，如 <md5>_thumb.jpg"""
+        return f"{os.path.splitext(filename)[0]}_{size}.jpg"
+
+    @staticmethod
+    def get_derivative_path(filename, size):
+        """
+        获取派生图片的路径，不存在时由原图生成
+
+        Args:
+            filename: 原图文件名
+            size: 尺寸名称
+
+        Returns:
+            str: 派生图片的完整路径；原图不存在时返回None
+
+        Raises:
+            ValueError: 尺寸名称或文件名无效
+        """
+        if size not in ImageDerivativeService.get_sizes():
+            raise ValueError(f"无效的图片尺寸: {size}")
+        if not filename or secure_filename(filename) != filename:
+            raise ValueError(f"无效的文件名: {filename}")
+
+        folder = current_app.config.get("IMAGE_DERIVATIVE_FOLDER")
+        if not folder:
+            raise ValueError("IMAGE_DERIVATIVE_FOLDER not configured")
+
+        path = os.path.join(
+            folder, ImageDerivativeService.derivative_filename(filename, size)
+        )
+        if os.path.exists(path):
+            return path
+        return ImageDerivativeService.generate(filename, size)
+
+    @staticmethod
+    def generate(filename, size):
+        """
+        由原图生成指定尺寸的派生图片
+
+        Returns:
+            str: 派生图片的完整路径；原图不存在时返回None
+        """
+        source_path = FileService.get_image_path(filename)
+        if not source_path or not os.path.exists(source_path):
+            return None
+
+        max_size = ImageDerivativeService.get_sizes()[size]
+        quality = current_app.config.get("IMAGE_DERIVATIVE_QUALITY", 75)
+
+        with ImageCompressionService.decode_slot(), Image.open(source_path) as image:
+            # JPEG 按目标尺寸以降采样方式解码，避免解码整张原图
+            image.draft("RGB", max_size)
+            image = ImageCompressionService.to_rgb(image)
+            image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            return ImageDerivativeService.save(image, filename, size, quality)
+
+    @staticmethod
+    def save(image, filename, variant, quality):
+        """
+        保存派生图片到缓存目录
+
+        Returns:
+            str: 派生图片的完整路径
+        """
+        folder = current_app.config.get("IMAGE_DERIVATIVE_FOLDER")
+        os.makedirs(folder, exist_ok=True)
+
+        # 先写入临时文件再替换，并发请求不会读到写了一半的文件
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=folder)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, format="JPEG", quality=quality, optimize=True)
+            path = os.path.join(
+                folder, ImageDerivativeService.derivative_filename(filename, variant)
+            )
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return path
+
+    @staticmethod
+    def generate_all(filename):
+        """
+        生成原图的全部派生图片（上传时调用，失败时只记录日志）
+
+        Returns:
+            int: 成功生成的派生图片数
+        """
+        generated = 0
+        for size in ImageDerivativeService.get_sizes():
+            try:
+                if ImageDerivativeService.get_derivative_path(filename, size):
+                    generated += 1
+            except Exception as e:
+                current_app.logger.error(
+                    f"Error generating {size} image for {filename}: {e}"
+                )
+        return generated
+
+    @staticmethod
+    def delete_derivatives(filename):
+        """
+        删除原图的全部派生图片
+
+        Returns:
+            int: 删除的文件数
+        """
+        folder = current_app.config.get("IMAGE_DERIVATIVE_FOLDER")
+        if not filename or not folder:
+            return 0
+        removed = 0
+        for size in [*ImageDerivativeService.get_sizes(), AIImageService.VARIANT]:
+            path = os.path.join(
+                folder, ImageDerivativeService.derivative_filename(filename, size)
+            )
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+        return removed
+
+    @staticmethod
+    def get_image_urls(filename):
+        """
+        原图和各尺寸派生图片的访问地址
+
+        Returns:
+            dict: {"original": 原图地址, 尺寸名称: 派生图片地址, ...}；没有图片时返回None
+        """
+        if not filename:
+            return None
+        urls = {"original": url_for("frontend.uploaded_file", filename=filename)}
+        for size in ImageDerivativeService.get_sizes():
+            urls[size] = url_for("frontend.derived_image", size=size, filename=filename)
+        return urls
+
+
+class AIImageService:
+    """
+    AI识别用的图片
+
+    识别只需要小票上的文字：裁剪到小票区域、转为灰度并缩小到长边
+    AI_IMAGE_MAX_EDGE 像素，减少上传的数据量和图片token。
+    结果与缩略图一样按原图文件名缓存（<原图名>_ai.jpg）。
+    """
+
+    VARIANT = "ai"
+    # 检测小票区域时使用的缩小尺寸
+    DETECT_SIZE = 512
+    # 检测到的区域小于该面积比例时认为检测失败，大于上限时不裁剪
+    MIN_BOX_RATIO = 0.1
+    MAX_BOX_RATIO = 0.9
+    # 裁剪时在四周保留的边距（占边长的比例）
+    BOX_MARGIN = 0.02
+    # 检测倾斜角度时使用的缩小尺寸、最大角度和细化步长（度）
+    SKEW_DETECT_SIZE = 256
+    MAX_SKEW = 6
+    SKEW_STEP = 0.25
+    # 检测文字区域时使用的缩小尺寸和文字比纸张暗的最小灰度差
+    TEXT_DETECT_SIZE = 256
+    TEXT_CONTRAST = 40
+
+    @staticmethod
+    def get_image_path(filename):
+        """
+        识别时使用的图片路径
+
+        Returns:
+            str: 预处理后的图片路径；未启用预处理或预处理失败时返回原图路径，
+                原图不存在时返回None
+        """
+        if not filename:
+            return None
+        if current_app.config.get("AI_IMAGE_PREPROCESS", True):
+            try:
+                path = AIImageService.get_variant_path(filename)
+                if path:
+                    return path
+            except Exception as e:
+                current_app.logger.error(f"Error preprocessing image {filename}: {e}")
+        return FileService.get_image_path(filename)
+
+    @staticmethod
+    def get_variant_path(filename):
+        """
+        预处理后的图片路径，不存在时由原图生成
+
+        Returns:
+            str: 图片路径；原图不存在时返回None
+        """
+        folder = current_app.config.get("IMAGE_DERIVATIVE_FOLDER")
+        if not folder:
+            return None
+        path = os.path.join(
+            folder,
+            ImageDerivativeService.derivative_filename(filename, AIImageService.VARIANT),
+        )
+        if os.path.exists(path):
+            return path
+        return AIImageService.generate(filename)
+
+    @staticmethod
+    def generate(filename):
+        """
+        裁剪小票区域、转为灰度并缩小
+
+        Returns:
+            str: 图片路径；原图不存在时返回None
+        """
+        source_path = FileService.get_image_path(filename)
+        if not source_path:
+            return None
+
+        max_edge = current_app.config.get("AI_IMAGE_MAX_EDGE", 1600)
+        quality = current_app.config.get("AI_IMAGE_QUALITY", 85)
+
+        with ImageCompressionService.decode_slot(), Image.open(source_path) as image:
+            # JPEG 只解码亮度通道
+            image.draft("L", (max_edge, max_edge))
+            image = ImageCompressionService.to_rgb(image).convert("L")
+            box = AIImageService.find_receipt_box(image)
+            if box:
+                image = image.crop(box)
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+            return ImageDerivativeService.save(
+                image, filename, AIImageService.VARIANT, quality
+            )
+
+    @staticmethod
+    def find_receipt_box(image):
+        """
+        检测小票（浅色纸张）在灰度图中的区域
+
+        在缩小的图片上做闭运算（先膨胀亮区再腐蚀）去除文字后按 Otsu 阈值二值化，
+        先取亮像素占比高的最长连续列区间，再在该区间内取亮像素占比高的最长连续行区间。
+
+        Returns:
+            tuple: (left, upper, right, lower)，未检测到或无需裁剪时返回None
+        """
+        mask = _receipt_mask(image, AIImageService.DETECT_SIZE, 9)
+        width, height = mask.size
+
+        # 缩放为一行/一列得到每列/每行的亮像素占比（0-255）
+        columns = list(mask.resize((width, 1), Image.Resampling.BOX).tobytes())
+        left, right = _longest_run(columns)
+        if right <= left:
+            return None
+        rows = list(
+            mask.crop((left, 0, right, height))
+            .resize((1, height), Image.Resampling.BOX)
+            .tobytes()
+        )
+        upper, lower = _longest_run(rows)
+        if lower <= upper:
+            return None
+
+        ratio = (right - left) * (lower - upper) / (width * height)
+        if not AIImageService.MIN_BOX_RATIO <= ratio <= AIImageService.MAX_BOX_RATIO:
+            return None
+
+        # 映射回原图坐标并留出边距
+        scale_x = image.width / width
+        scale_y = image.height / height
+        margin_x = image.width * AIImageService.BOX_MARGIN
+        margin_y = image.height * AIImageService.BOX_MARGIN
+        return (
+            max(0, int(left * scale_x - margin_x)),
+            max(0, int(upper * scale_y - margin_y)),
+            min(image.width, int(right * scale_x + margin_x)),
+            min(image.height, int(lower * scale_y + margin_y)),
+        )
+
+    @staticmethod
+    def find_text_box(image):
+        """
+        检测（已裁剪到小票的）灰度图中文字所在的区域
+
+        闭运算得到不含文字的纸张亮度，比纸张暗 TEXT_CONTRAST 以上的像素为文字，
+        只统计纸张内部（二值化后腐蚀）的文字，排除小票边缘和背景。
+
+        Returns:
+            tuple: (left, upper, right, lower)，未检测到文字时返回None
+        """
+        small = image.copy()
+        small.thumbnail((AIImageService.TEXT_DETECT_SIZE,) * 2)
+        paper = _closing(small, 5)
+        threshold = _otsu_threshold(paper.histogram())
+        inside = paper.point(lambda value: 255 if value > threshold else 0).filter(
+            ImageFilter.MinFilter(5)
+        )
+        contrast = AIImageService.TEXT_CONTRAST
+        text = ImageChops.subtract(paper, small).point(
+            lambda value: 255 if value > contrast else 0
+        )
+        box = ImageChops.multiply(text, inside).getbbox()
+        if not box:
+            return None
+
+        # 映射回原图坐标（向外取整）
+        scale_x = image.width / small.width
+        scale_y = image.height / small.height
+        return (
+            int(box[0] * scale_x),
+            int(box[1] * scale_y),
+            min(image.width, math.ceil(box[2] * scale_x)),
+            min(image.height, math.ceil(box[3] * scale_y)),
+        )
+
+    @staticmethod
+    def find_skew_angle(image):
+        """
+        检测小票在灰度图中的倾斜角度（投影轮廓法）
+
+        将小票区域的二值图旋转不同角度，取行、列投影最集中（平方和最大）的角度，
+        即小票边缘与坐标轴平行的角度。先按1度搜索，再在两侧按 SKEW_STEP 细化。
+
+        Returns:
+            float: 转正需要（逆时针）旋转的角度，未检测到倾斜时为0
+        """
+        mask = _receipt_mask(image, AIImageService.SKEW_DETECT_SIZE, 5)
+        scores = {}
+
+        def score(angle):
+            if angle not in scores:
+                rotated = mask.rotate(
+                    angle, resample=Image.Resampling.BILINEAR, expand=True
+                )
+                # 缩放得到的是每列/每行的平均值，乘以长度换算为像素数
+                columns = rotated.resize((rotated.width, 1), Image.Resampling.BOX)
+                rows = rotated.resize((1, rotated.height), Image.Resampling.BOX)
+                scores[angle] = sum(
+                    value * value for value in columns.tobytes()
+                ) * rotated.height**2 + sum(
+                    value * value for value in rows.tobytes()
+                ) * rotated.width**2
+            # 得分相同时取绝对值较小的角度
+            return scores[angle], -abs(angle)
+
+        best = max(
+            range(-AIImageService.MAX_SKEW, AIImageService.MAX_SKEW + 1), key=score
+        )
+        step = AIImageService.SKEW_STEP
+        return max((best - step, best, best + step), key=score)
+
+
+def _receipt_mask(image, size, filter_size):
+    """
+    小票（浅色纸张）区域的二值图
+
+    缩小到 size 后做闭运算（先膨胀亮区再腐蚀）去除文字，按 Otsu 阈值二值化。
+    """
+    small = image.copy()
+    small.thumbnail((size, size))
+    small = _closing(small, filter_size)
+    threshold = _otsu_threshold(small.histogram())
+    return small.point(lambda value: 255 if value > threshold else 0)
+
+
+def _closing(image, filter_size):
+    """
+    灰度闭运算（filter_size x filter_size 的最大值滤波后接最小值滤波）
+
+    n x n 的方形滤波等价于连续 (n-1)/2 次 3x3 滤波，后者快得多。
+    """
+    for _ in range(filter_size // 2):
+        image = image.filter(ImageFilter.MaxFilter(3))
+    for _ in range(filter_size // 2):
+        image = image.filter(ImageFilter.MinFilter(3))
+    return image
+
+
+def _otsu_threshold(histogram):
+    """由256级灰度直方图计算 Otsu 二值化阈值"""
+    total = sum(histogram)
+    weighted_total = sum(value * count for value, count in enumerate(histogram))
+    background = 0
+    weighted_background = 0
+    best_threshold = 0
+    best_variance = 0
+    for value, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += value * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = value
+    return best_threshold
+
+
+def _longest_run(profile):
+    """
+    亮像素占比不低于最大值一半的最长连续区间
+
+    Returns:
+        tuple: (起始下标, 结束下标+1)
+    """
+    cutoff = max(profile) / 2
+    best = (0, 0)
+    start = None
+    for index, value in enumerate([*profile, -1]):
+        if value >= cutoff and value > 0:
+            if start is None:
+                start = index
+        elif start is not None:
+            if index - start > best[1] - best[0]:
+                best = (start, index)
+            start = None
+    return best
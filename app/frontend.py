@@ -5,11 +5,15 @@ from flask import (
     jsonify,
     current_app,
     request,
-    send_from_directory,
+    send_file,
     redirect,
+    abort,
 )
 from .models import Receipt, Item
 from .services import ReceiptService, ItemService, ExportService
+from .file_service import FileService, ImageDerivativeService
+from werkzeug.utils import secure_filename
+import mimetypes
 import os
 
 frontend_bp = Blueprint("frontend", __name__)
@@ -97,10 +101,69 @@ def get_config():
     )
 
 
+def _accel_redirect_uri(path):
+    """文件位于配置了 nginx 内部地址的目录时，返回 X-Accel-Redirect 地址"""
+    for folder, prefix in current_app.config.get("IMAGE_ACCEL_REDIRECT", {}).items():
+        folder = os.path.abspath(folder)
+        if os.path.commonpath([folder, os.path.abspath(path)]) == folder:
+            relative = os.path.relpath(path, folder).replace(os.sep, "/")
+            return prefix.rstrip("/") + "/" + relative
+    return None
+
+
+def _send_image(path, etag, immutable):
+    """
+    发送图片文件
+
+    内容寻址的图片永不改变：Cache-Control 为长期缓存并标记 immutable，
+    ETag 为内容MD5（etag 为None时按文件修改时间生成），If-None-Match 匹配时返回 304。
+    USE_X_SENDFILE / IMAGE_ACCEL_REDIRECT 配置时由前端服务器发送文件内容。
+    """
+    max_age = current_app.config.get("IMAGE_CACHE_MAX_AGE", 0) if immutable else None
+    accel_uri = _accel_redirect_uri(path)
+    if accel_uri:
+        # 与 send_file 相同，按扩展名确定内容类型
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = accel_uri
+        if etag:
+            response.set_etag(etag)
+        if max_age:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+        else:
+            response.cache_control.no_cache = True
+        response.make_conditional(request)
+    else:
+        response = send_file(path, etag=etag or True, max_age=max_age)
+
+    if max_age:
+        response.cache_control.immutable = True
+    return response
+
+
 @frontend_bp.route("/static/uploads/<filename>")
 def uploaded_file(filename):
-    """提供上传的图片文件访问"""
-    upload_folder = current_app.config.get("UPLOAD_FOLDER")
-    if not upload_folder:
-        return "Upload folder not configured", 404
-    return send_from_directory(upload_folder, filename)
+    """提供上传的图片文件访问（文件按分级目录存放）"""
+    if secure_filename(filename) != filename:
+        abort(404)
+    path = FileService.get_image_path(filename)
+    if not path:
+        abort(404)
+    immutable = FileService.is_content_addressed(filename)
+    etag = os.path.splitext(filename)[0] if immutable else None
+    return _send_image(path, etag, immutable)
+
+
+@frontend_bp.route("/images/<size>/<filename>")
+def derived_image(size, filename):
+    """提供缩略图等派生图片访问，首次访问时由原图生成"""
+    try:
+        path = ImageDerivativeService.get_derivative_path(filename, size)
+    except ValueError:
+        abort(404)
+    if not path:
+        abort(404)
+    immutable = FileService.is_content_addressed(filename)
+    etag = f"{os.path.splitext(filename)[0]}-{size}" if immutable else None
+    return _send_image(path, etag, immutable)
@@ -0,0 +1,174 @@
+# app/image_gc_service.py
+import os
+import time
+from flask import current_app
+from .database import db
+from .models import Receipt, ImageUpload
+from .storage_service import StorageService
+from .file_service import FileService, ImageCompressionPool, ImageDerivativeService
+
+
+class ImageGCService:
+    """
+    图片垃圾回收（标记-清除）
+
+    标记：收集所有小票引用的图片文件名；清除：遍历存储，删除未被引用的图片、
+    对应的派生图片和去重索引记录。修改时间在宽限期内的文件不删除，
+    避免误删正在上传（尚未写入小票记录）或正在压缩的图片；复用已有文件时
+    会更新修改时间（见 StorageService.touch）。
+
+    等待后台压缩的原图（upload_*）在压缩完成前一直被待处理的小票引用；
+    小票在压缩前被删除时，本进程压缩队列中的原图同样跳过，其他进程的队列
+    无法得知，因此原图的宽限期不短于 IMAGE_GC_UPLOAD_GRACE_PERIOD。
+    """
+
+    # 报告中列出的孤立文件数上限
+    REPORT_LIMIT = 100
+
+    @staticmethod
+    def _referenced_filenames():
+        return {
+            filename
+            for (filename,) in db.session.query(Receipt.image_filename)
+            .filter(Receipt.image_filename.isnot(None))
+            .distinct()
+        }
+
+    @staticmethod
+    def _still_unreferenced(filenames):
+        """清除前再次确认未被引用（标记后可能有重复上传复用了该文件）"""
+        filenames = list(filenames)
+        referenced = set()
+        for start in range(0, len(filenames), 500):
+            chunk = filenames[start : start + 500]
+            referenced.update(
+                filename
+                for (filename,) in db.session.query(Receipt.image_filename).filter(
+                    Receipt.image_filename.in_(chunk)
+                )
+            )
+        return [filename for filename in filenames if filename not in referenced]
+
+    @staticmethod
+    def collect(dry_run=True, grace_period=None, now=None):
+        """
+        回收未被小票引用的图片
+
+        Args:
+            dry_run: 为True时只统计，不删除
+            grace_period: 宽限期秒数，为None时读取 IMAGE_GC_GRACE_PERIOD
+            now: 当前时间戳（测试用）
+
+        Returns:
+            dict: 回收报告
+        """
+        if grace_period is None:
+            grace_period = current_app.config.get("IMAGE_GC_GRACE_PERIOD", 3600)
+        now = now or time.time()
+        cutoff = now - grace_period
+        upload_cutoff = now - max(
+            grace_period, current_app.config.get("IMAGE_GC_UPLOAD_GRACE_PERIOD", 86400)
+        )
+
+        referenced = ImageGCService._referenced_filenames()
+        pending = ImageCompressionPool.pending_filenames()
+        report = {
+            "dry_run": dry_run,
+            "grace_period": grace_period,
+            "referenced_count": len(referenced),
+            "scanned_count": 0,
+            "orphan_count": 0,
+            "orphan_bytes": 0,
+            "recent_count": 0,
+            "pending_count": 0,
+            "deleted_count": 0,
+            "freed_bytes": 0,
+            "derivatives_deleted": 0,
+            "orphans": [],
+        }
+
+        # 标记：存储中未被引用的文件
+        candidates = {}
+        for key, size, modified in StorageService.get_backend().iter_keys():
+            report["scanned_count"] += 1
+            filename = key.rsplit("/", 1)[-1]
+            if filename in referenced:
+                continue
+            if filename in pending:
+                report["pending_count"] += 1
+                continue
+            if FileService.is_content_addressed(filename):
+                recent = modified > cutoff
+            else:
+                recent = modified > upload_cutoff
+            if recent:
+                report["recent_count"] += 1
+                continue
+            candidates[key] = (filename, size, modified)
+            report["orphan_count"] += 1
+            report["orphan_bytes"] += size
+            if len(report["orphans"]) < ImageGCService.REPORT_LIMIT:
+                report["orphans"].append(
+                    {
+                        "filename": filename,
+                        "size": size,
+                        "age_seconds": int(now - modified),
+                    }
+                )
+
+        if not dry_run and candidates:
+            # 清除：图片、派生图片和去重索引记录
+            orphans = set(
+                ImageGCService._still_unreferenced(
+                    {filename for filename, _, _ in candidates.values()}
+                )
+            ) - ImageCompressionPool.pending_filenames()
+            for key, (filename, _, _) in candidates.items():
+                if filename not in orphans:
+                    continue
+                size = StorageService.delete_key(key)
+                if size is not None:
+                    report["deleted_count"] += 1
+                    report["freed_bytes"] += size
+                report["derivatives_deleted"] += (
+                    ImageDerivativeService.delete_derivatives(filename)
+                )
+            if orphans:
+                ImageUpload.query.filter(ImageUpload.filename.in_(orphans)).delete(
+                    synchronize_session=False
+                )
+                db.session.commit()
+
+        report["derivatives_deleted"] += ImageGCService._collect_derivatives(
+            referenced, cutoff, dry_run
+        )
+        return report
+
+    @staticmethod
+    def _collect_derivatives(referenced, cutoff, dry_run):
+        """
+        清除原图不再被引用的派生图片（缓存目录中的 <原图名>_<尺寸>.jpg）
+
+        Returns:
+            int: 清除（dry_run 时为可清除）的文件数
+        """
+        folder = current_app.config.get("IMAGE_DERIVATIVE_FOLDER")
+        if not folder or not os.path.isdir(folder):
+            return 0
+
+        referenced_stems = {os.path.splitext(filename)[0] for filename in referenced}
+        count = 0
+        for name in os.listdir(folder):
+            stem = os.path.splitext(name)[0].rsplit("_", 1)[0]
+            if stem in referenced_stems:
+                continue
+            path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            count += 1
+        return count
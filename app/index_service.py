@@ -0,0 +1,319 @@
+# app/index_service.py
+from flask import current_app
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import NullPool
+from .database import db
+from .search_service import SearchService
+
+
+class IndexService:
+    """数据库索引维护与查询计划检查"""
+
+    # 数据量很小、允许全表扫描的表
+    SMALL_TABLES = {"categories", "comparison_groups"}
+
+    # 检查查询计划时，PLAN_CHECK_TABLE_ROWS 中的表行数少于此值（新建或测试用的
+    # 数据库）时不使用 ANALYZE 的统计信息，而是按假定的数据量为所有表载入固定的
+    # 统计信息，使结果不依赖当前数据量
+    PLAN_CHECK_MIN_ROWS = 1000
+    PLAN_CHECK_TABLE_ROWS = {"receipts": 100000, "items": 1000000}
+    PLAN_CHECK_DEFAULT_ROWS = 10000
+    # 检查查询计划时 ANALYZE 每个索引最多扫描的行数（近似统计，避免大库上耗时过长）
+    PLAN_CHECK_ANALYSIS_LIMIT = 1000
+
+    # 检查搜索查询使用的中日韩搜索词（走 n-gram 索引）
+    CJK_SEARCH_TERM = "牛乳"
+
+    @staticmethod
+    def create_missing_indexes():
+        """为已有数据库补建模型中声明的索引
+
+        Returns:
+            list: 新创建的索引名称列表
+        """
+        inspector = inspect(db.engine)
+        created = []
+
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                missing = [c.name for c in index.columns if c.name not in columns]
+                if missing:
+                    # 列尚未迁移（见 scripts/ 下的迁移脚本），跳过该索引
+                    current_app.logger.warning(
+                        f"跳过索引 {index.name}，缺少列: {', '.join(missing)}"
+                    )
+                    continue
+                index.create(bind=db.engine)
+                created.append(index.name)
+
+        # 更新统计信息，便于查询规划器选择索引
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+        return created
+
+    @staticmethod
+    def _representative_queries():
+        """各服务热点查询的代表性调用"""
+        from .services import (
+            ReceiptService,
+            ItemService,
+            ExportService,
+            AnalyticsService,
+            DataMiningService,
+        )
+
+        date_args = {"start_date": "2024-01-01", "end_date": "2024-01-31"}
+        cjk = IndexService.CJK_SEARCH_TERM
+        queries = [
+            ("receipts.list", lambda: ReceiptService.get_all_receipts({})),
+            (
+                "receipts.list_by_updated_at",
+                lambda: ReceiptService.get_all_receipts({"sort_by": "updated_at"}),
+            ),
+            (
+                "receipts.list_by_total",
+                lambda: ReceiptService.get_all_receipts({"sort_by": "total_jpy"}),
+            ),
+            ("items.list", lambda: ItemService.get_all_items({})),
+            (
+                "items.cursor_by_transaction_time",
+                lambda: ItemService.get_all_items(
+                    {"cursor": "", "sort_by": "transaction_time"}
+                ),
+            ),
+            (
+                "items.cursor_by_price",
+                lambda: ItemService.get_all_items({"cursor": "", "sort_by": "price_jpy"}),
+            ),
+            (
+                "export.cursor",
+                lambda: ExportService.get_export_records({"cursor": ""}),
+            ),
+            ("export.date_range", lambda: ExportService.get_export_records(date_args)),
+            (
+                "export.delta",
+                lambda: list(ExportService.iter_export_rows({}, changed_since=0)),
+            ),
+            (
+                "analytics.dashboard",
+                lambda: AnalyticsService.get_dashboard_overview(date_args),
+            ),
+            ("analytics.trend", lambda: AnalyticsService.get_spending_trend(date_args)),
+            (
+                "analytics.daily_items",
+                lambda: AnalyticsService.get_daily_items(
+                    "2024-01-15", {"durable_amortization": "true"}
+                ),
+            ),
+            (
+                "analytics.category",
+                lambda: AnalyticsService.get_category_analysis(date_args),
+            ),
+            (
+                "data_mining.category_tree",
+                lambda: DataMiningService.get_category_tree(date_args),
+            ),
+            ("receipts.search_cjk", lambda: ReceiptService.get_all_receipts({"q": cjk})),
+            (
+                "receipts.search_cjk_by_total",
+                lambda: ReceiptService.get_all_receipts(
+                    {"q": cjk, "sort_by": "total_jpy"}
+                ),
+            ),
+            ("items.search_cjk", lambda: ItemService.get_all_items({"search": cjk})),
+            (
+                "items.search_cjk_by_price",
+                lambda: ItemService.get_all_items({"search": cjk, "sort_by": "price_jpy"}),
+            ),
+            (
+                "export.search_cjk",
+                lambda: ExportService.get_export_records({"search": cjk}),
+            ),
+        ]
+
+        # 按词前缀匹配的搜索只有词表中有足够长的词时才使用全文索引（否则回退到
+        # ilike 子串匹配，必然全表扫描），因此从词表中取一个词检查
+        receipt_term = IndexService._sample_search_term("receipts_fts")
+        if receipt_term:
+            queries += [
+                (
+                    "receipts.search_prefix",
+                    lambda: ReceiptService.get_all_receipts({"q": receipt_term}),
+                ),
+                (
+                    "export.search_prefix",
+                    lambda: ExportService.get_export_records({"search": receipt_term}),
+                ),
+            ]
+        item_term = IndexService._sample_search_term("items_fts")
+        if item_term:
+            queries.append(
+                (
+                    "items.search_prefix",
+                    lambda: ItemService.get_all_items({"search": item_term}),
+                )
+            )
+        return queries
+
+    @staticmethod
+    def _sample_search_term(index_name):
+        """从 unicode61 索引的词表中取一个可按词前缀匹配的词，没有时返回None"""
+        vocab = SearchService.VOCAB_INDEXES[index_name]
+        if not SearchService._table_exists(db.session, vocab):
+            return None
+        min_length = current_app.config.get("SEARCH_FTS_MIN_PREFIX_LENGTH", 3)
+        return db.session.execute(
+            text(
+                f"SELECT term FROM {vocab} WHERE length(term) >= :min_length "
+                "ORDER BY doc DESC LIMIT 1"
+            ),
+            {"min_length": min_length},
+        ).scalar()
+
+    @staticmethod
+    def _fixed_statistics(table, existing_indexes):
+        """按假定的数据量生成表的 sqlite_stat1 记录（非唯一索引每个键约10行）"""
+        rows = IndexService.PLAN_CHECK_TABLE_ROWS.get(
+            table.name, IndexService.PLAN_CHECK_DEFAULT_ROWS
+        )
+        stats = [(table.name, None, str(rows))]
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                continue
+            per_key = "1" if index.unique else "10"
+            stats.append(
+                (table.name, index.name, " ".join([str(rows)] + [per_key] * len(index.columns)))
+            )
+        return stats
+
+    @staticmethod
+    def _prepare_statistics(conn):
+        """
+        在 EXPLAIN 连接的事务中准备统计信息
+
+        先 ANALYZE（近似统计），数据量过少的数据库（如新建或测试用的数据库）改为
+        载入按假定数据量生成的固定统计信息：统计信息缺失、过期或来自小样本库时，
+        同一查询在不同环境中可能得到不同的计划。调用方在检查结束后回滚，不修改
+        数据库中的统计信息。
+        """
+        conn.exec_driver_sql(
+            f"PRAGMA analysis_limit={IndexService.PLAN_CHECK_ANALYSIS_LIMIT}"
+        )
+        conn.exec_driver_sql("ANALYZE")
+        row_counts = dict(
+            conn.exec_driver_sql(
+                "SELECT tbl, max(CAST(stat AS INTEGER)) FROM sqlite_stat1 GROUP BY tbl"
+            ).fetchall()
+        )
+        schema = conn.exec_driver_sql("SELECT type, name FROM sqlite_schema").fetchall()
+        existing_tables = {name for kind, name in schema if kind == "table"}
+        existing_indexes = {name for kind, name in schema if kind == "index"}
+
+        if all(
+            row_counts.get(name, 0) >= IndexService.PLAN_CHECK_MIN_ROWS
+            for name in IndexService.PLAN_CHECK_TABLE_ROWS
+        ):
+            return
+
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            conn.exec_driver_sql("DELETE FROM sqlite_stat1 WHERE tbl = ?", (table.name,))
+            for stat in IndexService._fixed_statistics(table, existing_indexes):
+                conn.exec_driver_sql("INSERT INTO sqlite_stat1 VALUES (?, ?, ?)", stat)
+        # 重新加载修改后的统计信息
+        conn.exec_driver_sql("ANALYZE sqlite_schema")
+
+    @staticmethod
+    def _find_full_scans(conn, statement, parameters):
+        """对单条语句执行 EXPLAIN QUERY PLAN，返回全表扫描的计划行"""
+        plan = conn.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).fetchall()
+
+        full_scans = []
+        for row in plan:
+            detail = row[-1]
+            if not detail.startswith("SCAN "):
+                continue
+            table = detail.split()[1]
+            # anon_* 为子查询结果（如分页计数），其内部计划单独列出；
+            # sqlite_* 为系统表（如检查全文检索索引是否存在）
+            if (
+                table.startswith(("anon_", "sqlite_"))
+                or table in IndexService.SMALL_TABLES
+            ):
+                continue
+            if "INDEX" in detail:
+                continue
+            full_scans.append(detail)
+        return full_scans
+
+    @staticmethod
+    def check_query_plans():
+        """检查各服务查询的执行计划，找出大表上的全表扫描
+
+        Returns:
+            list: 每项为 {"name", "statement", "full_scans"}，只包含有问题的查询
+        """
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                captured.append((statement, parameters))
+
+        # 检查期间绕过分析缓存，确保真正执行查询
+        cache_enabled = current_app.config.get("ANALYTICS_CACHE_ENABLED", True)
+        current_app.config["ANALYTICS_CACHE_ENABLED"] = False
+
+        # 使用独立连接执行 EXPLAIN：连接池中的连接会缓存已编译语句，
+        # 而 EXPLAIN 不会校验schema版本，可能得到索引变更前的旧计划。
+        # 自动提交模式下手动开启事务，ANALYZE 对统计信息的修改随后回滚
+        explain_engine = create_engine(
+            db.engine.url, poolclass=NullPool, isolation_level="AUTOCOMMIT"
+        )
+
+        problems = []
+        try:
+            statements = []
+            for name, run in IndexService._representative_queries():
+                captured.clear()
+                event.listen(db.engine, "before_cursor_execute", capture)
+                try:
+                    run()
+                finally:
+                    event.remove(db.engine, "before_cursor_execute", capture)
+                statements += [(name, *item) for item in captured]
+            db.session.rollback()
+
+            with explain_engine.connect() as conn:
+                conn.exec_driver_sql("BEGIN")
+                try:
+                    IndexService._prepare_statistics(conn)
+                    for name, statement, parameters in statements:
+                        full_scans = IndexService._find_full_scans(
+                            conn, statement, parameters
+                        )
+                        if full_scans:
+                            problems.append(
+                                {
+                                    "name": name,
+                                    "statement": statement,
+                                    "full_scans": full_scans,
+                                }
+                            )
+                finally:
+                    conn.exec_driver_sql("ROLLBACK")
+        finally:
+            current_app.config["ANALYTICS_CACHE_ENABLED"] = cache_enabled
+            explain_engine.dispose()
+            db.session.rollback()
+
+        return problems
@@ -2,7 +2,7 @@
 import enum
 from datetime import datetime, timezone, date
 from typing import List, Optional
-from sqlalchemy.orm import relationship, mapped_column, Mapped
+from sqlalchemy.orm import relationship, mapped_column, Mapped, validates
 from sqlalchemy import Integer, String, Float, DateTime, Boolean, Date, Enum, ForeignKey
 from .database import db
 from .category_models import Category
@@ -37,19 +37,61 @@ class Receipt(db.Model):
     transaction_time: Mapped[Optional[datetime]] = mapped_column(
         DateTime, nullable=True
     )
+    # 用户时区下的交易日期和小时，随交易时间写入自动维护
+    transaction_local_date: Mapped[Optional[date]] = mapped_column(
+        Date, nullable=True
+    )
+    transaction_local_hour: Mapped[Optional[int]] = mapped_column(
+        Integer, nullable=True
+    )
     updated_at: Mapped[datetime] = mapped_column(
         DateTime,
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
     )
+    # 最后一次修改所在事务的数据版本号（与提交顺序一致），增量导出的水位线
+    change_version: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     status: Mapped[RecognitionStatus] = mapped_column(
         Enum(RecognitionStatus), default=RecognitionStatus.PENDING, nullable=False
     )
+    # 商品数量和合计金额，商品变更时由 ReceiptService.refresh_totals 维护
+    item_count: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    total_jpy: Mapped[float] = mapped_column(
+        Float, default=0, server_default="0", nullable=False
+    )
+    total_cny: Mapped[float] = mapped_column(
+        Float, default=0, server_default="0", nullable=False
+    )
+
+    # 小票文字区域的感知哈希（64位十六进制，256位pHash）和与之相近的更早的小票，
+    # 由 DuplicateService 在上传时维护
+    image_phash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    duplicate_of_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("receipts.id", ondelete="SET NULL"), nullable=True
+    )
 
     items: Mapped[List["Item"]] = relationship(
         "Item", back_populates="receipt", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        db.Index("idx_receipt_status_local_date", "status", "transaction_local_date"),
+        db.Index("idx_receipt_status_time", "status", "transaction_time"),
+        db.Index("idx_receipt_local_date", "transaction_local_date"),
+        db.Index("idx_receipt_created_at", "created_at"),
+        db.Index("idx_receipt_updated_at", "updated_at"),
+        db.Index("idx_receipt_change_version", "change_version"),
+        # 游标分页按交易时间/价格排序时直接按索引顺序读取
+        db.Index("idx_receipt_transaction_time", "transaction_time"),
+        db.Index("idx_receipt_total_jpy", "total_jpy"),
+        # 按图片文件查找小票（重复上传检测）
+        db.Index("idx_receipt_image_filename", "image_filename"),
+        # 重复小票报告
+        db.Index("idx_receipt_duplicate_of_id", "duplicate_of_id"),
+    )
+
     def __init__(
         self,
         name="未命名小票",
@@ -68,6 +110,20 @@ class Receipt(db.Model):
         self.store_name = store_name
         self.store_category = store_category
 
+    @validates("transaction_time")
+    def _sync_local_time(self, key, value):
+        """交易时间变更时同步本地日期和小时"""
+        self.set_local_time(value)
+        return value
+
+    def set_local_time(self, transaction_time, user_timezone=None):
+        """根据UTC交易时间计算用户时区下的日期和小时"""
+        from .services import convert_utc_to_local
+
+        local_time = convert_utc_to_local(transaction_time, user_timezone)
+        self.transaction_local_date = local_time.date() if local_time else None
+        self.transaction_local_hour = local_time.hour if local_time else None
+
 
 class Item(db.Model):
     __tablename__ = "items"
@@ -89,6 +145,16 @@ class Item(db.Model):
         Integer, ForeignKey("categories.id"), nullable=True
     )  # 商品分类外键（指向最后一级分类）
     notes: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+    # 最后一次修改所在事务的数据版本号（与提交顺序一致），增量导出的水位线
+    change_version: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     receipt: Mapped["Receipt"] = relationship("Receipt", back_populates="items")
     category: Mapped[Optional["Category"]] = relationship("Category")
@@ -99,6 +165,14 @@ class Item(db.Model):
         cascade="all, delete-orphan",
     )
 
+    __table_args__ = (
+        db.Index("idx_item_receipt", "receipt_id"),
+        db.Index("idx_item_category", "category_id"),
+        db.Index("idx_item_updated_at", "updated_at"),
+        db.Index("idx_item_change_version", "change_version"),
+        db.Index("idx_item_price_jpy", "price_jpy"),
+    )
+
 
 class DurableGood(db.Model):
     __tablename__ = "durable_goods"
@@ -110,6 +184,72 @@ class DurableGood(db.Model):
     end_date: Mapped[Optional[date]] = mapped_column(Date)
     item: Mapped["Item"] = relationship("Item", back_populates="durable_info")
 
+    __table_args__ = (db.Index("idx_durable_dates", "start_date", "end_date"),)
+
+
+class DeletedRecord(db.Model):
+    """删除记录（墓碑），供增量导出同步下游的删除"""
+
+    __tablename__ = "deleted_records"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    table_name: Mapped[str] = mapped_column(String(50), nullable=False)
+    record_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    receipt_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    deleted_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+    # 删除所在事务的数据版本号
+    change_version: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+    __table_args__ = (
+        db.Index("idx_deleted_records_deleted_at", "deleted_at"),
+        db.Index("idx_deleted_records_change_version", "change_version"),
+    )
+
+
+class DeletedRecordPruning(db.Model):
+    """已清理的删除记录的范围（单行记录），水位线早于该范围的客户端需要全量同步"""
+
+    __tablename__ = "deleted_record_pruning"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # 已清理的删除记录中最大的数据版本号和最晚的删除时间
+    pruned_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    pruned_before: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+class ImageUpload(db.Model):
+    """上传图片原始内容的MD5与保存的文件名，重复上传时跳过压缩和写入"""
+
+    __tablename__ = "image_uploads"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    raw_hash: Mapped[str] = mapped_column(String(32), unique=True, nullable=False)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+
+    __table_args__ = (db.Index("idx_image_uploads_filename", "filename"),)
+
+
+class StorageUsage(db.Model):
+    """图片存储用量台账（单行），由 StorageService 在写入和删除图片时更新"""
+
+    __tablename__ = "storage_usage"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    file_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    total_bytes: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+
+
+class DataVersionCounter(db.Model):
+    """数据版本号（单行记录），由 DataVersion 在写入小票、商品、耐用品、分类的事务中加一"""
+
+    __tablename__ = "data_version"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
 
 class ComparisonGroup(db.Model):
     __tablename__ = "comparison_groups"
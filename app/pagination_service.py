@@ -0,0 +1,237 @@
+# app/pagination_service.py
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import and_, or_
+from .cache_service import analytics_cache
+
+# 不影响筛选结果的分页和字段参数，不参与总数缓存键
+PAGING_ARGS = {"cursor", "page", "per_page", "include_total", "fields", "include"}
+
+
+class CursorPage:
+    """游标分页的结果"""
+
+    def __init__(self, items, per_page, next_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.has_more = next_cursor is not None
+        self.total = total
+
+    def to_dict(self):
+        info = {
+            "mode": "cursor",
+            "per_page": self.per_page,
+            "next_cursor": self.next_cursor,
+            "has_more": self.has_more,
+        }
+        if self.total is not None:
+            info["total_items"] = self.total
+        return info
+
+
+class CursorPagination:
+    """
+    键集（游标）分页
+
+    按 (排序字段, ..., 主键) 定位下一页的起点，不使用 OFFSET，
+    翻到任意深度每页的代价都相同。游标对客户端是不透明的字符串。
+    """
+
+    @staticmethod
+    def is_requested(args):
+        """请求中带有 cursor 参数（首页传空值）时使用游标分页"""
+        return "cursor" in args
+
+    @staticmethod
+    def _signature(sort_keys):
+        """排序方式的标识，用于拒绝其他排序方式下生成的游标"""
+        parts = []
+        for column, descending in sort_keys:
+            name = getattr(column, "key", None) or getattr(column, "name", "")
+            parts.append(f"{name}:{'desc' if descending else 'asc'}")
+        return ",".join(parts)
+
+    @staticmethod
+    def _encode_value(value):
+        """JSON 不能直接表示的排序值编码为带类型标记的对象"""
+        if isinstance(value, datetime):
+            return {"dt": value.isoformat()}
+        if isinstance(value, date):
+            return {"d": value.isoformat()}
+        if isinstance(value, Decimal):
+            return {"dec": str(value)}
+        return value
+
+    @staticmethod
+    def _decode_value(value):
+        if not isinstance(value, dict):
+            return value
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+        raise KeyError("未知的游标值类型")
+
+    @staticmethod
+    def encode_cursor(values, signature):
+        payload = {
+            "s": signature,
+            "k": [CursorPagination._encode_value(value) for value in values],
+        }
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor, signature):
+        """
+        解析游标
+
+        Raises:
+            ValueError: 游标无效或与当前排序方式不匹配
+        """
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            if payload["s"] != signature:
+                raise ValueError("游标与当前排序方式不匹配")
+            return [CursorPagination._decode_value(value) for value in payload["k"]]
+        except (
+            binascii.Error,
+            UnicodeError,
+            KeyError,
+            TypeError,
+            ArithmeticError,
+            json.JSONDecodeError,
+        ):
+            raise ValueError("无效的分页游标")
+
+    @staticmethod
+    def _is_nullable(column):
+        expression = getattr(column, "expression", column)
+        return bool(getattr(expression, "nullable", False))
+
+    @staticmethod
+    def _equal(column, value):
+        return column.is_(None) if value is None else column == value
+
+    @staticmethod
+    def _after(column, value, descending):
+        """
+        排在 value 之后的条件
+
+        SQLite 中 NULL 视为最小值：升序时排在最前，降序时排在最后。
+        """
+        nullable = CursorPagination._is_nullable(column)
+        if value is None:
+            # 升序时非空值都在 NULL 之后，降序时 NULL 之后没有其他值
+            return column.isnot(None) if not descending else None
+        condition = column < value if descending else column > value
+        if descending and nullable:
+            condition = or_(condition, column.is_(None))
+        return condition
+
+    @staticmethod
+    def _build_seek_condition(sort_keys, values):
+        """
+        构建 (k1, k2, ...) 排在游标之后的条件：
+        k1 在 v1 之后，或 k1 = v1 且 k2 在 v2 之后，依此类推
+        """
+        branches = []
+        for i, (column, descending) in enumerate(sort_keys):
+            after = CursorPagination._after(column, values[i], descending)
+            if after is not None:
+                equals = [
+                    CursorPagination._equal(prev_column, prev_value)
+                    for (prev_column, _), prev_value in zip(sort_keys[:i], values[:i])
+                ]
+                branches.append(and_(*equals, after))
+        condition = or_(*branches)
+
+        # 首个排序字段的范围条件，便于使用索引
+        column, descending = sort_keys[0]
+        value = values[0]
+        if value is not None and not (
+            descending and CursorPagination._is_nullable(column)
+        ):
+            bound = column <= value if descending else column >= value
+            condition = and_(bound, condition)
+        return condition
+
+    @staticmethod
+    def cached_count(name, query, args):
+        """
+        统计总数，结果按筛选参数缓存，数据变化后随数据版本号失效
+        （ANALYTICS_CACHE_ENABLED 关闭时每次重新统计）
+        """
+        if not analytics_cache.is_enabled():
+            return query.order_by(None).count()
+        filters = {k: v for k, v in args.items() if k not in PAGING_ARGS}
+        key = analytics_cache.make_key(f"count:{name}", (filters,), {})
+        total = analytics_cache.get(key)
+        if total is None:
+            total = query.order_by(None).count()
+            analytics_cache.set(key, total)
+        return total
+
+    @staticmethod
+    def paginate(query, sort_keys, args, per_page, count_name):
+        """
+        对查询执行游标分页
+
+        Args:
+            query: 未排序的 Query
+            sort_keys: [(排序列, 是否降序), ...]，最后一项必须是唯一的主键
+            args: 请求参数，cursor 为上一页返回的 next_cursor（首页为空），
+                include_total=true 时返回（缓存的）总数
+            per_page: 每页记录数
+            count_name: 总数缓存的名称
+
+        Returns:
+            CursorPage: items 为查询结果（与原查询的结果行相同）
+
+        Raises:
+            ValueError: 游标无效
+        """
+        signature = CursorPagination._signature(sort_keys)
+        total = None
+        if str(args.get("include_total", "")).lower() == "true":
+            total = CursorPagination.cached_count(count_name, query, args)
+
+        if cursor := args.get("cursor"):
+            values = CursorPagination.decode_cursor(cursor, signature)
+            if len(values) != len(sort_keys):
+                raise ValueError("无效的分页游标")
+            query = query.filter(
+                CursorPagination._build_seek_condition(sort_keys, values)
+            )
+
+        # 与 query.all() 一致：只查询单个实体时返回实体，否则返回元组
+        descriptions = query.column_descriptions
+        single_entity = len(descriptions) == 1 and isinstance(
+            descriptions[0]["expr"], type
+        )
+
+        columns = [column for column, _ in sort_keys]
+        query = query.order_by(
+            *[column.desc() if descending else column.asc() for column, descending in sort_keys]
+        ).add_columns(*columns)
+
+        # 多取一条判断是否还有下一页
+        rows = query.limit(per_page + 1).all()
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = CursorPagination.encode_cursor(
+                rows[-1][-len(columns) :], signature
+            )
+
+        items = [
+            row[0] if single_entity else tuple(row[: -len(columns)]) for row in rows
+        ]
+        return CursorPage(items, per_page, next_cursor, total)
@@ -1,6 +1,16 @@
 # app/resources.py
+import csv
+import io
+import json
 from datetime import datetime, timezone
-from flask import request, jsonify, current_app
+from flask import (
+    request,
+    jsonify,
+    current_app,
+    Response,
+    stream_with_context,
+    send_file,
+)
 from flask_restful import Resource, reqparse
 from .models import db, Receipt, Item
 from .services import convert_local_to_utc
@@ -11,6 +21,14 @@ from .schemas import (
     items_schema,
     export_records_schema,
 )
+from .cache_service import analytics_cache
+from .export_job_service import ExportJobService
+from .columnar_export_service import ColumnarExportService
+from .delta_export_service import DeltaExportService, WatermarkExpiredError
+from .pagination_service import CursorPage
+from .file_service import FileService
+from .duplicate_service import DuplicateService
+from .serializers import dump, parse_fieldset
 from .services import (
     ReceiptService,
     ItemService,
@@ -19,6 +37,21 @@ from .services import (
     DataMiningService,
 )
 
+# 商品接口中需要额外查询的关联字段
+ITEM_RELATIONS = ("category", "category_path", "durable_info")
+
+
+def pagination_info(pagination):
+    """分页信息，游标分页时返回 next_cursor 和（按需）总数"""
+    if isinstance(pagination, CursorPage):
+        return pagination.to_dict()
+    return {
+        "page": pagination.page,
+        "per_page": pagination.per_page,
+        "total_pages": pagination.pages,
+        "total_items": pagination.total,
+    }
+
 
 class ReceiptBatchUploadResource(Resource):
     """批量上传小票图片并创建识别任务"""
@@ -30,30 +63,40 @@ class ReceiptBatchUploadResource(Resource):
         表单参数:
         - images: 多个图片文件
         - task_name: 可选的任务名称
+        - on_duplicate: 为 link 时已上传过的图片返回已有小票，不创建新小票
         """
         # 获取多文件
         image_files = request.files.getlist("images")
         task_name = request.form.get("task_name", "")
+        link_duplicates = request.form.get("on_duplicate") == "link"
 
         if not image_files or len(image_files) == 0:
             return {"message": "请上传至少一张小票图片"}, 400
 
         # 调用服务层批量创建小票并触发识别
-        result = ReceiptService.batch_create_and_recognize(image_files, task_name)
+        result = ReceiptService.batch_create_and_recognize(
+            image_files, task_name, link_duplicates
+        )
         return result
 
 
 class ReceiptListResource(Resource):
     def get(self):
-        receipts, pagination = ReceiptService.get_all_receipts(request.args)
+        """
+        查询参数 cursor 存在时使用游标分页（首页传空值），
+        之后传入上一页返回的 next_cursor；include_total=true 时返回总数。
+        fields=a,b 时只查询和返回列出的字段
+        """
+        try:
+            fields = parse_fieldset(request.args, receipts_schema)
+            receipts, pagination = ReceiptService.get_all_receipts(
+                request.args, fields
+            )
+        except ValueError as e:
+            return {"message": str(e)}, 400
         response = {
-            "data": receipts_schema.dump(receipts),
-            "pagination": {
-                "page": pagination.page,
-                "per_page": pagination.per_page,
-                "total_pages": pagination.pages,
-                "total_items": pagination.total,
-            },
+            "data": dump(receipts_schema, receipts, only=fields),
+            "pagination": pagination_info(pagination),
         }
         return response
 
@@ -66,14 +109,31 @@ class ReceiptListResource(Resource):
         if not image_file and not data.get("text_description"):
             return {"message": "创建小票需要提供图片或文字描述"}, 400
 
-        new_receipt = ReceiptService.create_receipt(data, image_file)
+        raw_hash = None
+        if image_file:
+            raw_hash = FileService.hash_upload(image_file)
+            # on_duplicate=link：图片已上传过时返回已有的小票
+            if data.get("on_duplicate") == "link":
+                existing = ReceiptService.find_duplicate_receipt(raw_hash)
+                if existing:
+                    return receipt_schema.dump(existing), 200
+
+        new_receipt = ReceiptService.create_receipt(data, image_file, raw_hash)
         return receipt_schema.dump(new_receipt), 201
 
 
 class ReceiptResource(Resource):
     def get(self, receipt_id):
-        receipt = Receipt.query.get_or_404(receipt_id)
-        return receipt_schema.dump(receipt)
+        """
+        查询参数 fields=a,b 时只查询和返回列出的字段，
+        include=items 时附带商品（未指定 fields 和 include 时默认附带）
+        """
+        try:
+            fields = parse_fieldset(request.args, receipt_schema, ("items",))
+        except ValueError as e:
+            return {"message": str(e)}, 400
+        receipt = ReceiptService.get_receipt_detail(receipt_id, fields)
+        return dump(receipt_schema, receipt, only=fields)
 
     def put(self, receipt_id):
         receipt = Receipt.query.get_or_404(receipt_id)
@@ -87,6 +147,18 @@ class ReceiptResource(Resource):
         receipt.store_name = data.get("store_name", receipt.store_name)
         receipt.store_category = data.get("store_category", receipt.store_category)
 
+        # 标记/取消标记重复小票；取消标记时补做因重复而跳过的识别
+        recognize = False
+        if "duplicate_of_id" in data:
+            duplicate_of_id = data["duplicate_of_id"]
+            if duplicate_of_id is not None and (
+                duplicate_of_id == receipt.id
+                or db.session.get(Receipt, duplicate_of_id) is None
+            ):
+                return {"message": "duplicate_of_id 无效"}, 400
+            recognize = receipt.duplicate_of_id is not None and duplicate_of_id is None
+            receipt.duplicate_of_id = duplicate_of_id
+
         # 处理交易时间
         if transaction_time_str := data.get("transaction_time"):
             try:
@@ -100,10 +172,16 @@ class ReceiptResource(Resource):
                 pass
 
         db.session.commit()
+        if recognize and DuplicateService.should_recognize(receipt):
+            ReceiptService.trigger_recognition(receipt.id)
         return receipt_schema.dump(receipt)
 
     def delete(self, receipt_id):
         receipt = Receipt.query.get_or_404(receipt_id)
+        # 被删除的小票不再作为其他小票的重复来源
+        Receipt.query.filter_by(duplicate_of_id=receipt.id).update(
+            {"duplicate_of_id": None}, synchronize_session=False
+        )
         db.session.delete(receipt)
         db.session.commit()
         return "", 204
@@ -120,6 +198,81 @@ class ReceiptRecognizeResource(Resource):
         return {"message": "已加入重新识别队列"}, 202
 
 
+class ReceiptDuplicateReportResource(Resource):
+    """重复小票报告"""
+
+    # 组内每张小票返回的字段
+    RECEIPT_FIELDS = {
+        "id",
+        "name",
+        "store_name",
+        "transaction_time",
+        "created_at",
+        "status",
+        "total_jpy",
+        "image_urls",
+        "duplicate_of_id",
+    }
+
+    def get(self):
+        """
+        按图片哈希相近程度分组列出可能重复的小票，最新的组在前
+
+        查询参数:
+        - threshold: 最大海明距离（0 到哈希位数 DuplicateService.HASH_BITS），
+          默认为 DUPLICATE_PHASH_THRESHOLD
+        - page, per_page: 分组的分页（per_page 最大100）
+        """
+        threshold = request.args.get("threshold", type=int)
+        if threshold is not None and not 0 <= threshold <= DuplicateService.HASH_BITS:
+            return {
+                "message": f"threshold 必须在 0-{DuplicateService.HASH_BITS} 之间"
+            }, 400
+        page = max(1, request.args.get("page", 1, type=int))
+        per_page = min(100, max(1, request.args.get("per_page", 20, type=int)))
+
+        report = DuplicateService.duplicate_report(threshold)
+        groups = report["groups"][(page - 1) * per_page : page * per_page]
+        receipt_ids = [
+            receipt_id for group in groups for receipt_id in group["receipt_ids"]
+        ]
+        receipts = {
+            receipt.id: receipt
+            for receipt in Receipt.query.filter(Receipt.id.in_(receipt_ids))
+        }
+        data = []
+        for group in groups:
+            members = [
+                receipts[receipt_id]
+                for receipt_id in group["receipt_ids"]
+                if receipt_id in receipts
+            ]
+            if len(members) < 2:
+                continue
+            data.append(
+                {
+                    "max_distance": group["max_distance"],
+                    "receipts": dump(
+                        receipts_schema, members, only=self.RECEIPT_FIELDS
+                    ),
+                }
+            )
+
+        total = report["group_count"]
+        return {
+            "threshold": report["threshold"],
+            "hashed_count": report["hashed_count"],
+            "duplicate_count": report["duplicate_count"],
+            "data": data,
+            "pagination": {
+                "page": page,
+                "per_page": per_page,
+                "total_pages": (total + per_page - 1) // per_page,
+                "total_items": total,
+            },
+        }
+
+
 class ReceiptItemListResource(Resource):
     def post(self, receipt_id):
         Receipt.query.get_or_404(receipt_id)
@@ -132,15 +285,20 @@ class ReceiptItemListResource(Resource):
 
 class ItemListResource(Resource):
     def get(self):
-        items, pagination = ItemService.get_all_items(request.args)
+        """
+        查询参数 cursor 存在时使用游标分页（首页传空值），
+        之后传入上一页返回的 next_cursor；include_total=true 时返回总数。
+        fields=a,b 时只查询和返回列出的字段，include=category,category_path,durable_info
+        指定附带的关联字段（未指定 fields 和 include 时全部附带）
+        """
+        try:
+            fields = parse_fieldset(request.args, items_schema, ITEM_RELATIONS)
+            items, pagination = ItemService.get_all_items(request.args, fields)
+        except ValueError as e:
+            return {"message": str(e)}, 400
         response = {
-            "data": items_schema.dump(items),
-            "pagination": {
-                "page": pagination.page,
-                "per_page": pagination.per_page,
-                "total_pages": pagination.pages,
-                "total_items": pagination.total,
-            },
+            "data": dump(items_schema, items, only=fields),
+            "pagination": pagination_info(pagination),
         }
         return response
 
@@ -162,14 +320,7 @@ class ItemResource(Resource):
         return item_schema.dump(updated_item)
 
     def delete(self, item_id):
-        item = Item.query.get_or_404(item_id)
-
-        # 更新对应小票的最后修改时间
-        if item.receipt:
-            item.receipt.updated_at = datetime.now(timezone.utc)
-
-        db.session.delete(item)
-        db.session.commit()
+        ItemService.delete_item(item_id)
         return "", 204
 
 
@@ -193,6 +344,10 @@ class ExportResource(Resource):
         - search: 搜索关键词
         - sort_by: 排序字段 (transaction_time/created_at/receipt_name/store_name/price_jpy)
         - order: 排序方向 (asc/desc)
+        - cursor: 使用游标分页（首页传空值，之后传入上一页的 next_cursor），
+          每页记录数默认1000
+        - include_total: 游标分页时是否返回总数 (true/false)
+        - fields: 只查询和返回列出的字段，逗号分隔
         """
 
         # 参数验证
@@ -204,29 +359,243 @@ class ExportResource(Resource):
             per_page = 999999  # 设置一个很大的数值表示无限制
 
         try:
-            export_records, pagination = ExportService.get_export_records(request.args)
+            fields = parse_fieldset(request.args, export_records_schema)
+            export_records, pagination = ExportService.get_export_records(
+                request.args, fields
+            )
+
+            if isinstance(pagination, CursorPage):
+                has_more = pagination.has_more
+            else:
+                has_more = pagination.page < pagination.pages
 
             response = {
-                "data": export_records_schema.dump(export_records),
-                "pagination": {
-                    "page": pagination.page,
-                    "per_page": pagination.per_page,
-                    "total_pages": pagination.pages,
-                    "total_items": pagination.total,
-                },
+                "data": dump(export_records_schema, export_records, only=fields),
+                "pagination": pagination_info(pagination),
                 "export_info": {
                     "export_time": datetime.now(timezone.utc).isoformat(),
                     "total_records": len(export_records),
-                    "has_more": pagination.page < pagination.pages,
+                    "has_more": has_more,
                 },
             }
 
             return response
 
+        except ValueError as e:
+            return {"message": str(e)}, 400
         except Exception as e:
             return {"message": f"导出失败: {str(e)}"}, 500
 
 
+class ExportCsvResource(Resource):
+    """流式CSV导出资源，逐批从数据库游标读取并写出，内存占用与数据量无关"""
+
+    def get(self):
+        """
+        以CSV格式流式导出全部匹配记录
+
+        查询参数与 /api/export 相同（不支持分页参数）
+        """
+
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            # 带BOM便于Excel正确识别UTF-8
+            buffer.write("\ufeff")
+            writer.writerow(ExportService.EXPORT_FIELDS)
+            for batch in ExportService.iter_export_rows(request.args):
+                writer.writerows(batch)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+            if buffer.tell():
+                yield buffer.getvalue()
+
+        filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+
+
+class ExportNdjsonResource(Resource):
+    """流式NDJSON导出资源，每行一条JSON记录"""
+
+    def get(self):
+        """
+        以NDJSON格式流式导出全部匹配记录
+
+        查询参数与 /api/export 相同（不支持分页参数）
+        """
+        fields = ExportService.EXPORT_FIELDS
+
+        def generate():
+            for batch in ExportService.iter_export_rows(request.args):
+                yield "".join(
+                    json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n"
+                    for row in batch
+                )
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+
+class ExportColumnarResource(Resource):
+    """列式导出资源，供pandas等分析工具直接加载"""
+
+    def get(self):
+        """
+        以列式格式流式导出全部匹配记录
+
+        查询参数:
+        - format: arrow (Arrow IPC 流) / parquet / csv (类型化CSV + schema.json 的zip包)，
+          安装了 pyarrow 时默认 arrow，否则默认 csv
+        - 其余筛选、排序参数与 /api/export 相同
+        """
+        export_format = request.args.get(
+            "format", ColumnarExportService.default_format()
+        )
+        if export_format not in ColumnarExportService.FORMATS:
+            return {"message": f"不支持的导出格式: {export_format}"}, 400
+        if export_format != "csv" and not ColumnarExportService.is_arrow_available():
+            return {"message": f"{export_format} 格式需要安装 pyarrow"}, 400
+
+        extension, mimetype = ColumnarExportService.FORMATS[export_format]
+        filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        return Response(
+            stream_with_context(
+                ColumnarExportService.iter_export(export_format, request.args)
+            ),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+
+
+class ExportDeltaResource(Resource):
+    """增量导出资源，返回水位线之后新增/修改的记录和删除记录"""
+
+    def get(self):
+        """
+        获取增量导出数据
+
+        查询参数:
+        - since: 上次同步返回的 next_watermark，不指定则导出全部记录
+        - format: json (默认) / ndjson
+        - 其余筛选参数与 /api/export 相同，仅作用于新增/修改的记录
+
+        删除记录保留 DELTA_EXPORT_TOMBSTONE_RETENTION_DAYS 天，水位线之后的删除记录
+        已被清理时返回 410，客户端需要不指定 since 重新全量同步。
+        """
+        try:
+            since = DeltaExportService.parse_watermark(request.args.get("since"))
+        except ValueError:
+            return {"message": "无效的水位线"}, 400
+
+        export_format = request.args.get("format", "json")
+        if export_format not in ("json", "ndjson"):
+            return {"message": f"不支持的导出格式: {export_format}"}, 400
+
+        try:
+            batches, deleted, next_watermark = DeltaExportService.iter_changes(
+                since, request.args
+            )
+        except WatermarkExpiredError:
+            return {"message": "水位线之后的删除记录已被清理，请重新全量同步"}, 410
+        fields = ExportService.EXPORT_FIELDS
+
+        if export_format == "json":
+            return {
+                "upserts": [
+                    dict(zip(fields, row)) for batch in batches for row in batch
+                ],
+                "deletes": deleted,
+                "watermark": request.args.get("since"),
+                "next_watermark": next_watermark,
+            }
+
+        def generate():
+            # 依次输出更新插入、删除记录，最后一行为下一次的水位线
+            for batch in batches:
+                yield "".join(
+                    json.dumps({"op": "upsert", **dict(zip(fields, row))}, ensure_ascii=False)
+                    + "\n"
+                    for row in batch
+                )
+            for record in deleted:
+                yield json.dumps({"op": "delete", **record}) + "\n"
+            yield json.dumps({"op": "watermark", "next_watermark": next_watermark}) + "\n"
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+
+class ExportJobListResource(Resource):
+    """后台导出任务列表资源"""
+
+    def get(self):
+        """获取未过期的导出任务列表"""
+        return {"data": ExportJobService.list_jobs()}
+
+    def post(self):
+        """
+        创建后台导出任务
+
+        JSON参数:
+        - format: 导出格式 (csv/json/xlsx)，默认csv
+        - 其余筛选、排序参数与 /api/export 相同
+        """
+        data = dict(request.get_json(silent=True) or {})
+        export_format = data.pop("format", "csv")
+
+        success, result = ExportJobService.create_job(export_format, data)
+        if not success:
+            return {"message": result}, 400
+        return result, 202
+
+
+class ExportJobResource(Resource):
+    """单个后台导出任务资源"""
+
+    def get(self, job_id):
+        """获取导出任务状态和进度"""
+        job = ExportJobService.get_job(job_id)
+        if not job:
+            return {"message": "导出任务不存在或已过期"}, 404
+        return job
+
+    def delete(self, job_id):
+        """删除导出任务及其文件"""
+        success, message = ExportJobService.delete_job(job_id)
+        if not success:
+            return {"message": message}, 404 if message == "导出任务不存在" else 409
+        return {"message": message}
+
+
+class ExportJobDownloadResource(Resource):
+    """导出文件下载资源，支持 Range 断点续传"""
+
+    def get(self, job_id):
+        """下载已完成的导出文件"""
+        download = ExportJobService.get_download(job_id)
+        if not download:
+            job = ExportJobService.get_job(job_id)
+            if not job:
+                return {"message": "导出任务不存在或已过期"}, 404
+            return {"message": "导出任务尚未完成", "status": job["status"]}, 409
+
+        file_path, download_name, mimetype = download
+        return send_file(
+            file_path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+        )
+
+
 class AnalyticsDashboardResource(Resource):
     """分析仪表盘资源"""
 
@@ -325,6 +694,19 @@ class AnalyticsCategoryItemsResource(Resource):
             return {"message": f"获取分类商品数据失败: {str(e)}"}, 500
 
 
+class AnalyticsCacheResource(Resource):
+    """分析结果缓存资源"""
+
+    def get(self):
+        """获取缓存命中统计"""
+        return analytics_cache.get_stats()
+
+    def delete(self):
+        """清空缓存"""
+        analytics_cache.clear()
+        return {"message": "缓存已清空"}
+
+
 class DataMiningCategoryTreeResource(Resource):
     """数据挖掘分类树资源"""
 
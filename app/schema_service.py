@@ -0,0 +1,155 @@
+# app/schema_service.py
+from flask import current_app
+from sqlalchemy import inspect, text
+from .database import db
+from .index_service import IndexService
+from .search_service import SearchService
+
+
+class SchemaService:
+    """
+    将旧版本的数据库升级到当前模型的结构
+
+    用于恢复旧备份后和 flask upgrade-db：补建缺少的表和列（与 scripts/ 下的迁移
+    脚本效果相同），回填新增的派生列，补建全文检索索引和普通索引。
+    """
+
+    # 新增列后需要回填的派生列 -> 回填方法名
+    BACKFILLS = {
+        ("items", "created_at"): "_backfill_item_timestamps",
+        ("items", "updated_at"): "_backfill_item_timestamps",
+        ("receipts", "transaction_local_date"): "_backfill_local_dates",
+        ("receipts", "transaction_local_hour"): "_backfill_local_dates",
+        ("receipts", "item_count"): "_backfill_totals",
+        ("receipts", "total_jpy"): "_backfill_totals",
+        ("receipts", "total_cny"): "_backfill_totals",
+    }
+
+    @staticmethod
+    def _column_ddl(column):
+        """ALTER TABLE ADD COLUMN 的列定义（SQLite 新增列只能使用常量默认值）"""
+        ddl = f"{column.name} {column.type.compile(dialect=db.engine.dialect)}"
+        default = column.default
+        if default is not None and default.is_scalar and default.arg is not None:
+            default = default.arg
+            if hasattr(default, "name"):
+                # 枚举列保存成员名
+                default = default.name
+            if isinstance(default, bool):
+                default = int(default)
+            literal = f"'{default}'" if isinstance(default, str) else str(default)
+            ddl += f" DEFAULT {literal}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+        return ddl
+
+    @staticmethod
+    def add_missing_columns():
+        """
+        为已有的表补建模型中声明的列
+
+        Returns:
+            list: 新增的 (表名, 列名)
+        """
+        inspector = inspect(db.engine)
+        added = []
+        with db.engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {table.name} "
+                        f"ADD COLUMN {SchemaService._column_ddl(column)}"
+                    )
+                    added.append((table.name, column.name))
+        return added
+
+    @staticmethod
+    def _backfill_item_timestamps():
+        # 按所属小票的时间回填
+        db.session.execute(
+            text(
+                """
+                UPDATE items SET
+                    created_at = COALESCE(created_at,
+                        (SELECT receipts.created_at FROM receipts
+                         WHERE receipts.id = items.receipt_id)),
+                    updated_at = COALESCE(updated_at,
+                        (SELECT receipts.updated_at FROM receipts
+                         WHERE receipts.id = items.receipt_id))
+                WHERE created_at IS NULL OR updated_at IS NULL
+                """
+            )
+        )
+        db.session.commit()
+
+    @staticmethod
+    def _backfill_local_dates():
+        from .services import ReceiptService
+
+        ReceiptService.refresh_local_dates()
+
+    @staticmethod
+    def _backfill_totals():
+        from .services import ReceiptService
+
+        ReceiptService.backfill_totals()
+
+    @staticmethod
+    def _clear_legacy_image_hashes():
+        """清除早期版本的64位图片哈希和据此做的重复标记（见 migrate_receipt_phash.py）"""
+        result = db.session.execute(
+            text(
+                "UPDATE receipts SET image_phash = NULL, duplicate_of_id = NULL "
+                "WHERE length(image_phash) = 16"
+            )
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def _search_indexes_missing():
+        names = [
+            *SearchService.INDEXES,
+            *SearchService.NGRAM_INDEXES.values(),
+            *SearchService.VOCAB_INDEXES.values(),
+        ]
+        return any(not SearchService._table_exists(db.session, name) for name in names)
+
+    @staticmethod
+    def upgrade():
+        """
+        升级数据库结构
+
+        Returns:
+            dict: added_columns 为新增的列（"表名.列名"），created_indexes 为新建的
+                索引，rebuilt_search_index 为是否重建了全文检索索引，
+                cleared_image_hashes 为清除的旧格式图片哈希数
+                （没有图片哈希的小票可运行 flask backfill-image-hashes 计算）
+        """
+        db.session.remove()
+        db.create_all()
+        added = SchemaService.add_missing_columns()
+
+        for backfill in dict.fromkeys(
+            SchemaService.BACKFILLS[key] for key in added if key in SchemaService.BACKFILLS
+        ):
+            current_app.logger.info(f"Schema upgrade: running {backfill}")
+            getattr(SchemaService, backfill)()
+        cleared = SchemaService._clear_legacy_image_hashes()
+
+        rebuilt = False
+        if SchemaService._search_indexes_missing():
+            rebuilt = SearchService.rebuild_indexes()
+        created = IndexService.create_missing_indexes()
+
+        return {
+            "added_columns": [f"{table}.{column}" for table, column in added],
+            "created_indexes": created,
+            "rebuilt_search_index": rebuilt,
+            "cleared_image_hashes": cleared,
+        }
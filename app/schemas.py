@@ -3,7 +3,8 @@ from .database import ma
 from .models import Receipt, Item, DurableGood
 from .category_models import Category
 from marshmallow import fields, Schema
-from .services import convert_utc_to_local
+from .services import convert_utc_to_local, get_category_path_map
+from .file_service import ImageDerivativeService
 
 
 class UserTimezoneDateTime(fields.DateTime):
@@ -50,16 +51,19 @@ class ItemSchema(ma.SQLAlchemyAutoSchema):
         model = Item
         load_instance = True
         include_fk = True
+        # 增量导出的内部版本号不对外输出
+        exclude = ("change_version",)
 
     def get_category_path(self, obj):
-        """获取分类路径"""
-        if obj.category:
-            return " > ".join(obj.category.get_full_path_list())
-        return None
+        """获取分类路径（从预先计算的路径表读取，不逐级查询祖先分类）"""
+        if obj.category_id is None:
+            return None
+        return get_category_path_map().get(obj.category_id)
 
 
 class ReceiptSchema(ma.SQLAlchemyAutoSchema):
     status = fields.Method("get_status_str")
+    image_urls = fields.Method("get_image_urls")
     items = fields.Nested(ItemSchema, many=True)
     transaction_time = UserTimezoneDateTime()
     created_at = UserTimezoneDateTime()
@@ -70,10 +74,21 @@ class ReceiptSchema(ma.SQLAlchemyAutoSchema):
         load_instance = True
         include_fk = True
         include_relationships = True
+        # 内部字段：增量导出版本号、按本地时间筛选用的冗余列、去重用的图片哈希
+        exclude = (
+            "change_version",
+            "transaction_local_date",
+            "transaction_local_hour",
+            "image_phash",
+        )
 
     def get_status_str(self, obj):
         return obj.status.value if obj.status else None
 
+    def get_image_urls(self, obj):
+        """原图和缩略图的访问地址"""
+        return ImageDerivativeService.get_image_urls(obj.image_filename)
+
 
 class ExportRecordSchema(Schema):
     """导出记录的 Schema，包含小票和商品的组合信息"""
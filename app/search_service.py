@@ -0,0 +1,436 @@
+# app/search_service.py
+import re
+import unicodedata
+from flask import current_app
+from sqlalchemy import (
+    DDL,
+    column,
+    delete,
+    event,
+    inspect,
+    insert,
+    literal_column,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.orm import Session
+from .database import db
+from .models import Receipt, Item
+
+
+class SearchService:
+    """基于 SQLite FTS5 的全文检索
+
+    为小票和商品建立外部内容（external content）FTS5 索引，由触发器与原表保持同步。
+    中日韩文字没有空格分词，另建同列的 n-gram 索引：连续的中日韩文字切分为二元组
+    （加上末尾单字），由会话事件维护，包含中日韩文字的搜索词走该索引做子串匹配，
+    其他搜索词走 unicode61 索引做词前缀匹配。
+    FTS5 不可用、索引尚未建立或搜索词无法按词前缀匹配时，调用方回退到 ilike 模糊匹配。
+    """
+
+    # 索引名 -> (原表, 索引列)
+    INDEXES = {
+        "receipts_fts": (
+            Receipt.__table__,
+            ["name", "notes", "text_description", "store_name"],
+        ),
+        "items_fts": (Item.__table__, ["name_ja", "name_zh", "notes"]),
+    }
+
+    # 全文索引 -> 对应的 n-gram 索引
+    NGRAM_INDEXES = {
+        "receipts_fts": "receipts_ngram_fts",
+        "items_fts": "items_ngram_fts",
+    }
+
+    # 全文索引 -> 词表（fts5vocab），用于判断搜索词是否为索引中的词前缀
+    VOCAB_INDEXES = {
+        "receipts_fts": "receipts_fts_vocab",
+        "items_fts": "items_fts_vocab",
+    }
+
+    TOKENIZER = "unicode61 remove_diacritics 2"
+    # unicode61 的词：连续的字母和数字
+    TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+    CJK_CHARS = (
+        "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f\uac00-\ud7af"
+    )
+    CJK_PATTERN = re.compile(f"[{CJK_CHARS}]")
+    # 连续的中日韩文字，或连续的其他非空白字符
+    NGRAM_RUN_PATTERN = re.compile(f"([{CJK_CHARS}]+)|([^\\s{CJK_CHARS}]+)")
+
+    @staticmethod
+    def _ddl_statements(index_name):
+        """生成FTS表及同步触发器的建表语句"""
+        source, columns = SearchService.INDEXES[index_name]
+        table_name = source.name
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{name}" for name in columns)
+        old_values = ", ".join(f"old.{name}" for name in columns)
+
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {index_name} USING fts5("
+            f"{column_list}, content='{table_name}', content_rowid='id', "
+            f"tokenize='{SearchService.TOKENIZER}')",
+            f"CREATE TRIGGER IF NOT EXISTS {index_name}_ai AFTER INSERT ON {table_name} "
+            f"BEGIN INSERT INTO {index_name}(rowid, {column_list}) "
+            f"VALUES (new.id, {new_values}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {index_name}_ad AFTER DELETE ON {table_name} "
+            f"BEGIN INSERT INTO {index_name}({index_name}, rowid, {column_list}) "
+            f"VALUES ('delete', old.id, {old_values}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {index_name}_au "
+            f"AFTER UPDATE OF {column_list} ON {table_name} "
+            f"BEGIN INSERT INTO {index_name}({index_name}, rowid, {column_list}) "
+            f"VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {index_name}(rowid, {column_list}) "
+            f"VALUES (new.id, {new_values}); END",
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS "
+            f"{SearchService.VOCAB_INDEXES[index_name]} "
+            f"USING fts5vocab({index_name}, 'row')",
+        ]
+
+    @staticmethod
+    def _ngram_ddl_statement(index_name):
+        """生成 n-gram 索引的建表语句（普通FTS5表，rowid 与原表主键一致）"""
+        _, columns = SearchService.INDEXES[index_name]
+        return (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS "
+            f"{SearchService.NGRAM_INDEXES[index_name]} USING fts5("
+            f"{', '.join(columns)}, tokenize='{SearchService.TOKENIZER}')"
+        )
+
+    @staticmethod
+    def _fts5_supported(ddl, target, bind, **kw):
+        """检查SQLite是否编译了FTS5"""
+        if bind.dialect.name != "sqlite":
+            return False
+        return (
+            bind.exec_driver_sql(
+                "SELECT 1 FROM pragma_compile_options "
+                "WHERE compile_options = 'ENABLE_FTS5'"
+            ).first()
+            is not None
+        )
+
+    @classmethod
+    def register_ddl_events(cls):
+        """随原表的创建/删除同步创建/删除FTS索引（db.create_all / drop_all）"""
+        if getattr(cls, "_events_registered", False):
+            return
+        cls._events_registered = True
+
+        for index_name, (source, _) in cls.INDEXES.items():
+            statements = cls._ddl_statements(index_name)
+            statements.append(cls._ngram_ddl_statement(index_name))
+            for statement in statements:
+                event.listen(
+                    source,
+                    "after_create",
+                    DDL(statement).execute_if(callable_=cls._fts5_supported),
+                )
+            for name in (
+                cls.VOCAB_INDEXES[index_name],
+                index_name,
+                cls.NGRAM_INDEXES[index_name],
+            ):
+                event.listen(
+                    source,
+                    "before_drop",
+                    DDL(f"DROP TABLE IF EXISTS {name}").execute_if(dialect="sqlite"),
+                )
+
+    @classmethod
+    def register_session_events(cls):
+        """注册SQLAlchemy会话事件，随小票和商品的写入维护 n-gram 索引"""
+        if getattr(cls, "_session_events_registered", False):
+            return
+        cls._session_events_registered = True
+
+        models = {Receipt: "receipts_fts", Item: "items_fts"}
+
+        @event.listens_for(Session, "after_flush")
+        def _sync_ngram_index(session, flush_context):
+            changed = {}
+            for obj in list(session.new) + list(session.dirty):
+                index_name = models.get(type(obj))
+                if index_name is None:
+                    continue
+                _, columns = cls.INDEXES[index_name]
+                state = inspect(obj)
+                if obj in session.new or any(
+                    state.attrs[name].history.has_changes() for name in columns
+                ):
+                    changed.setdefault(index_name, {})[obj.id] = obj
+            deleted = {}
+            for obj in session.deleted:
+                index_name = models.get(type(obj))
+                if index_name is not None:
+                    deleted.setdefault(index_name, set()).add(obj.id)
+
+            for index_name in set(changed) | set(deleted):
+                if not cls._table_exists(session, cls.NGRAM_INDEXES[index_name]):
+                    continue
+                # 直接在连接上执行，不再触发会话事件
+                connection = session.connection()
+                objects = changed.get(index_name, {})
+                ids = set(objects) | deleted.get(index_name, set())
+                ngram = cls._ngram_table(index_name)
+                connection.execute(delete(ngram).where(ngram.c.rowid.in_(list(ids))))
+                if objects:
+                    _, columns = cls.INDEXES[index_name]
+                    connection.execute(
+                        insert(cls._ngram_table(index_name)),
+                        [
+                            cls._ngram_row(
+                                object_id, [getattr(obj, name) for name in columns],
+                                columns,
+                            )
+                            for object_id, obj in objects.items()
+                        ],
+                    )
+
+        @event.listens_for(Session, "do_orm_execute")
+        def _sync_ngram_on_bulk_delete(orm_execute_state):
+            # 处理 Query.delete() 等批量删除
+            if not orm_execute_state.is_delete:
+                return
+            mapper = orm_execute_state.bind_mapper
+            index_name = models.get(mapper.class_) if mapper else None
+            if index_name is None:
+                return
+            session = orm_execute_state.session
+            if not cls._table_exists(session, cls.NGRAM_INDEXES[index_name]):
+                return
+            source = mapper.class_
+            ids = select(source.id)
+            whereclause = orm_execute_state.statement.whereclause
+            if whereclause is not None:
+                ids = ids.where(whereclause)
+            ngram = cls._ngram_table(index_name)
+            session.connection().execute(delete(ngram).where(ngram.c.rowid.in_(ids)))
+
+    @staticmethod
+    def _table_exists(session, name):
+        return (
+            session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": name},
+            ).first()
+            is not None
+        )
+
+    @staticmethod
+    def _ngram_table(index_name):
+        _, columns = SearchService.INDEXES[index_name]
+        return table(
+            SearchService.NGRAM_INDEXES[index_name],
+            column("rowid"),
+            *[column(name) for name in columns],
+        )
+
+    @staticmethod
+    def _ngram_row(object_id, values, columns):
+        row = {"rowid": object_id}
+        for name, value in zip(columns, values):
+            row[name] = SearchService.cjk_ngrams(value)
+        return row
+
+    @staticmethod
+    def cjk_ngrams(value):
+        """
+        生成写入 n-gram 索引的文本
+
+        连续的中日韩文字切分为重叠的二元组并附加末尾单字（"明治牛乳" ->
+        "明治 治牛 牛乳 乳"），其他部分原样保留，由 unicode61 分词。
+        """
+        if not value:
+            return None
+        tokens = []
+        for cjk_run, other in SearchService.NGRAM_RUN_PATTERN.findall(value):
+            if other:
+                tokens.append(other)
+                continue
+            tokens.extend(cjk_run[i : i + 2] for i in range(len(cjk_run) - 1))
+            tokens.append(cjk_run[-1])
+        return " ".join(tokens)
+
+    @staticmethod
+    def build_ngram_match_expression(term, columns=None):
+        """
+        将搜索词转换为 n-gram 索引的 MATCH 表达式
+
+        每个空白分隔的词转换为一个短语，与写入时的切分方式对应：中日韩文字转换为
+        连续二元组（后面还有其他字符时附加末尾单字），其他部分原样保留，
+        短语最后一个词使用前缀匹配；多个词之间为 AND 关系。
+        """
+        phrases = []
+        for word in term.split():
+            runs = SearchService.NGRAM_RUN_PATTERN.findall(word)
+            tokens = []
+            for index, (cjk_run, other) in enumerate(runs):
+                if other:
+                    tokens.append(other)
+                    continue
+                tokens.extend(cjk_run[i : i + 2] for i in range(len(cjk_run) - 1))
+                # 单字，或后面还有其他字符（写入时该位置为末尾单字）
+                if len(cjk_run) == 1 or index < len(runs) - 1:
+                    tokens.append(cjk_run[-1])
+            if tokens:
+                # 以分隔符结尾时最后一个词已完整，不使用前缀匹配
+                prefix = "*" if word[-1].isalnum() else ""
+                phrases.append('"' + " ".join(tokens).replace('"', '""') + '"' + prefix)
+        if not phrases:
+            return None
+        expression = " ".join(phrases)
+        if columns:
+            return "{" + " ".join(columns) + "} : (" + expression + ")"
+        return expression
+
+    @staticmethod
+    def rebuild_indexes(batch_size=5000):
+        """
+        为已有数据库创建FTS索引和触发器，并根据原表重建索引内容
+
+        Returns:
+            bool: FTS5 是否可用
+        """
+        with db.engine.begin() as conn:
+            if not SearchService._fts5_supported(None, None, conn):
+                return False
+            for index_name, (source, columns) in SearchService.INDEXES.items():
+                for statement in SearchService._ddl_statements(index_name):
+                    conn.exec_driver_sql(statement)
+                conn.exec_driver_sql(
+                    f"INSERT INTO {index_name}({index_name}) VALUES ('rebuild')"
+                )
+
+                # n-gram 索引由Python计算，分批重新生成
+                conn.exec_driver_sql(SearchService._ngram_ddl_statement(index_name))
+                ngram = SearchService._ngram_table(index_name)
+                conn.execute(delete(ngram))
+                result = conn.execute(
+                    select(source.c.id, *[source.c[name] for name in columns]),
+                    execution_options={"yield_per": batch_size},
+                )
+                for rows in result.partitions():
+                    conn.execute(
+                        insert(ngram),
+                        [
+                            SearchService._ngram_row(row[0], row[1:], columns)
+                            for row in rows
+                        ],
+                    )
+        return True
+
+    @staticmethod
+    def is_available(index_name):
+        """FTS检索是否启用且索引已建立"""
+        if not current_app.config.get("SEARCH_FTS_ENABLED", True):
+            return False
+        if db.engine.dialect.name != "sqlite":
+            return False
+        return SearchService._table_exists(db.session, index_name)
+
+    @staticmethod
+    def build_match_expression(term, columns=None):
+        """
+        将用户输入转换为 FTS5 MATCH 表达式
+
+        每个空白分隔的词作为带前缀匹配的短语，多个词之间为 AND 关系。
+
+        Args:
+            term: 搜索词
+            columns: 限定搜索的列，None 表示全部索引列
+
+        Returns:
+            str: MATCH 表达式，无有效搜索词时返回None
+        """
+        tokens = [token for token in term.split() if token]
+        if not tokens:
+            return None
+        phrases = " ".join('"' + token.replace('"', '""') + '"*' for token in tokens)
+        if columns:
+            return "{" + " ".join(columns) + "} : (" + phrases + ")"
+        return phrases
+
+    @staticmethod
+    def _tokenize(word):
+        """按 unicode61 的规则切分单词（转小写、去除变音符号）"""
+        decomposed = unicodedata.normalize("NFD", word.lower())
+        stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+        return SearchService.TOKEN_PATTERN.findall(stripped)
+
+    @staticmethod
+    def is_token_prefix(index_name, term):
+        """
+        搜索词能否在 unicode61 索引中按词前缀匹配
+
+        全文索引只能匹配词的前缀：每个词的最后一段不短于 SEARCH_FTS_MIN_PREFIX_LENGTH，
+        且在词表中有以它开头的词（其余各段为完整的词）时才使用全文索引；
+        过短的词或词中间的片段（如 "beans" 中的 "eans"）由调用方回退到 ilike 子串匹配。
+        """
+        vocab = SearchService.VOCAB_INDEXES[index_name]
+        if not SearchService._table_exists(db.session, vocab):
+            return False
+        min_length = current_app.config.get("SEARCH_FTS_MIN_PREFIX_LENGTH", 3)
+        exact = text(f"SELECT 1 FROM {vocab} WHERE term = :term LIMIT 1")
+        prefix = text(
+            f"SELECT 1 FROM {vocab} WHERE term >= :term AND term < :upper LIMIT 1"
+        )
+        for word in term.split():
+            tokens = SearchService._tokenize(word)
+            if not tokens or len(tokens[-1]) < min_length:
+                return False
+            for token in tokens[:-1]:
+                if db.session.execute(exact, {"term": token}).first() is None:
+                    return False
+            last = tokens[-1]
+            if (
+                db.session.execute(
+                    prefix, {"term": last, "upper": last + "\U0010ffff"}
+                ).first()
+                is None
+            ):
+                return False
+        return True
+
+    @staticmethod
+    def match_subquery(index_name, term, columns=None):
+        """
+        构建全文检索子查询
+
+        包含中日韩文字（含假名，unicode61 不切分连续的假名和汉字）的搜索词
+        使用 n-gram 索引按子串匹配；其他搜索词使用 unicode61 索引按词前缀匹配，
+        不是词前缀时返回None（回退到 ilike）。
+
+        Args:
+            index_name: FTS索引名（receipts_fts / items_fts）
+            term: 搜索词
+            columns: 限定搜索的列
+
+        Returns:
+            子查询，包含 id 和 rank（bm25 相关度，越小越相关）列；
+            FTS不可用或无法使用时返回None，调用方应回退到 ilike
+        """
+        if SearchService.CJK_PATTERN.search(term):
+            index_name = SearchService.NGRAM_INDEXES[index_name]
+            if not SearchService.is_available(index_name):
+                return None
+            expression = SearchService.build_ngram_match_expression(term, columns)
+        else:
+            if not SearchService.is_available(
+                index_name
+            ) or not SearchService.is_token_prefix(index_name, term):
+                return None
+            expression = SearchService.build_match_expression(term, columns)
+        if expression is None:
+            return None
+
+        fts = table(index_name, column("rowid"), column("rank"))
+        return (
+            select(fts.c.rowid.label("id"), fts.c.rank.label("rank"))
+            .where(literal_column(index_name).op("MATCH")(expression))
+            .subquery()
+        )
@@ -0,0 +1,245 @@
+# app/serializers.py
+from flask import current_app, has_app_context
+from marshmallow import fields
+from .schemas import UserTimezoneDateTime
+from .services import make_utc_to_local_converter
+
+
+def _none_or(convert):
+    def wrapper(value):
+        return None if value is None else convert(value)
+
+    return wrapper
+
+
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+def _identity(value):
+    return value
+
+
+def _local_isoformat(to_local):
+    """转换为用户本地时间的ISO字符串，同一次序列化中相同的时间只转换一次"""
+    cache = {}
+
+    def convert(value):
+        if value is None:
+            return None
+        result = cache.get(value)
+        if result is None:
+            result = cache[value] = to_local(value).isoformat()
+        return result
+
+    return convert
+
+
+class CompiledSerializer:
+    """
+    由 marshmallow Schema 编译得到的序列化器
+
+    编译时按 Schema 的字段列表确定每个字段的取值方式和转换函数，
+    序列化时直接按列表生成字典，输出与 schema.dump 相同。
+    用户时区每次序列化只解析一次。
+    """
+
+    # 字段类型 -> 转换函数（None 原样输出，与 marshmallow 一致）
+    SIMPLE_CONVERTERS = [
+        (fields.Boolean, _identity),
+        (fields.Integer, _none_or(int)),
+        (fields.Float, _none_or(float)),
+        (fields.String, _none_or(str)),
+        (fields.DateTime, _isoformat),
+        (fields.Date, _isoformat),
+    ]
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.many = schema.many
+        self._fields = [
+            self._compile_field(name, field)
+            for name, field in schema.dump_fields.items()
+        ]
+
+    def _compile_field(self, name, field):
+        """
+        Returns:
+            tuple: (输出键, 属性名, 类型, 附加信息)；属性名为None表示转换函数接收整个对象
+        """
+        key = field.data_key or name
+        attr = field.attribute or name
+
+        if isinstance(field, UserTimezoneDateTime):
+            return key, attr, "local_time", None
+        if isinstance(field, fields.Nested):
+            return key, attr, "nested", CompiledSerializer(field.schema)
+        if isinstance(field, fields.Method):
+            method = getattr(self.schema, field.serialize_method_name)
+            return key, None, "simple", method
+        for field_type, convert in self.SIMPLE_CONVERTERS:
+            if type(field) is field_type:
+                return key, attr, "simple", convert
+
+        # 其他字段类型交由 marshmallow 处理
+        def serialize(obj, field=field, attr=attr):
+            return field.serialize(attr, obj, accessor=self.schema.get_attribute)
+
+        return key, None, "simple", serialize
+
+    def _bind(self, local_time, only=None):
+        """生成本次序列化使用的 (输出键, 属性名, 转换函数) 列表"""
+        bound = []
+        for key, attr, kind, extra in self._fields:
+            if only is not None and key not in only:
+                continue
+            if kind == "local_time":
+                convert = local_time
+            elif kind == "nested":
+                convert = extra._bind_nested(local_time)
+            else:
+                convert = extra
+            bound.append((key, attr, convert))
+        return bound
+
+    def _bind_nested(self, local_time):
+        bound = self._bind(local_time)
+        if self.many:
+            return _none_or(
+                lambda values: [
+                    CompiledSerializer._dump_object(bound, value, getattr)
+                    for value in values
+                ]
+            )
+        return _none_or(
+            lambda value: CompiledSerializer._dump_object(bound, value, getattr)
+        )
+
+    @staticmethod
+    def _dump_object(bound, obj, get):
+        return {
+            key: convert(obj if attr is None else get(obj, attr))
+            for key, attr, convert in bound
+        }
+
+    def dump(self, data, only=None, user_timezone=None):
+        """
+        序列化对象（many=True 时为对象列表）
+
+        Args:
+            data: 模型对象或字典
+            only: 只输出的顶层字段名集合
+            user_timezone: 用户时区，为None时从配置读取
+        """
+        local_time = _local_isoformat(make_utc_to_local_converter(user_timezone))
+        bound = self._bind(local_time, only)
+        if not self.many:
+            get = dict.get if isinstance(data, dict) else getattr
+            return self._dump_object(bound, data, get)
+        if not data:
+            return []
+        get = dict.get if isinstance(data[0], dict) else getattr
+        dump_object = self._dump_object
+        return [dump_object(bound, obj, get) for obj in data]
+
+
+def _split_names(value):
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+def parse_fieldset(args, schema, relations=()):
+    """
+    解析稀疏字段集参数
+
+    - fields=a,b：只返回列出的字段（可以包含关联字段）
+    - include=x,y：额外返回的关联字段；只指定 include 时返回全部普通字段和这些关联字段
+
+    Args:
+        args: 请求参数
+        schema: 接口使用的 Schema
+        relations: Schema 中的关联字段（需要额外查询的字段）
+
+    Returns:
+        set: 需要返回的顶层字段名；两个参数都未指定时返回None，表示全部字段
+
+    Raises:
+        ValueError: 字段名无效
+    """
+    fields_arg = args.get("fields")
+    include_arg = args.get("include")
+    if fields_arg is None and include_arg is None:
+        return None
+
+    available = [field.data_key or name for name, field in schema.dump_fields.items()]
+    include = _split_names(include_arg or "")
+    if unknown := include - set(relations):
+        raise ValueError(
+            f"无效的 include 字段: {', '.join(sorted(unknown))}，"
+            f"可选: {', '.join(sorted(relations)) or '无'}"
+        )
+
+    if fields_arg is None:
+        selected = {name for name in available if name not in relations}
+    else:
+        selected = _split_names(fields_arg)
+        if unknown := selected - set(available):
+            raise ValueError(f"无效的字段: {', '.join(sorted(unknown))}")
+
+    selected |= include
+    if not selected:
+        raise ValueError("至少需要返回一个字段")
+    return selected
+
+
+_compiled = {}
+_narrowed = {}
+
+
+def _narrow_schema(schema, only):
+    """
+    只包含稀疏字段集中字段的 Schema（按原 Schema 和字段集缓存）
+
+    先完整序列化再过滤会读取未请求的列和关联（逐行延迟加载），
+    因此按字段集构建 only= 的 Schema，只访问请求的字段。
+    """
+    key = (id(schema), frozenset(only))
+    cached = _narrowed.get(key)
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+    # 参数中是输出名（data_key），only= 需要字段名
+    names = {
+        name
+        for name, field in schema.dump_fields.items()
+        if (field.data_key or name) in only
+    }
+    narrowed = schema.__class__(
+        many=schema.many,
+        only=names,
+        exclude=schema.exclude,
+        load_only=schema.load_only,
+        dump_only=schema.dump_only,
+    )
+    _narrowed[key] = (schema, narrowed)
+    return narrowed
+
+
+def dump(schema, data, only=None):
+    """
+    序列化接口返回的数据
+
+    FAST_SERIALIZERS_ENABLED 开启时使用编译的序列化器，否则使用 schema.dump；
+    only 为只输出的顶层字段名集合（稀疏字段集）。
+    """
+    enabled = True
+    if has_app_context():
+        enabled = current_app.config.get("FAST_SERIALIZERS_ENABLED", True)
+
+    if not enabled:
+        if only is not None:
+            schema = _narrow_schema(schema, only)
+        return schema.dump(data)
+
+    serializer = _compiled.get(id(schema))
+    if serializer is None or serializer.schema is not schema:
+        serializer = _compiled[id(schema)] = CompiledSerializer(schema)
+    return serializer.dump(data, only=only)
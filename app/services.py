@@ -2,14 +2,27 @@
 import os
 import threading
 import copy
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import or_, and_
-from flask import current_app
+from sqlalchemy import or_, and_, select
+from sqlalchemy.orm import selectinload, load_only
+from flask import current_app, g, has_request_context
 
 from .models import db, Receipt, Item, RecognitionStatus, ComparisonGroup, DurableGood
 from .category_models import Category
 from .ai_service import AIService
-from .file_service import FileService
+from .file_service import (
+    AIImageService,
+    FileService,
+    ImageCompressionPool,
+    ImageDerivativeService,
+)
+from .upload_index_service import UploadIndexService
+from .duplicate_service import DuplicateService
+from .cache_service import analytics_cache, DataVersion
+from .search_service import SearchService
+from .pagination_service import CursorPagination
 
 # 默认用户时区（东九区）
 DEFAULT_USER_TIMEZONE = timezone(timedelta(hours=9))
@@ -116,6 +129,36 @@ def convert_utc_to_local(utc_datetime, user_timezone=None):
         return utc_tz_time.astimezone(timezone(timedelta(hours=9))).replace(tzinfo=None)
 
 
+def make_utc_to_local_converter(user_timezone=None):
+    """
+    生成UTC时间到用户本地时间的转换函数，结果与 convert_utc_to_local 相同
+
+    时区设置只读取一次，用于批量转换。
+
+    Args:
+        user_timezone: 用户时区字符串，如果为None则从配置中获取
+
+    Returns:
+        function: 接收UTC时间（naive datetime），返回本地时间（naive datetime）
+    """
+    try:
+        import pytz
+
+        local_tz = pytz.timezone(user_timezone or get_user_timezone())
+    except Exception as e:
+        print(f"时区转换错误: {e}")
+        local_tz = timezone(timedelta(hours=9))
+
+    def convert(utc_datetime):
+        if utc_datetime is None:
+            return None
+        if utc_datetime.tzinfo is None:
+            utc_datetime = utc_datetime.replace(tzinfo=timezone.utc)
+        return utc_datetime.astimezone(local_tz).replace(tzinfo=None)
+
+    return convert
+
+
 def get_user_timezone():
     """获取用户设置的时区"""
     try:
@@ -126,48 +169,385 @@ def get_user_timezone():
         return 'Asia/Shanghai'
 
 
+def get_category_path_map():
+    """
+    获取分类路径表，在同一请求内共用
+
+    数据版本变化（分类或商品写入提交）后重新加载。
+
+    Returns:
+        dict: {分类ID: "一级 > 二级 > 三级"}
+    """
+    if not has_request_context():
+        return ExportService.get_category_path_map()
+
+    version = DataVersion.get()
+    cached = g.get("category_path_map")
+    if cached is None or cached[0] != version:
+        cached = (version, ExportService.get_category_path_map())
+        g.category_path_map = cached
+    return cached[1]
+
+
+def build_load_only(model, fields, required=()):
+    """
+    按需要返回的字段生成 load_only 选项，只查询这些字段对应的列
+
+    Args:
+        model: 模型类
+        fields: 需要返回的字段名集合（非列字段会被忽略）
+        required: 序列化关联字段等还需要的列名
+    """
+    column_keys = model.__mapper__.column_attrs.keys()
+    names = [name for name in (*sorted(fields), *required) if name in column_keys]
+    return load_only(*[getattr(model, name) for name in dict.fromkeys(names)])
+
+
+def build_date_range_filters(start_date, end_date):
+    """
+    根据用户本地时间范围构建小票筛选条件
+
+    只有日期的参数直接比较已存储的本地交易日期（可走索引），
+    带具体时间的参数转换为UTC后比较交易时间。
+
+    Args:
+        start_date: 开始日期/时间字符串 (ISO格式)
+        end_date: 结束日期/时间字符串 (ISO格式)
+
+    Returns:
+        list: SQLAlchemy 筛选条件列表
+    """
+    filters = []
+
+    if start_date:
+        try:
+            start_datetime = datetime.fromisoformat(str(start_date))
+            if start_datetime.time() == datetime.min.time():
+                filters.append(Receipt.transaction_local_date >= start_datetime.date())
+            else:
+                # 将用户本地时间转换为UTC时间
+                filters.append(
+                    Receipt.transaction_time >= convert_local_to_utc(start_datetime)
+                )
+        except (ValueError, TypeError):
+            pass
+
+    if end_date:
+        try:
+            end_datetime = datetime.fromisoformat(str(end_date))
+            if end_datetime.time() == datetime.min.time():
+                # 如果只有日期没有时间，则包含整天
+                filters.append(Receipt.transaction_local_date <= end_datetime.date())
+            else:
+                filters.append(
+                    Receipt.transaction_time <= convert_local_to_utc(end_datetime)
+                )
+        except (ValueError, TypeError):
+            pass
+
+    return filters
+
+
 class ReceiptService:
 
     @staticmethod
-    def batch_create_and_recognize(image_files, task_name=None):
+    def batch_create_and_recognize(image_files, task_name=None, link_duplicates=False):
         """
         批量上传图片并创建识别任务
+
+        图片并行压缩（启用后台压缩时原样保存后交给压缩进程池），全部小票在一个事务中
+        批量插入，识别作为一个批次任务排队。与更早的小票（包括批次内的）图片相近的
+        小票标记为重复，不触发识别。
         Args:
             image_files: 多个图片文件对象列表
             task_name: 可选任务名称
+            link_duplicates: 图片已上传过时返回已有小票，不创建新小票
         Returns:
-            dict: 包含每个小票的ID、名称、状态
+            dict: 包含每个小票的ID、名称、状态，duplicate 表示返回的是已有小票
         """
-        results = []
-        for idx, image_file in enumerate(image_files):
-            data = {
-                "name": f"批量小票_{task_name or ''}_{idx+1}",
-                "text_description": None,
-                "notes": None,
-                "transaction_time": None,
-                "store_name": None,
-                "store_category": None,
-            }
+        uploads = [
+            {"name": f"批量小票_{task_name or ''}_{idx+1}", "file": image_file}
+            for idx, image_file in enumerate(image_files)
+        ]
+
+        # 1. 按原始内容去重：已上传过的图片复用已保存的文件，批次内相同的图片只保存一次
+        for upload in uploads:
             try:
-                receipt = ReceiptService.create_receipt(data, image_file)
-                results.append(
-                    {
-                        "id": receipt.id,
-                        "name": receipt.name,
-                        "status": receipt.status.name,
-                    }
-                )
+                upload["raw_hash"] = FileService.hash_upload(upload["file"])
             except Exception as e:
-                results.append(
-                    {
-                        "id": None,
-                        "name": data["name"],
-                        "status": "FAILED",
-                        "error": str(e),
-                    }
+                upload["error"] = str(e)
+        valid = [upload for upload in uploads if "error" not in upload]
+        known = UploadIndexService.find_many(upload["raw_hash"] for upload in valid)
+        first_uploads = {}
+        to_store = []
+        for upload in valid:
+            raw_hash = upload["raw_hash"]
+            if raw_hash in known:
+                upload["filename"] = known[raw_hash]
+                if link_duplicates:
+                    upload["receipt"] = ReceiptService.find_duplicate_receipt(raw_hash)
+            elif raw_hash in first_uploads:
+                upload["same_as"] = first_uploads[raw_hash]
+            else:
+                first_uploads[raw_hash] = upload
+                to_store.append(upload)
+
+        # 2. 保存图片
+        compress_in_background = ImageCompressionPool.is_enabled()
+        ReceiptService._store_batch_images(to_store, compress_in_background)
+
+        # 3. 一个事务中批量插入小票
+        created = []
+        for upload in valid:
+            first = upload.get("same_as")
+            if first is not None and "error" in first:
+                upload["error"] = first["error"]
+            if "error" in upload:
+                continue
+            if upload.get("receipt") is not None:
+                upload["duplicate"] = True
+            elif first is not None and link_duplicates:
+                # 批次内重复的图片关联到第一张图片创建的小票
+                upload["receipt"] = first["receipt"]
+                upload["duplicate"] = True
+            else:
+                source = first or upload
+                if "phash" not in source and not compress_in_background:
+                    # 复用已保存的文件时在此计算哈希（新保存的图片在保存时计算）
+                    source["phash"] = DuplicateService.compute_hash(source["filename"])
+                receipt = Receipt(
+                    name=upload["name"], image_filename=source["filename"]
                 )
+                receipt.image_phash = source.get("phash")
+                upload["receipt"] = receipt
+                created.append(upload)
+        db.session.add_all(upload["receipt"] for upload in created)
+        # 后台压缩时记录等待压缩的原图，压缩期间再次上传相同的图片时复用
+        UploadIndexService.record_many(
+            {
+                upload["raw_hash"]: upload["filename"]
+                for upload in to_store
+                if "error" not in upload
+            }
+        )
+        try:
+            db.session.flush()
+            # 复用的原图仍在等待其他上传的后台压缩时，由那次压缩完成的回调处理；
+            # 写入后（持有写锁）再确认，压缩已经完成时改用压缩后的文件名
+            awaiting = set()
+            for upload in created:
+                receipt = upload["receipt"]
+                if upload.get("same_as") is not None or FileService.is_content_addressed(
+                    receipt.image_filename
+                ):
+                    continue
+                if upload["raw_hash"] not in known:
+                    continue
+                current = UploadIndexService.current(upload["raw_hash"])
+                if current == receipt.image_filename:
+                    awaiting.add(receipt.id)
+                elif current:
+                    receipt.image_filename = current
+            # 按ID顺序与更早的小票（包括批次内的）比较图片哈希
+            for upload in created:
+                receipt = upload["receipt"]
+                DuplicateService.flag(receipt, receipt.image_phash)
+            results = [ReceiptService._batch_result(upload) for upload in uploads]
+            receipt_ids = [
+                upload["receipt"].id
+                for upload in created
+                if upload["receipt"].id not in awaiting
+            ]
+            recognize_ids = [
+                upload["receipt"].id
+                for upload in created
+                if DuplicateService.should_recognize(upload["receipt"])
+            ]
+            db.session.commit()
+        except Exception as e:
+            # 已保存的图片不再被引用，由孤立图片回收清理
+            db.session.rollback()
+            current_app.logger.error(f"Error creating batch receipts: {e}")
+            created_receipts = {id(upload["receipt"]) for upload in created}
+            for upload in valid:
+                if id(upload.get("receipt")) in created_receipts:
+                    upload["error"] = str(e)
+            return {
+                "receipts": [ReceiptService._batch_result(upload) for upload in uploads],
+                "task_name": task_name,
+            }
+
+        # 4. 识别作为一个批次任务排队（后台压缩时在整批压缩完成后排队）
+        if compress_in_background:
+            ReceiptService._compress_batch(
+                [
+                    (upload["filename"], upload["raw_hash"])
+                    for upload in to_store
+                    if "error" not in upload
+                ],
+                receipt_ids,
+            )
+        else:
+            ReceiptService.trigger_batch_recognition(recognize_ids)
+
         return {"receipts": results, "task_name": task_name}
 
+    @staticmethod
+    def _batch_result(upload):
+        """批量上传中单个文件的结果"""
+        if "error" in upload:
+            return {
+                "id": None,
+                "name": upload["name"],
+                "status": "FAILED",
+                "error": upload["error"],
+            }
+        receipt = upload["receipt"]
+        return {
+            "id": receipt.id,
+            "name": receipt.name,
+            "status": receipt.status.name,
+            "duplicate": upload.get("duplicate", False),
+            "duplicate_of_id": receipt.duplicate_of_id,
+        }
+
+    @staticmethod
+    def _store_batch_images(uploads, compress_in_background):
+        """
+        保存批次中的图片，文件名写入 upload["filename"]，失败时写入 upload["error"]
+
+        启用后台压缩时原样保存；否则在线程池中并行压缩（Pillow 解码和编码时释放GIL），
+        并发数为 IMAGE_DECODE_CONCURRENCY，同时计算图片哈希写入 upload["phash"]。
+        """
+        if compress_in_background:
+            for upload in uploads:
+                upload["filename"] = FileService.save_original(upload["file"])
+                if not upload["filename"]:
+                    upload["error"] = "Failed to save image file"
+            return
+
+        app = current_app._get_current_object()
+        compress = app.config.get("IMAGE_COMPRESSION_ENABLED", True)
+        quality = app.config.get("IMAGE_COMPRESSION_QUALITY", 80)
+        max_size = (
+            app.config.get("IMAGE_MAX_WIDTH", 1920),
+            app.config.get("IMAGE_MAX_HEIGHT", 1080),
+        )
+
+        def store(upload):
+            with app.app_context():
+                filename = FileService.save_image_with_md5(
+                    upload["file"], compress=compress, quality=quality, max_size=max_size
+                )
+                if filename:
+                    # 预先生成列表和详情页使用的缩略图
+                    ImageDerivativeService.generate_all(filename)
+                    upload["phash"] = DuplicateService.compute_hash(filename)
+                return filename
+
+        workers = max(1, app.config.get("IMAGE_DECODE_CONCURRENCY", 2))
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="batch-upload"
+        ) as executor:
+            for upload, filename in zip(uploads, executor.map(store, uploads)):
+                upload["filename"] = filename
+                if not filename:
+                    upload["error"] = "Failed to save image file"
+
+    @staticmethod
+    def _compress_batch(originals, receipt_ids):
+        """
+        后台压缩批次中的原图，全部完成后一次性替换小票图片并触发批次识别
+
+        Args:
+            originals: [(原图文件名, 原始内容MD5), ...]
+            receipt_ids: 批次中新建的小票ID
+        """
+        if not originals:
+            ReceiptService._finish_batch_compression(receipt_ids, {})
+            return
+
+        lock = threading.Lock()
+        results = {}
+
+        def on_done(original_filename, raw_hash, filename):
+            with lock:
+                results[original_filename] = (filename, raw_hash)
+                finished = len(results) == len(originals)
+            if finished:
+                ReceiptService._finish_batch_compression(receipt_ids, results)
+
+        for original_filename, raw_hash in originals:
+            ImageCompressionPool.submit(
+                original_filename, functools.partial(on_done, original_filename, raw_hash)
+            )
+
+    @staticmethod
+    def _finish_batch_compression(receipt_ids, results):
+        """
+        批次压缩完成后替换小票图片、检测重复并触发批次识别（在最后完成的压缩等待线程中执行）
+
+        压缩期间再次上传相同图片创建的小票同样引用原图，一并处理。
+
+        Args:
+            receipt_ids: 批次中新建的小票ID
+            results: 原图文件名 -> (压缩后的文件名（失败时为None）, 原始内容MD5)
+        """
+        # 先更新去重索引（持有写锁）再查询引用原图的小票，与创建小票时的确认互斥
+        UploadIndexService.record_many(
+            {raw_hash: filename for filename, raw_hash in results.values() if filename}
+        )
+        for original_filename, (filename, raw_hash) in results.items():
+            if not filename:
+                UploadIndexService.forget(raw_hash, original_filename)
+        db.session.flush()
+        receipts = (
+            Receipt.query.filter(
+                or_(
+                    Receipt.id.in_(receipt_ids),
+                    Receipt.image_filename.in_(list(results)),
+                )
+            )
+            .order_by(Receipt.id)
+            .all()
+        )
+        for receipt in receipts:
+            filename, _ = results.get(receipt.image_filename, (None, None))
+            if filename:
+                receipt.image_filename = filename
+        # 图片确定后按ID顺序计算哈希，与更早的小票相近时标记为重复
+        hashes = {}
+        for receipt in receipts:
+            if receipt.image_phash is None and receipt.image_filename not in hashes:
+                hashes[receipt.image_filename] = DuplicateService.compute_hash(
+                    receipt.image_filename
+                )
+        for receipt in receipts:
+            if receipt.image_phash is None:
+                DuplicateService.flag(receipt, hashes[receipt.image_filename])
+        referenced = {receipt.image_filename for receipt in receipts}
+        db.session.commit()
+
+        for original_filename, (filename, _) in results.items():
+            if filename:
+                FileService.delete_image(original_filename)
+            if filename in referenced:
+                ImageDerivativeService.generate_all(filename)
+            elif filename:
+                # 压缩期间小票已被删除；压缩后的文件可能与其他小票的图片相同
+                if not Receipt.query.filter_by(image_filename=filename).first():
+                    FileService.delete_image(filename)
+            elif original_filename not in referenced:
+                FileService.delete_image(original_filename)
+
+        ReceiptService.trigger_batch_recognition(
+            [
+                receipt.id
+                for receipt in receipts
+                if DuplicateService.should_recognize(receipt)
+            ]
+        )
+
     """处理小票相关业务逻辑"""
 
     @staticmethod
@@ -185,7 +565,7 @@ class ReceiptService:
         ai_service = AIService()
         image_full_path = None
         if receipt.image_filename:
-            image_full_path = FileService.get_image_path(receipt.image_filename)
+            image_full_path = AIImageService.get_image_path(receipt.image_filename)
 
         try:
             ai_data = ai_service.recognize_receipt(
@@ -206,6 +586,21 @@ class ReceiptService:
 
         db.session.commit()
 
+    @staticmethod
+    def _create_background_app(app_config):
+        """创建后台识别线程使用的临时app实例"""
+        from flask import Flask
+        from app.database import db, ma, init_sqlite_profile
+
+        temp_app = Flask(__name__)
+        temp_app.config.update(app_config)
+
+        # 初始化数据库
+        db.init_app(temp_app)
+        init_sqlite_profile(temp_app)
+        ma.init_app(temp_app)
+        return temp_app
+
     @staticmethod
     def trigger_recognition(receipt_id):
         # 使用后台线程处理，避免阻塞API
@@ -217,17 +612,7 @@ class ReceiptService:
 
         def background_task():
             # 重新创建Flask app实例
-            from flask import Flask
-            from app.database import db, ma
-
-            # 创建临时app实例
-            temp_app = Flask(__name__)
-            temp_app.config.update(app_config)
-
-            # 初始化数据库
-            db.init_app(temp_app)
-            ma.init_app(temp_app)
-
+            temp_app = ReceiptService._create_background_app(app_config)
             with temp_app.app_context():
                 ReceiptService._process_recognition_task_internal(receipt_id)
 
@@ -235,6 +620,36 @@ class ReceiptService:
         thread.daemon = True  # 设置为守护线程
         thread.start()
 
+    @staticmethod
+    def trigger_batch_recognition(receipt_ids):
+        """
+        批量识别作为一个后台任务排队：一个后台线程创建临时app实例，
+        按 AI_RECOGNITION_CONCURRENCY 并发识别批次中的小票
+        """
+        if not receipt_ids:
+            return
+
+        app_config = copy.deepcopy(current_app.config)
+        workers = max(1, app_config.get("AI_RECOGNITION_CONCURRENCY", 4))
+
+        def recognize(temp_app, receipt_id):
+            with temp_app.app_context():
+                try:
+                    ReceiptService._process_recognition_task_internal(receipt_id)
+                except Exception as e:
+                    temp_app.logger.error(f"Error processing receipt {receipt_id}: {e}")
+
+        def background_task():
+            temp_app = ReceiptService._create_background_app(app_config)
+            with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="batch-recognition"
+            ) as executor:
+                for receipt_id in receipt_ids:
+                    executor.submit(recognize, temp_app, receipt_id)
+
+        thread = threading.Thread(target=background_task, daemon=True)
+        thread.start()
+
     @staticmethod
     def _process_recognition_task_internal(receipt_id):
         """内部识别任务处理，已在app_context中"""
@@ -250,7 +665,7 @@ class ReceiptService:
         ai_service = AIService()
         image_full_path = None
         if receipt.image_filename:
-            image_full_path = FileService.get_image_path(receipt.image_filename)
+            image_full_path = AIImageService.get_image_path(receipt.image_filename)
 
         try:
             ai_data = ai_service.recognize_receipt(
@@ -272,18 +687,49 @@ class ReceiptService:
         db.session.commit()
 
     @staticmethod
-    def create_receipt(data, image_file=None):
+    def find_duplicate_receipt(raw_hash):
+        """
+        查找使用相同图片（原始上传内容相同）的小票
+
+        Returns:
+            Receipt: 最新创建的小票，没有时返回None
+        """
+        receipts = UploadIndexService.find_receipts(raw_hash)
+        return receipts[0] if receipts else None
+
+    @staticmethod
+    def create_receipt(data, image_file=None, raw_hash=None):
         """创建新的小票记录
 
         Args:
             data: 小票数据
             image_file: 上传的图片文件
+            raw_hash: 图片原始内容的MD5，为None时计算
 
         Returns:
             Receipt: 创建的小票对象
         """
         filename = None
+        compress_in_background = False
+        awaiting_compression = False
         if image_file:
+            raw_hash = raw_hash or FileService.hash_upload(image_file)
+            # 相同内容的图片已上传过时直接复用，跳过压缩和写入
+            filename = UploadIndexService.find(raw_hash)
+
+        if filename:
+            # 复用的原图仍在等待后台压缩时，由压缩完成的回调一并替换图片、
+            # 计算哈希和触发识别
+            awaiting_compression = not FileService.is_content_addressed(filename)
+        elif image_file and ImageCompressionPool.is_enabled():
+            # 先原样保存，压缩和MD5命名在后台进程中完成
+            filename = FileService.save_original(image_file)
+            if not filename:
+                raise ValueError("Failed to save image file")
+            # 压缩期间再次上传相同的图片时复用原图
+            UploadIndexService.record(raw_hash, filename)
+            compress_in_background = True
+        elif image_file:
             # 从配置获取压缩参数
             compress = current_app.config.get("IMAGE_COMPRESSION_ENABLED", True)
             quality = current_app.config.get("IMAGE_COMPRESSION_QUALITY", 80)
@@ -298,6 +744,14 @@ class ReceiptService:
             )
             if not filename:
                 raise ValueError("Failed to save image file")
+            UploadIndexService.record(raw_hash, filename)
+            # 预先生成列表和详情页使用的缩略图
+            ImageDerivativeService.generate_all(filename)
+
+        # 后台压缩时在压缩完成后计算哈希
+        phash = None
+        if filename and not (compress_in_background or awaiting_compression):
+            phash = DuplicateService.compute_hash(filename)
 
         new_receipt = Receipt(
             name=data.get("name", "未命名小票"),
@@ -314,32 +768,147 @@ class ReceiptService:
             store_name=data.get("store_name"),
             store_category=data.get("store_category"),
         )
+        # 与更早的小票图片相近时标记为重复
+        DuplicateService.flag(new_receipt, phash)
 
         db.session.add(new_receipt)
+        if awaiting_compression:
+            # 写入后（持有写锁）再确认原图仍在等待压缩：压缩已经完成时，
+            # 回调不会再处理本小票，改用索引中压缩后的文件名
+            db.session.flush()
+            current = UploadIndexService.current(raw_hash)
+            if current != filename:
+                awaiting_compression = False
+                new_receipt.image_filename = current or filename
+                DuplicateService.flag(
+                    new_receipt,
+                    DuplicateService.compute_hash(new_receipt.image_filename),
+                )
         db.session.commit()
 
-        # 如果需要AI识别，则触发后台任务
-        if new_receipt.status == RecognitionStatus.PENDING:
+        if compress_in_background:
+            # 压缩完成后再触发识别，识别使用压缩后的图片
+            ImageCompressionPool.submit(
+                filename,
+                lambda compressed: ReceiptService._finish_image_compression(
+                    filename, compressed, raw_hash
+                ),
+            )
+        elif awaiting_compression:
+            # 原图压缩完成后随上传相同图片的小票一起处理
+            pass
+        # 如果需要AI识别，则触发后台任务（标记为重复的小票不识别）
+        elif DuplicateService.should_recognize(new_receipt):
             ReceiptService.trigger_recognition(new_receipt.id)
 
         return new_receipt
 
     @staticmethod
-    def get_all_receipts(args):
+    def _finish_image_compression(original_filename, filename, raw_hash):
+        """
+        后台压缩完成后替换小票图片、检测重复并触发识别（在压缩等待线程的应用上下文中执行）
+
+        压缩期间再次上传相同图片创建的小票同样引用原图，一并处理。
+
+        Args:
+            original_filename: 上传时保存的原图文件名
+            filename: 压缩后的文件名，压缩失败时为None（保留原图）
+            raw_hash: 原图内容的MD5
+        """
+        # 先更新去重索引（持有写锁）再查询引用原图的小票，与创建小票时的确认互斥
+        if filename:
+            UploadIndexService.record(raw_hash, filename)
+        else:
+            UploadIndexService.forget(raw_hash, original_filename)
+        db.session.flush()
+        receipts = (
+            Receipt.query.filter_by(image_filename=original_filename)
+            .order_by(Receipt.id)
+            .all()
+        )
+        if filename:
+            for receipt in receipts:
+                receipt.image_filename = filename
+        # 图片确定后按ID顺序计算哈希，与更早的小票相近时标记为重复
+        phash = None
+        for receipt in receipts:
+            if receipt.image_phash is None:
+                phash = phash or DuplicateService.compute_hash(receipt.image_filename)
+                DuplicateService.flag(receipt, phash)
+        db.session.commit()
+
+        if filename:
+            FileService.delete_image(original_filename)
+            if receipts:
+                ImageDerivativeService.generate_all(filename)
+            elif not Receipt.query.filter_by(image_filename=filename).first():
+                # 压缩期间小票已被删除；压缩后的文件可能与其他小票的图片相同
+                FileService.delete_image(filename)
+        elif not receipts:
+            FileService.delete_image(original_filename)
+
+        for receipt in receipts:
+            if DuplicateService.should_recognize(receipt):
+                ReceiptService.trigger_recognition(receipt.id)
+
+    # 小票列表允许的排序字段（其他值按创建时间排序）
+    SORT_FIELDS = (
+        "id",
+        "name",
+        "store_name",
+        "created_at",
+        "updated_at",
+        "transaction_time",
+        "transaction_local_date",
+        "item_count",
+        "total_jpy",
+        "total_cny",
+    )
+
+    # 由其他列计算得到的字段 -> 序列化时需要的列
+    DERIVED_FIELD_COLUMNS = {"image_urls": ("image_filename",)}
+
+    @staticmethod
+    def _required_columns(fields):
+        return [
+            column
+            for name in fields
+            for column in ReceiptService.DERIVED_FIELD_COLUMNS.get(name, ())
+        ]
+
+    @staticmethod
+    def get_all_receipts(args, fields=None):
+        """
+        Args:
+            args: 查询参数
+            fields: 需要返回的字段名集合，只查询对应的列；为None时查询全部列
+        """
         query = Receipt.query
+        if fields is not None:
+            query = query.options(
+                build_load_only(
+                    Receipt, fields, ReceiptService._required_columns(fields)
+                )
+            )
 
-        # 搜索 - 支持 search 和 q 参数
+        # 搜索 - 支持 search 和 q 参数，优先使用全文索引
+        search_rank = None
         search_value = args.get("search") or args.get("q")
         if search_value:
-            search_term = f"%{search_value}%"
-            query = query.filter(
-                or_(
-                    Receipt.name.ilike(search_term),
-                    Receipt.notes.ilike(search_term),
-                    Receipt.text_description.ilike(search_term),
-                    Receipt.store_name.ilike(search_term),
+            matches = SearchService.match_subquery("receipts_fts", search_value)
+            if matches is not None:
+                query = query.join(matches, matches.c.id == Receipt.id)
+                search_rank = matches.c.rank
+            else:
+                search_term = f"%{search_value}%"
+                query = query.filter(
+                    or_(
+                        Receipt.name.ilike(search_term),
+                        Receipt.notes.ilike(search_term),
+                        Receipt.text_description.ilike(search_term),
+                        Receipt.store_name.ilike(search_term),
+                    )
                 )
-            )
 
         # 状态筛选
         if status_str := args.get("status"):
@@ -349,23 +918,162 @@ class ReceiptService:
             except ValueError:
                 pass  # 或者返回错误
 
-        # 排序
-        sort_by = args.get("sort_by", "created_at")
+        # 商品数量、合计金额范围筛选（min_total_jpy / max_item_count 等）
+        for field in ("item_count", "total_jpy", "total_cny"):
+            column = getattr(Receipt, field)
+            for prefix, compare in (("min", column.__ge__), ("max", column.__le__)):
+                value = args.get(f"{prefix}_{field}")
+                if value is None or value == "":
+                    continue
+                try:
+                    query = query.filter(compare(float(value)))
+                except ValueError:
+                    raise ValueError(f"无效的数值: {prefix}_{field}={value}")
+
+        # 排序 - 全文搜索且未指定排序字段时按相关度排序
+        sort_by = args.get("sort_by")
         order = args.get("order", "desc")
-        sort_field = getattr(Receipt, sort_by, Receipt.created_at)
 
-        if order == "asc":
-            query = query.order_by(sort_field.asc())
+        if search_rank is not None and sort_by in (None, "", "relevance"):
+            sort_keys = [(search_rank, False), (Receipt.id, True)]
         else:
-            query = query.order_by(sort_field.desc())
+            if sort_by not in ReceiptService.SORT_FIELDS:
+                sort_by = "created_at"
+            sort_field = getattr(Receipt, sort_by)
+            sort_keys = [(sort_field, order != "asc")]
+
+        per_page = int(args.get("per_page", 20))
+
+        # 游标分页 - 以主键作为排序的最后一级，保证位置唯一
+        if CursorPagination.is_requested(args):
+            if len(sort_keys) == 1:
+                sort_keys.append((Receipt.id, sort_keys[0][1]))
+            page = CursorPagination.paginate(query, sort_keys, args, per_page, "receipts")
+            return page.items, page
+
+        query = query.order_by(
+            *[field.desc() if descending else field.asc() for field, descending in sort_keys]
+        )
 
         # 分页
         page = int(args.get("page", 1))
-        per_page = int(args.get("per_page", 20))
         paginated_query = query.paginate(page=page, per_page=per_page, error_out=False)
 
         return paginated_query.items, paginated_query
 
+    @staticmethod
+    def get_receipt_detail(receipt_id, fields=None):
+        """
+        获取小票及其商品，商品的分类和耐用品信息一并预加载
+
+        Args:
+            receipt_id: 小票ID
+            fields: 需要返回的字段名集合，不包含 items 时不查询商品；为None时返回全部
+        """
+        options = []
+        if fields is None or "items" in fields:
+            options += [
+                selectinload(Receipt.items).selectinload(Item.category),
+                selectinload(Receipt.items).selectinload(Item.durable_info),
+            ]
+        if fields is not None:
+            options.append(
+                build_load_only(
+                    Receipt, fields, ReceiptService._required_columns(fields)
+                )
+            )
+        return Receipt.query.options(*options).get_or_404(receipt_id)
+
+    @staticmethod
+    def refresh_totals(receipt):
+        """根据当前商品重新计算小票的商品数量和合计金额（随调用方一起提交）"""
+        from sqlalchemy import func
+
+        item_count, total_jpy, total_cny = (
+            db.session.query(
+                func.count(Item.id),
+                func.coalesce(func.sum(Item.price_jpy), 0),
+                func.coalesce(func.sum(Item.price_cny), 0),
+            )
+            .filter(Item.receipt_id == receipt.id)
+            .one()
+        )
+        receipt.item_count = item_count
+        receipt.total_jpy = round(total_jpy, 2)
+        receipt.total_cny = round(total_cny, 2)
+
+    @staticmethod
+    def backfill_totals():
+        """
+        按商品表重新计算所有小票的商品数量和合计金额
+
+        Returns:
+            int: 更新的小票数
+        """
+        from sqlalchemy import func, update
+
+        def item_total(expression):
+            return (
+                select(expression)
+                .where(Item.receipt_id == Receipt.id)
+                .scalar_subquery()
+            )
+
+        result = db.session.execute(
+            update(Receipt).values(
+                item_count=item_total(func.count(Item.id)),
+                total_jpy=item_total(
+                    func.round(func.coalesce(func.sum(Item.price_jpy), 0), 2)
+                ),
+                total_cny=item_total(
+                    func.round(func.coalesce(func.sum(Item.price_cny), 0), 2)
+                ),
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def refresh_local_dates(user_timezone=None, batch_size=1000):
+        """按指定时区批量重新计算所有小票的本地交易日期和小时
+
+        Args:
+            user_timezone: 时区字符串，为None时使用当前设定
+            batch_size: 每批更新的记录数
+
+        Returns:
+            int: 更新的小票数量
+        """
+        import pytz
+
+        local_tz = pytz.timezone(user_timezone or get_user_timezone())
+
+        rows = (
+            db.session.query(Receipt.id, Receipt.transaction_time, Receipt.updated_at)
+            .filter(Receipt.transaction_time.isnot(None))
+            .all()
+        )
+
+        mappings = []
+        for receipt_id, transaction_time, updated_at in rows:
+            local_time = pytz.UTC.localize(transaction_time).astimezone(local_tz)
+            mappings.append(
+                {
+                    "id": receipt_id,
+                    "transaction_local_date": local_time.date(),
+                    "transaction_local_hour": local_time.hour,
+                    # 派生列的重算不算作小票修改，保留原修改时间
+                    "updated_at": updated_at,
+                }
+            )
+
+        for start in range(0, len(mappings), batch_size):
+            db.session.bulk_update_mappings(Receipt, mappings[start : start + batch_size])
+        db.session.commit()
+
+        return len(mappings)
+
     @staticmethod
     def update_receipt_from_ai(receipt, ai_data):
         # 更新店铺信息
@@ -434,6 +1142,8 @@ class ReceiptService:
                 )
 
                 db.session.add(new_item)
+
+        ReceiptService.refresh_totals(receipt)
         db.session.commit()
 
 
@@ -489,11 +1199,12 @@ class ItemService:
 
             db.session.add(durable_info)
 
-        # 更新对应小票的最后修改时间
+        # 更新对应小票的最后修改时间、商品数量和合计金额
         if new_item.receipt_id:
             receipt = Receipt.query.get(new_item.receipt_id)
             if receipt:
                 receipt.updated_at = datetime.now(timezone.utc)
+                ReceiptService.refresh_totals(receipt)
 
         db.session.commit()
         return new_item
@@ -552,27 +1263,75 @@ class ItemService:
                     db.session.delete(item.durable_info)
                     item.durable_info = None
 
-        # 更新对应小票的最后修改时间
+        # 更新对应小票的最后修改时间、商品数量和合计金额
         if item.receipt:
             item.receipt.updated_at = datetime.now(timezone.utc)
+            ReceiptService.refresh_totals(item.receipt)
 
         db.session.commit()
         return item
 
     @staticmethod
-    def get_all_items(args):
-        query = Item.query.join(Receipt)
+    def delete_item(item_id):
+        """删除商品项目"""
+        item = Item.query.get_or_404(item_id)
+        receipt = item.receipt
+
+        db.session.delete(item)
+
+        # 更新对应小票的最后修改时间、商品数量和合计金额
+        if receipt:
+            receipt.updated_at = datetime.now(timezone.utc)
+            db.session.flush()
+            ReceiptService.refresh_totals(receipt)
+
+        db.session.commit()
+
+    @staticmethod
+    def _item_load_options(fields=None):
+        """
+        序列化商品需要的加载选项：预加载分类和耐用品信息，避免逐条查询；
+        指定 fields 时只加载需要的列和关联
+        """
+        if fields is None:
+            return [selectinload(Item.category), selectinload(Item.durable_info)]
+
+        options = []
+        required = []
+        if "category" in fields:
+            options.append(selectinload(Item.category))
+        if "category" in fields or "category_path" in fields:
+            required.append("category_id")
+        if "durable_info" in fields:
+            options.append(selectinload(Item.durable_info))
+        options.append(build_load_only(Item, fields, required))
+        return options
+
+    @staticmethod
+    def get_all_items(args, fields=None):
+        """
+        Args:
+            args: 查询参数
+            fields: 需要返回的字段名集合，只查询对应的列和关联；为None时返回全部
+        """
+        query = Item.query.join(Receipt).options(*ItemService._item_load_options(fields))
 
-        # 搜索
+        # 搜索 - 优先使用全文索引
+        search_rank = None
         if search := args.get("search"):
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Item.name_ja.ilike(search_term),
-                    Item.name_zh.ilike(search_term),
-                    Item.notes.ilike(search_term),
+            matches = SearchService.match_subquery("items_fts", search)
+            if matches is not None:
+                query = query.join(matches, matches.c.id == Item.id)
+                search_rank = matches.c.rank
+            else:
+                search_term = f"%{search}%"
+                query = query.filter(
+                    or_(
+                        Item.name_ja.ilike(search_term),
+                        Item.name_zh.ilike(search_term),
+                        Item.notes.ilike(search_term),
+                    )
                 )
-            )
 
         # 特价筛选
         is_special_offer = args.get("is_special_offer")
@@ -623,12 +1382,18 @@ class ItemService:
                 # 筛选属于这些分类的商品
                 query = query.filter(Item.category_id.in_(list(category_ids)))
 
-        # 排序
-        sort_by = args.get("sort_by", "created_at")
+        # 排序 - 全文搜索且未指定排序字段时按相关度排序
+        sort_by = args.get("sort_by") or "created_at"
         order = args.get("order", "desc")
+        if search_rank is not None and not args.get("sort_by"):
+            sort_by = "relevance"
 
         # 根据排序字段选择正确的字段
-        if sort_by == "created_at":
+        if sort_by == "relevance" and search_rank is not None:
+            sort_field = search_rank
+            # bm25 越小越相关
+            order = "asc"
+        elif sort_by == "created_at":
             sort_field = Receipt.created_at
         elif sort_by == "transaction_time":
             sort_field = Receipt.transaction_time
@@ -643,6 +1408,20 @@ class ItemService:
         else:
             sort_field = Receipt.created_at
 
+        per_page = int(args.get("per_page", 12))
+
+        # 游标分页 - 以商品ID作为排序的最后一级，保证位置唯一
+        if CursorPagination.is_requested(args):
+            descending = order != "asc"
+            page = CursorPagination.paginate(
+                query,
+                [(sort_field, descending), (Item.id, descending)],
+                args,
+                per_page,
+                "items",
+            )
+            return page.items, page
+
         if order == "asc":
             query = query.order_by(sort_field.asc())
         else:
@@ -650,7 +1429,6 @@ class ItemService:
 
         # 分页
         page = int(args.get("page", 1))
-        per_page = int(args.get("per_page", 12))
         paginated_query = query.paginate(page=page, per_page=per_page, error_out=False)
 
         return paginated_query.items, paginated_query
@@ -659,46 +1437,88 @@ class ItemService:
 class ExportService:
     """导出服务"""
 
+    # 游标分页未指定每页记录数时的默认值
+    CURSOR_PAGE_SIZE = 1000
+
+    # 导出字段对应的列（category_path 由 category_id 映射得到）
+    EXPORT_COLUMNS = {
+        "receipt_id": Receipt.id,
+        "receipt_name": Receipt.name,
+        "store_name": Receipt.store_name,
+        "store_category": Receipt.store_category,
+        "transaction_time": Receipt.transaction_time,
+        "receipt_created_at": Receipt.created_at,
+        "receipt_status": Receipt.status,
+        "receipt_notes": Receipt.notes,
+        "item_id": Item.id,
+        "item_name_ja": Item.name_ja,
+        "item_name_zh": Item.name_zh,
+        "price_jpy": Item.price_jpy,
+        "price_cny": Item.price_cny,
+        "category_id": Item.category_id,
+        "category_path": Item.category_id,
+        "special_info": Item.special_info,
+        "is_special_offer": Item.is_special_offer,
+        "item_notes": Item.notes,
+    }
+
+    # 导出记录字段顺序（与 ExportRecordSchema 一致）
+    EXPORT_FIELDS = [
+        "receipt_id",
+        "receipt_name",
+        "store_name",
+        "store_category",
+        "transaction_time",
+        "receipt_created_at",
+        "receipt_status",
+        "receipt_notes",
+        "item_id",
+        "item_name_ja",
+        "item_name_zh",
+        "price_jpy",
+        "price_cny",
+        "category_id",
+        "category_path",
+        "special_info",
+        "is_special_offer",
+        "item_notes",
+    ]
+
     @staticmethod
-    def get_export_records(args):
+    def get_category_path_map():
         """
-        获取导出记录，将小票和商品信息组装成扁平化记录
-
-        Args:
-            args: 查询参数，包含分页、时间范围等筛选条件
+        一次查询所有分类，预先计算每个分类的完整路径
 
         Returns:
-            tuple: (记录列表, 分页信息)
+            dict: {分类ID: "一级 > 二级 > 三级"}
         """
-        # 创建联合查询
-        query = db.session.query(Receipt, Item).join(
-            Item, Receipt.id == Item.receipt_id
-        )
+        rows = db.session.query(Category.id, Category.name, Category.parent_id).all()
+        nodes = {row.id: (row.name, row.parent_id) for row in rows}
 
-        # 时间范围筛选 - 需要将用户本地时间转换为UTC时间进行比较
-        if start_date := args.get("start_date"):
-            try:
-                start_datetime = datetime.fromisoformat(start_date)
-                # 将用户本地时间转换为UTC时间
-                start_datetime_utc = convert_local_to_utc(start_datetime)
-                query = query.filter(Receipt.transaction_time >= start_datetime_utc)
-            except ValueError:
-                pass
+        path_map = {}
 
-        if end_date := args.get("end_date"):
-            try:
-                end_datetime = datetime.fromisoformat(end_date)
-                # 包含完整的最后一天：将结束日期设为次日开始时间，然后使用小于比较
-                if end_datetime.time() == datetime.min.time():
-                    # 如果只有日期没有时间，则包含整天
-                    end_datetime = end_datetime.replace(
-                        hour=23, minute=59, second=59, microsecond=999999
-                    )
-                # 将用户本地时间转换为UTC时间
-                end_datetime_utc = convert_local_to_utc(end_datetime)
-                query = query.filter(Receipt.transaction_time <= end_datetime_utc)
-            except ValueError:
-                pass
+        def resolve(category_id):
+            if category_id in path_map:
+                return path_map[category_id]
+            name, parent_id = nodes[category_id]
+            if parent_id is not None and parent_id in nodes:
+                path = f"{resolve(parent_id)} > {name}"
+            else:
+                path = name
+            path_map[category_id] = path
+            return path
+
+        for category_id in nodes:
+            resolve(category_id)
+        return path_map
+
+    @staticmethod
+    def _apply_export_filters(query, args):
+        """为小票-商品联合查询应用筛选和排序条件"""
+        # 时间范围筛选 - 按用户本地日期比较
+        query = query.filter(
+            *build_date_range_filters(args.get("start_date"), args.get("end_date"))
+        )
 
         # 店铺筛选
         if store_name := args.get("store_name"):
@@ -746,19 +1566,49 @@ class ExportService:
             except ValueError:
                 pass
 
-        # 搜索
+        # 搜索 - 优先使用全文索引
         if search := args.get("search"):
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Receipt.name.ilike(search_term),
-                    Receipt.store_name.ilike(search_term),
-                    Item.name_ja.ilike(search_term),
-                    Item.name_zh.ilike(search_term),
-                )
+            receipt_matches = SearchService.match_subquery(
+                "receipts_fts", search, ["name", "store_name"]
             )
+            item_matches = SearchService.match_subquery(
+                "items_fts", search, ["name_ja", "name_zh"]
+            )
+            if receipt_matches is not None and item_matches is not None:
+                query = query.filter(
+                    or_(
+                        Receipt.id.in_(select(receipt_matches.c.id)),
+                        Item.id.in_(select(item_matches.c.id)),
+                    )
+                )
+            else:
+                search_term = f"%{search}%"
+                query = query.filter(
+                    or_(
+                        Receipt.name.ilike(search_term),
+                        Receipt.store_name.ilike(search_term),
+                        Item.name_ja.ilike(search_term),
+                        Item.name_zh.ilike(search_term),
+                    )
+                )
 
         # 排序
+        sort_field, descending = ExportService._get_sort_key(args)
+        if descending:
+            query = query.order_by(sort_field.desc())
+        else:
+            query = query.order_by(sort_field.asc())
+
+        return query
+
+    @staticmethod
+    def _get_sort_key(args):
+        """
+        导出记录的排序字段
+
+        Returns:
+            tuple: (排序列, 是否降序)
+        """
         sort_by = args.get("sort_by", "transaction_time")
         order = args.get("order", "desc")
 
@@ -775,10 +1625,35 @@ class ExportService:
         else:
             sort_field = Receipt.transaction_time
 
-        if order == "asc":
-            query = query.order_by(sort_field.asc())
-        else:
-            query = query.order_by(sort_field.desc())
+        return sort_field, order != "asc"
+
+    @staticmethod
+    def get_export_records(args, fields=None):
+        """
+        获取导出记录，将小票和商品信息组装成扁平化记录
+
+        Args:
+            args: 查询参数，包含分页、时间范围等筛选条件
+            fields: 需要返回的字段名集合，只查询对应的列；为None时返回全部字段
+
+        Returns:
+            tuple: (记录列表, 分页信息)
+        """
+        selected = [
+            name
+            for name in ExportService.EXPORT_FIELDS
+            if fields is None or name in fields
+        ]
+
+        # 创建联合查询，只查询需要的列
+        query = (
+            db.session.query(
+                *[ExportService.EXPORT_COLUMNS[name].label(name) for name in selected]
+            )
+            .select_from(Receipt)
+            .join(Item, Receipt.id == Item.receipt_id)
+        )
+        query = ExportService._apply_export_filters(query, args)
 
         # 分页
         page = int(args.get("page", 1))
@@ -786,71 +1661,183 @@ class ExportService:
         if per_page is not None:
             per_page = int(per_page)
 
-        # 如果没有指定每页记录数，则不做限制
-        if per_page is None:
-            per_page = 999999  # 设置一个很大的数值表示无限制
+        if CursorPagination.is_requested(args):
+            # 游标分页 - 以商品ID作为排序的最后一级，保证位置唯一
+            sort_field, descending = ExportService._get_sort_key(args)
+            pagination = CursorPagination.paginate(
+                query.order_by(None),
+                [(sort_field, descending), (Item.id, descending)],
+                args,
+                per_page or ExportService.CURSOR_PAGE_SIZE,
+                "export",
+            )
+            results = pagination.items
+        else:
+            # 如果没有指定每页记录数，则不做限制
+            if per_page is None:
+                per_page = 999999  # 设置一个很大的数值表示无限制
 
-        # 计算偏移量
-        offset = (page - 1) * per_page
+            # 计算偏移量
+            offset = (page - 1) * per_page
 
-        # 获取总记录数
-        total = query.count()
+            # 获取总记录数
+            total = query.count()
 
-        # 应用分页
-        results = query.offset(offset).limit(per_page).all()
+            # 应用分页
+            results = query.offset(offset).limit(per_page).all()
 
-        # 创建分页信息对象
-        class PaginationInfo:
-            def __init__(self, page, per_page, total, items):
-                self.page = page
-                self.per_page = per_page
-                self.total = total
-                self.pages = (total + per_page - 1) // per_page
-                self.items = items
+            # 创建分页信息对象
+            class PaginationInfo:
+                def __init__(self, page, per_page, total, items):
+                    self.page = page
+                    self.per_page = per_page
+                    self.total = total
+                    self.pages = (total + per_page - 1) // per_page
+                    self.items = items
 
-        pagination = PaginationInfo(page, per_page, total, results)
+            pagination = PaginationInfo(page, per_page, total, results)
+
+        # 预先计算分类路径，避免逐行查询祖先分类
+        category_paths = None
+        if "category_path" in selected:
+            category_paths = ExportService.get_category_path_map()
 
         # 将查询结果转换为扁平化记录
         export_records = []
-        for receipt, item in results:
-            # 获取分类路径
-            category_path = ""
-            category_id = None
-            if item.category:
-                category_path = " > ".join(item.category.get_full_path_list())
-                category_id = item.category.id
-
-            record = {
-                # 小票信息
-                "receipt_id": receipt.id,
-                "receipt_name": receipt.name,
-                "store_name": receipt.store_name,
-                "store_category": receipt.store_category,
-                "transaction_time": receipt.transaction_time,
-                "receipt_created_at": receipt.created_at,
-                "receipt_status": receipt.status.value if receipt.status else None,
-                "receipt_notes": receipt.notes,
-                # 商品信息
-                "item_id": item.id,
-                "item_name_ja": item.name_ja,
-                "item_name_zh": item.name_zh,
-                "price_jpy": item.price_jpy,
-                "price_cny": item.price_cny,
-                "category_id": category_id,
-                "category_path": category_path,
-                "special_info": item.special_info,
-                "is_special_offer": item.is_special_offer,
-                "item_notes": item.notes,
-            }
+        for row in results:
+            record = dict(zip(selected, row))
+            if "receipt_status" in record:
+                status = record["receipt_status"]
+                record["receipt_status"] = status.value if status else None
+            if category_paths is not None:
+                record["category_path"] = category_paths.get(record["category_path"], "")
             export_records.append(record)
 
         return export_records, pagination
 
+    @staticmethod
+    def count_export_rows(args):
+        """统计符合筛选条件的导出记录数"""
+        query = db.session.query(Item.id).join(Receipt, Receipt.id == Item.receipt_id)
+        query = ExportService._apply_export_filters(query, args).order_by(None)
+        return query.count()
+
+    @staticmethod
+    def build_export_rows_query(args, changed_since=None):
+        """
+        构建只查询导出所需列的联合查询
+
+        列顺序与 EXPORT_FIELDS 一致，但不含 category_path（由 category_id 映射得到）
+
+        Args:
+            args: 筛选、排序参数
+            changed_since: 只返回此数据版本号（int）或时间（UTC）之后商品或所属
+                小票有修改的记录
+        """
+        query = db.session.query(
+            *[
+                ExportService.EXPORT_COLUMNS[name]
+                for name in ExportService.EXPORT_FIELDS
+                if name != "category_path"
+            ]
+        ).join(Item, Receipt.id == Item.receipt_id)
+
+        if changed_since is not None:
+            # 小票字段会展开到每条商品记录中，小票修改时其下商品全部重新导出
+            if isinstance(changed_since, int):
+                receipt_changed = Receipt.change_version > changed_since
+                item_changed = Item.change_version > changed_since
+            else:
+                receipt_changed = Receipt.updated_at > changed_since
+                item_changed = Item.updated_at > changed_since
+            changed_receipts = select(Receipt.id).where(receipt_changed)
+            query = query.filter(
+                or_(item_changed, Item.receipt_id.in_(changed_receipts))
+            )
+
+        return ExportService._apply_export_filters(query, args)
+
+    @staticmethod
+    def iter_export_rows(args, batch_size=1000, changed_since=None):
+        """
+        流式生成导出记录，每次产出一批按 EXPORT_FIELDS 排列的元组
+
+        只查询所需的列并通过 yield_per 分批从游标读取，
+        内存占用与导出总行数无关。时间已转换为用户本地时间的ISO字符串。
+
+        Args:
+            args: 查询参数，与 get_export_records 相同（忽略分页参数）
+            batch_size: 每批读取的行数
+            changed_since: 只导出此数据版本号或时间（UTC）之后有修改的记录
+
+        Yields:
+            list: 记录元组列表
+        """
+        category_paths = ExportService.get_category_path_map()
+        convert_to_local = make_utc_to_local_converter()
+        query = ExportService.build_export_rows_query(args, changed_since)
+
+        def to_local(value):
+            if value is None:
+                return None
+            return convert_to_local(value).isoformat()
+
+        batch = []
+        for row in query.yield_per(batch_size):
+            (
+                receipt_id,
+                receipt_name,
+                store_name,
+                store_category,
+                transaction_time,
+                created_at,
+                status,
+                receipt_notes,
+                item_id,
+                name_ja,
+                name_zh,
+                price_jpy,
+                price_cny,
+                category_id,
+                special_info,
+                is_special_offer,
+                item_notes,
+            ) = row
+            batch.append(
+                (
+                    receipt_id,
+                    receipt_name,
+                    store_name,
+                    store_category,
+                    to_local(transaction_time),
+                    to_local(created_at),
+                    status.value if status else None,
+                    receipt_notes,
+                    item_id,
+                    name_ja,
+                    name_zh,
+                    price_jpy,
+                    price_cny,
+                    category_id,
+                    category_paths.get(category_id, ""),
+                    special_info,
+                    is_special_offer,
+                    item_notes,
+                )
+            )
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
 
 class AnalyticsService:
     """数据分析服务"""
 
     @staticmethod
+    @analytics_cache.cached("dashboard")
     def get_dashboard_overview(args):
         """
         获取消费总览仪表盘数据
@@ -872,85 +1859,22 @@ class AnalyticsService:
         if end_date is not None and not isinstance(end_date, str):
             end_date = str(end_date)
 
+        # 日期范围筛选条件（按用户本地日期）
+        date_filters = build_date_range_filters(start_date, end_date)
+
         receipt_query = Receipt.query.filter(
-            Receipt.status == RecognitionStatus.SUCCESS
+            Receipt.status == RecognitionStatus.SUCCESS, *date_filters
         )
         item_query = (
             db.session.query(Item)
             .join(Receipt)
-            .filter(Receipt.status == RecognitionStatus.SUCCESS)
+            .filter(Receipt.status == RecognitionStatus.SUCCESS, *date_filters)
         )
 
-        if start_date and isinstance(start_date, str):
-            try:
-                start_datetime = datetime.fromisoformat(start_date)
-                # 将用户本地时间转换为UTC时间
-                start_datetime_utc = convert_local_to_utc(start_datetime)
-                receipt_query = receipt_query.filter(
-                    Receipt.transaction_time >= start_datetime_utc
-                )
-                item_query = item_query.filter(
-                    Receipt.transaction_time >= start_datetime_utc
-                )
-            except (ValueError, TypeError):
-                pass
-
-        if end_date and isinstance(end_date, str):
-            try:
-                end_datetime = datetime.fromisoformat(end_date)
-                # 包含完整的最后一天：将结束日期设为当天的最后时刻
-                if end_datetime.time() == datetime.min.time():
-                    # 如果只有日期没有时间，则包含整天
-                    end_datetime = end_datetime.replace(
-                        hour=23, minute=59, second=59, microsecond=999999
-                    )
-                # 将用户本地时间转换为UTC时间
-                end_datetime_utc = convert_local_to_utc(end_datetime)
-                receipt_query = receipt_query.filter(
-                    Receipt.transaction_time <= end_datetime_utc
-                )
-                item_query = item_query.filter(Receipt.transaction_time <= end_datetime_utc)
-            except (ValueError, TypeError):
-                pass
-
         # 总支出（日元和人民币）
         if use_amortization:
             # 使用均摊模式，需要获取所有商品数据进行计算
-            items_query = (
-                db.session.query(Item)
-                .join(Receipt)
-                .filter(Receipt.status == RecognitionStatus.SUCCESS)
-            )
-
-            if start_date and isinstance(start_date, str):
-                try:
-                    start_datetime = datetime.fromisoformat(start_date)
-                    # 将用户本地时间转换为UTC时间
-                    start_datetime_utc = convert_local_to_utc(start_datetime)
-                    items_query = items_query.filter(
-                        Receipt.transaction_time >= start_datetime_utc
-                    )
-                except (ValueError, TypeError):
-                    pass
-
-            if end_date and isinstance(end_date, str):
-                try:
-                    end_datetime = datetime.fromisoformat(end_date)
-                    # 包含完整的最后一天：将结束日期设为当天的最后时刻
-                    if end_datetime.time() == datetime.min.time():
-                        # 如果只有日期没有时间，则包含整天
-                        end_datetime = end_datetime.replace(
-                            hour=23, minute=59, second=59, microsecond=999999
-                        )
-                    # 将用户本地时间转换为UTC时间
-                    end_datetime_utc = convert_local_to_utc(end_datetime)
-                    items_query = items_query.filter(
-                        Receipt.transaction_time <= end_datetime_utc
-                    )
-                except (ValueError, TypeError):
-                    pass
-
-            items = items_query.all()
+            items = item_query.all()
             amortized_spending = (
                 AnalyticsService._get_amortized_spending_for_date_range(
                     items, start_date, end_date, use_amortization
@@ -960,53 +1884,11 @@ class AnalyticsService:
             total_cny = amortized_spending["cny"]
         else:
             # 传统模式，直接查询价格总和
-            total_spending_jpy = (
-                db.session.query(func.sum(Item.price_jpy))
-                .join(Receipt)
-                .filter(Receipt.status == RecognitionStatus.SUCCESS)
-            )
-            total_spending_cny = (
-                db.session.query(func.sum(Item.price_cny))
-                .join(Receipt)
-                .filter(Receipt.status == RecognitionStatus.SUCCESS)
-            )
-
-            if start_date and isinstance(start_date, str):
-                try:
-                    start_datetime = datetime.fromisoformat(start_date)
-                    # 将用户本地时间转换为UTC时间
-                    start_datetime_utc = convert_local_to_utc(start_datetime)
-                    total_spending_jpy = total_spending_jpy.filter(
-                        Receipt.transaction_time >= start_datetime_utc
-                    )
-                    total_spending_cny = total_spending_cny.filter(
-                        Receipt.transaction_time >= start_datetime_utc
-                    )
-                except (ValueError, TypeError):
-                    pass
-
-            if end_date and isinstance(end_date, str):
-                try:
-                    end_datetime = datetime.fromisoformat(end_date)
-                    # 包含完整的最后一天：将结束日期设为当天的最后时刻
-                    if end_datetime.time() == datetime.min.time():
-                        # 如果只有日期没有时间，则包含整天
-                        end_datetime = end_datetime.replace(
-                            hour=23, minute=59, second=59, microsecond=999999
-                        )
-                    # 将用户本地时间转换为UTC时间
-                    end_datetime_utc = convert_local_to_utc(end_datetime)
-                    total_spending_jpy = total_spending_jpy.filter(
-                        Receipt.transaction_time <= end_datetime_utc
-                    )
-                    total_spending_cny = total_spending_cny.filter(
-                        Receipt.transaction_time <= end_datetime_utc
-                    )
-                except (ValueError, TypeError):
-                    pass
-
-            total_jpy = total_spending_jpy.scalar() or 0
-            total_cny = total_spending_cny.scalar() or 0
+            total_jpy, total_cny = item_query.with_entities(
+                func.sum(Item.price_jpy), func.sum(Item.price_cny)
+            ).one()
+            total_jpy = total_jpy or 0
+            total_cny = total_cny or 0
 
         # 小票数量
         receipt_count = receipt_query.count()
@@ -1014,61 +1896,23 @@ class AnalyticsService:
         # 商品数量
         item_count = item_query.count()
 
-        # 时间跨度（根据交易时间计算最早和最晚的交易时间差）
+        # 时间跨度（根据本地交易日期计算最早和最晚的日期差）
         # 如果指定了时间范围（开始或结束日期任一），计算该范围内的交易时间跨度
         # 如果没有指定任何时间范围，使用所有数据的范围
-        if start_date or end_date:
-            # 有指定时间范围，计算该范围内的交易时间跨度
-            date_range = db.session.query(
-                func.min(Receipt.transaction_time), func.max(Receipt.transaction_time)
-            ).filter(Receipt.status == RecognitionStatus.SUCCESS)
-
-            if start_date and isinstance(start_date, str):
-                try:
-                    start_datetime = datetime.fromisoformat(start_date)
-                    # 将用户本地时间转换为UTC时间
-                    start_datetime_utc = convert_local_to_utc(start_datetime)
-                    date_range = date_range.filter(
-                        Receipt.transaction_time >= start_datetime_utc
-                    )
-                except (ValueError, TypeError):
-                    pass
-
-            if end_date and isinstance(end_date, str):
-                try:
-                    end_datetime = datetime.fromisoformat(end_date)
-                    # 包含完整的最后一天：将结束日期设为当天的最后时刻
-                    if end_datetime.time() == datetime.min.time():
-                        # 如果只有日期没有时间，则包含整天
-                        end_datetime = end_datetime.replace(
-                            hour=23, minute=59, second=59, microsecond=999999
-                        )
-                    # 将用户本地时间转换为UTC时间
-                    end_datetime_utc = convert_local_to_utc(end_datetime)
-                    date_range = date_range.filter(
-                        Receipt.transaction_time <= end_datetime_utc
-                    )
-                except (ValueError, TypeError):
-                    pass
-
-            result = date_range.first()
-            min_date, max_date = result if result else (None, None)
-        else:
-            # 没有指定任何时间范围，使用所有数据的范围
-            result = (
-                db.session.query(
-                    func.min(Receipt.transaction_time),
-                    func.max(Receipt.transaction_time),
-                )
-                .filter(Receipt.status == RecognitionStatus.SUCCESS)
-                .first()
+        result = (
+            db.session.query(
+                func.min(Receipt.transaction_local_date),
+                func.max(Receipt.transaction_local_date),
             )
-            min_date, max_date = result if result else (None, None)
+            .filter(Receipt.status == RecognitionStatus.SUCCESS, *date_filters)
+            .first()
+        )
+        min_date, max_date = result if result else (None, None)
 
         time_span = 0
         if min_date and max_date:
             # 计算实际的天数差异
-            time_span = (max_date.date() - min_date.date()).days + 1
+            time_span = (max_date - min_date).days + 1
 
         # 日均开销
         daily_avg_jpy = total_jpy / time_span if time_span > 0 else 0
@@ -1096,6 +1940,7 @@ class AnalyticsService:
         }
 
     @staticmethod
+    @analytics_cache.cached("trend")
     def get_spending_trend(args):
         """
         获取消费趋势数据
@@ -1122,33 +1967,11 @@ class AnalyticsService:
             .join(Item)
             .filter(
                 Receipt.status == RecognitionStatus.SUCCESS,
-                Receipt.transaction_time.isnot(None),  # 排除空值
+                Receipt.transaction_local_date.isnot(None),  # 排除空值
             )
         )
 
-        if start_date and isinstance(start_date, str):
-            try:
-                start_datetime = datetime.fromisoformat(start_date)
-                # 将用户本地时间转换为UTC时间
-                start_datetime_utc = convert_local_to_utc(start_datetime)
-                query = query.filter(Receipt.transaction_time >= start_datetime_utc)
-            except (ValueError, TypeError):
-                pass
-
-        if end_date and isinstance(end_date, str):
-            try:
-                end_datetime = datetime.fromisoformat(end_date)
-                # 包含完整的最后一天：将结束日期设为当天的最后时刻
-                if end_datetime.time() == datetime.min.time():
-                    # 如果只有日期没有时间，则包含整天
-                    end_datetime = end_datetime.replace(
-                        hour=23, minute=59, second=59, microsecond=999999
-                    )
-                # 将用户本地时间转换为UTC时间
-                end_datetime_utc = convert_local_to_utc(end_datetime)
-                query = query.filter(Receipt.transaction_time <= end_datetime_utc)
-            except (ValueError, TypeError):
-                pass
+        query = query.filter(*build_date_range_filters(start_date, end_date))
 
         # 商品分类筛选
         # 商品分类筛选 - 支持搜索三级分类中的任意一级
@@ -1200,8 +2023,8 @@ class AnalyticsService:
             # 首先按日期分组收集商品
             items_by_date = {}
             for receipt, item in results:
-                if receipt.transaction_time:
-                    date_key = receipt.transaction_time.date()
+                if receipt.transaction_local_date:
+                    date_key = receipt.transaction_local_date
 
                     # 在均摊模式下，过滤掉不在均摊期内的耐用品
                     if item.durable_info:
@@ -1243,8 +2066,8 @@ class AnalyticsService:
         else:
             # 传统模式：直接使用原始价格
             for receipt, item in results:
-                if receipt.transaction_time:
-                    date_key = receipt.transaction_time.date()
+                if receipt.transaction_local_date:
+                    date_key = receipt.transaction_local_date
                     if date_key not in daily_data:
                         daily_data[date_key] = {
                             "total_jpy": 0,
@@ -1274,6 +2097,7 @@ class AnalyticsService:
         return trend_data
 
     @staticmethod
+    @analytics_cache.cached("daily_items")
     def get_daily_items(date, args=None):
         """
         获取指定日期的商品列表
@@ -1298,21 +2122,12 @@ class AnalyticsService:
             durable_items = []
 
             # 1. 获取当日购买的所有商品（包括耐用品和常规商品）
-            start_datetime = datetime.combine(target_date, datetime.min.time())
-            end_datetime = datetime.combine(target_date, datetime.max.time())
-            
-            # 将用户本地时间转换为UTC时间
-            start_datetime_utc = convert_local_to_utc(start_datetime)
-            end_datetime_utc = convert_local_to_utc(end_datetime)
-
             daily_query = (
                 db.session.query(Item)
                 .join(Receipt)
                 .filter(
                     Receipt.status == RecognitionStatus.SUCCESS,
-                    Receipt.transaction_time.is_not(None),
-                    Receipt.transaction_time >= start_datetime_utc,
-                    Receipt.transaction_time <= end_datetime_utc,
+                    Receipt.transaction_local_date == target_date,
                 )
             )
 
@@ -1367,21 +2182,12 @@ class AnalyticsService:
             items = combined_items
         else:
             # 常规模式下，只查询当日购买的商品
-            start_datetime = datetime.combine(target_date, datetime.min.time())
-            end_datetime = datetime.combine(target_date, datetime.max.time())
-            
-            # 将用户本地时间转换为UTC时间
-            start_datetime_utc = convert_local_to_utc(start_datetime)
-            end_datetime_utc = convert_local_to_utc(end_datetime)
-
             query = (
                 db.session.query(Item)
                 .join(Receipt)
                 .filter(
                     Receipt.status == RecognitionStatus.SUCCESS,
-                    Receipt.transaction_time.is_not(None),
-                    Receipt.transaction_time >= start_datetime_utc,
-                    Receipt.transaction_time <= end_datetime_utc,
+                    Receipt.transaction_local_date == target_date,
                 )
             )
 
@@ -1483,6 +2289,7 @@ class AnalyticsService:
         return items_data
 
     @staticmethod
+    @analytics_cache.cached("category_analysis")
     def get_category_analysis(args):
         """
         获取分类支出分析数据
@@ -1511,29 +2318,7 @@ class AnalyticsService:
         )
 
         # 日期筛选
-        if start_date and isinstance(start_date, str):
-            try:
-                start_datetime = datetime.fromisoformat(start_date)
-                # 将用户本地时间转换为UTC时间
-                start_datetime_utc = convert_local_to_utc(start_datetime)
-                query = query.filter(Receipt.transaction_time >= start_datetime_utc)
-            except (ValueError, TypeError):
-                pass
-
-        if end_date and isinstance(end_date, str):
-            try:
-                end_datetime = datetime.fromisoformat(end_date)
-                # 包含完整的最后一天：将结束日期设为当天的最后时刻
-                if end_datetime.time() == datetime.min.time():
-                    # 如果只有日期没有时间，则包含整天
-                    end_datetime = end_datetime.replace(
-                        hour=23, minute=59, second=59, microsecond=999999
-                    )
-                # 将用户本地时间转换为UTC时间
-                end_datetime_utc = convert_local_to_utc(end_datetime)
-                query = query.filter(Receipt.transaction_time <= end_datetime_utc)
-            except (ValueError, TypeError):
-                pass
+        query = query.filter(*build_date_range_filters(start_date, end_date))
 
         # 根据层级和父分类进行筛选
         if category_level == "1":
@@ -1673,6 +2458,7 @@ class AnalyticsService:
         }
 
     @staticmethod
+    @analytics_cache.cached("category_items")
     def get_category_items(category, category_level="1", args=None):
         """
         获取指定分类的商品列表
@@ -1701,29 +2487,7 @@ class AnalyticsService:
             .filter(Receipt.status == RecognitionStatus.SUCCESS)
         )
 
-        if start_date and isinstance(start_date, str):
-            try:
-                start_datetime = datetime.fromisoformat(start_date)
-                # 将用户本地时间转换为UTC时间
-                start_datetime_utc = convert_local_to_utc(start_datetime)
-                query = query.filter(Receipt.transaction_time >= start_datetime_utc)
-            except (ValueError, TypeError):
-                pass
-
-        if end_date and isinstance(end_date, str):
-            try:
-                end_datetime = datetime.fromisoformat(end_date)
-                # 包含完整的最后一天：将结束日期设为当天的最后时刻
-                if end_datetime.time() == datetime.min.time():
-                    # 如果只有日期没有时间，则包含整天
-                    end_datetime = end_datetime.replace(
-                        hour=23, minute=59, second=59, microsecond=999999
-                    )
-                # 将用户本地时间转换为UTC时间
-                end_datetime_utc = convert_local_to_utc(end_datetime)
-                query = query.filter(Receipt.transaction_time <= end_datetime_utc)
-            except (ValueError, TypeError):
-                pass
+        query = query.filter(*build_date_range_filters(start_date, end_date))
 
         # 根据分类层级筛选
         if category_level == "1":
@@ -1947,6 +2711,7 @@ class DataMiningService:
     """数据挖掘服务"""
 
     @staticmethod
+    @analytics_cache.cached("category_tree")
     def get_category_tree(args):
         """
         获取分类树结构数据
@@ -1972,29 +2737,7 @@ class DataMiningService:
             .filter(Receipt.status == RecognitionStatus.SUCCESS)
         )
 
-        if start_date and isinstance(start_date, str):
-            try:
-                start_datetime = datetime.fromisoformat(start_date)
-                # 将用户本地时间转换为UTC时间
-                start_datetime_utc = convert_local_to_utc(start_datetime)
-                query = query.filter(Receipt.transaction_time >= start_datetime_utc)
-            except (ValueError, TypeError):
-                pass
-
-        if end_date and isinstance(end_date, str):
-            try:
-                end_datetime = datetime.fromisoformat(end_date)
-                # 包含完整的最后一天：将结束日期设为当天的最后时刻
-                if end_datetime.time() == datetime.min.time():
-                    # 如果只有日期没有时间，则包含整天
-                    end_datetime = end_datetime.replace(
-                        hour=23, minute=59, second=59, microsecond=999999
-                    )
-                # 将用户本地时间转换为UTC时间
-                end_datetime_utc = convert_local_to_utc(end_datetime)
-                query = query.filter(Receipt.transaction_time <= end_datetime_utc)
-            except (ValueError, TypeError):
-                pass
+        query = query.filter(*build_date_range_filters(start_date, end_date))
 
         # 获取所有分类数据
         items = query.all()
@@ -2079,6 +2822,7 @@ class DataMiningService:
         return convert_to_list(category_tree)
 
     @staticmethod
+    @analytics_cache.cached("categories_comparison")
     def get_categories_comparison_data(category_selections, args):
         """
         获取多个分类选择的对比数据
@@ -2117,33 +2861,11 @@ class DataMiningService:
                 .join(Item)
                 .filter(
                     Receipt.status == RecognitionStatus.SUCCESS,
-                    Receipt.transaction_time.isnot(None),
+                    Receipt.transaction_local_date.isnot(None),
                 )
             )
 
-            if start_date and isinstance(start_date, str):
-                try:
-                    start_datetime = datetime.fromisoformat(start_date)
-                    # 将用户本地时间转换为UTC时间
-                    start_datetime_utc = convert_local_to_utc(start_datetime)
-                    query = query.filter(Receipt.transaction_time >= start_datetime_utc)
-                except (ValueError, TypeError):
-                    pass
-
-            if end_date and isinstance(end_date, str):
-                try:
-                    end_datetime = datetime.fromisoformat(end_date)
-                    # 包含完整的最后一天：将结束日期设为当天的最后时刻
-                    if end_datetime.time() == datetime.min.time():
-                        # 如果只有日期没有时间，则包含整天
-                        end_datetime = end_datetime.replace(
-                            hour=23, minute=59, second=59, microsecond=999999
-                        )
-                    # 将用户本地时间转换为UTC时间
-                    end_datetime_utc = convert_local_to_utc(end_datetime)
-                    query = query.filter(Receipt.transaction_time <= end_datetime_utc)
-                except (ValueError, TypeError):
-                    pass
+            query = query.filter(*build_date_range_filters(start_date, end_date))
 
             # 构建分类筛选条件
             category_filters = []
@@ -2199,8 +2921,8 @@ class DataMiningService:
             daily_data = {}
 
             for receipt, item in results:
-                if receipt.transaction_time:
-                    date_key = receipt.transaction_time.date()
+                if receipt.transaction_local_date:
+                    date_key = receipt.transaction_local_date
                     if date_key not in daily_data:
                         daily_data[date_key] = {
                             "total_cny": 0,
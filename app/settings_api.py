@@ -3,6 +3,7 @@ import os
 import tempfile
 from flask import Blueprint, jsonify, request, send_file
 from .settings_service import SettingsService
+from .image_gc_service import ImageGCService
 
 settings_bp = Blueprint("settings_api", __name__, url_prefix="/api")
 
@@ -63,6 +64,26 @@ def get_system_info():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@settings_bp.route("/image-gc", methods=["GET"])
+def get_image_gc_report():
+    """孤立图片报告（不删除）"""
+    try:
+        report = ImageGCService.collect(dry_run=True)
+        return jsonify({"success": True, "data": report})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@settings_bp.route("/image-gc", methods=["POST"])
+def run_image_gc():
+    """回收孤立图片"""
+    try:
+        report = ImageGCService.collect(dry_run=False)
+        return jsonify({"success": True, "data": report})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 @settings_bp.route("/backup", methods=["POST"])
 def create_backup():
     """创建备份"""
@@ -1,13 +1,18 @@
 # app/settings_service.py
 import os
 import shutil
+import sqlite3
 import zipfile
 import tempfile
 from datetime import datetime
 from flask import current_app
+from sqlalchemy import text
 from .database import db
 from .models import Receipt, Item
 from .category_models import Category
+from .cache_service import DataVersion
+from .schema_service import SchemaService
+from .storage_service import StorageService, StorageLedger
 
 
 class SettingsService:
@@ -80,12 +85,22 @@ class SettingsService:
             except pytz.exceptions.UnknownTimeZoneError:
                 return False, f"无效的时区: {timezone}"
 
+            previous_timezone = ConfigManager.load_settings().get("user_timezone")
+
             # 只保存时区相关设定
             timezone_settings = {
                 "user_timezone": timezone,
             }
 
-            return ConfigManager.save_settings(timezone_settings)
+            success, message = ConfigManager.save_settings(timezone_settings)
+            if success and timezone != previous_timezone:
+                from .services import ReceiptService
+
+                # 时区变更后重新计算所有小票的本地交易日期
+                ReceiptService.refresh_local_dates(timezone)
+                # 时区影响按日分组的分析结果
+                DataVersion.bump()
+            return success, message
 
         except Exception as e:
             return False, f"保存时区设定失败: {str(e)}"
@@ -112,32 +127,25 @@ class SettingsService:
             receipt_count = Receipt.query.count()
             item_count = Item.query.count()
 
-            # 计算存储使用情况
+            # 存储使用情况（读取存储台账，不遍历文件）
             upload_folder = current_app.config.get("UPLOAD_FOLDER", "")
-            storage_usage = "未知"
-
-            if upload_folder and os.path.exists(upload_folder):
-                total_size = 0
-                for dirpath, dirnames, filenames in os.walk(upload_folder):
-                    for f in filenames:
-                        fp = os.path.join(dirpath, f)
-                        if os.path.exists(fp):
-                            total_size += os.path.getsize(fp)
-
-                # 转换为可读格式
-                if total_size > 1024 * 1024 * 1024:  # GB
-                    storage_usage = f"{total_size / (1024 * 1024 * 1024):.2f} GB"
-                elif total_size > 1024 * 1024:  # MB
-                    storage_usage = f"{total_size / (1024 * 1024):.2f} MB"
-                elif total_size > 1024:  # KB
-                    storage_usage = f"{total_size / 1024:.2f} KB"
-                else:
-                    storage_usage = f"{total_size} B"
+            image_count, total_size = StorageLedger.get_usage()
+
+            # 转换为可读格式
+            if total_size > 1024 * 1024 * 1024:  # GB
+                storage_usage = f"{total_size / (1024 * 1024 * 1024):.2f} GB"
+            elif total_size > 1024 * 1024:  # MB
+                storage_usage = f"{total_size / (1024 * 1024):.2f} MB"
+            elif total_size > 1024:  # KB
+                storage_usage = f"{total_size / 1024:.2f} KB"
+            else:
+                storage_usage = f"{total_size} B"
 
             return {
                 "receipt_count": receipt_count,
                 "item_count": item_count,
                 "storage_usage": storage_usage,
+                "image_count": image_count,
                 "upload_path": upload_folder,
             }
 
@@ -168,14 +176,13 @@ class SettingsService:
                     "sqlite:///", ""
                 )
                 if db_path and os.path.exists(db_path):
-                    shutil.copy2(db_path, os.path.join(backup_dir, "hamster.db"))
+                    SettingsService._copy_database(
+                        os.path.join(backup_dir, "hamster.db"), to_backup=True
+                    )
 
             # 备份图片文件
             if options.get("include_images", True):
-                upload_folder = current_app.config.get("UPLOAD_FOLDER", "")
-                if upload_folder and os.path.exists(upload_folder):
-                    images_dir = os.path.join(backup_dir, "uploads")
-                    shutil.copytree(upload_folder, images_dir)
+                StorageService.backup_to(os.path.join(backup_dir, "uploads"))
 
             # 备份设定
             if options.get("include_settings", True):
@@ -203,6 +210,30 @@ class SettingsService:
         except Exception as e:
             return False, None, f"备份失败: {str(e)}"
 
+    @staticmethod
+    def _copy_database(path, to_backup):
+        """
+        使用 SQLite 在线备份接口在当前数据库和文件之间复制
+
+        备份接口在一个读事务中复制所有页面，WAL 模式下也能得到一致的快照；
+        写入当前数据库时其他连接无需关闭，随后读取到的就是复制后的内容。
+
+        Args:
+            path: 数据库文件路径
+            to_backup: True 时将当前数据库复制到 path，False 时将 path 复制到当前数据库
+        """
+        db.session.remove()
+        connection = db.engine.raw_connection()
+        other = sqlite3.connect(path)
+        try:
+            if to_backup:
+                connection.driver_connection.backup(other)
+            else:
+                other.backup(connection.driver_connection)
+        finally:
+            other.close()
+            connection.close()
+
     @staticmethod
     def restore_from_backup(backup_file):
         """从备份恢复数据"""
@@ -226,6 +257,9 @@ class SettingsService:
             ):
                 backup_root = os.path.join(temp_dir, extracted_items[0])
 
+            # 恢复后的版本号须大于当前版本号，避免与替换前的缓存条目重合
+            previous_version = DataVersion.get()
+
             # 恢复数据库
             db_backup = os.path.join(backup_root, "hamster.db")
             if os.path.exists(db_backup):
@@ -233,20 +267,21 @@ class SettingsService:
                     "sqlite:///", ""
                 )
                 if db_path:
-                    # 备份当前数据库
-                    if os.path.exists(db_path):
-                        shutil.copy2(db_path, f"{db_path}.backup")
-                    shutil.copy2(db_backup, db_path)
+                    # 备份当前数据库，再将备份的内容写入当前数据库
+                    SettingsService._copy_database(f"{db_path}.backup", to_backup=True)
+                    SettingsService._copy_database(db_backup, to_backup=False)
+                    # 旧备份缺少新版本的表和列，升级后回填
+                    upgrade = SchemaService.upgrade()
+                    if upgrade["added_columns"]:
+                        current_app.logger.info(
+                            f"恢复的数据库已升级，新增列: {upgrade['added_columns']}"
+                        )
 
             # 恢复图片文件
             uploads_backup = os.path.join(backup_root, "uploads")
             if os.path.exists(uploads_backup):
-                upload_folder = current_app.config.get("UPLOAD_FOLDER", "")
-                if upload_folder:
-                    # 备份当前上传文件夹
-                    if os.path.exists(upload_folder):
-                        shutil.move(upload_folder, f"{upload_folder}.backup")
-                    shutil.copytree(uploads_backup, upload_folder)
+                # 本地存储时当前上传文件夹移动到 <目录>.backup
+                StorageService.restore_from(uploads_backup)
 
             # 恢复设定
             settings_backup = os.path.join(backup_root, "settings")
@@ -259,6 +294,9 @@ class SettingsService:
             # 清理临时文件
             shutil.rmtree(temp_dir)
 
+            # 数据已整体替换，使缓存失效
+            DataVersion.bump(at_least=previous_version)
+
             return True, "恢复成功"
 
         except Exception as e:
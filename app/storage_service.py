@@ -0,0 +1,544 @@
+# app/storage_service.py
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import update, insert
+from sqlalchemy.exc import SQLAlchemyError
+from .database import db
+from .models import StorageUsage
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 为可选依赖，仅 S3 存储需要
+    boto3 = None
+    ClientError = None
+
+
+def shard_key(filename):
+    """
+    图片文件名 -> 存储键
+
+    按文件名中哈希部分的前四个字符分两级目录，避免单个目录下文件过多：
+    abcd1234....jpg -> ab/cd/abcd1234....jpg，upload_<uuid>.jpg 按 uuid 分级
+    """
+    digest = os.path.splitext(filename)[0].rsplit("_", 1)[-1]
+    if len(digest) < 4:
+        return filename
+    return f"{digest[:2]}/{digest[2:4]}/{filename}"
+
+
+class LocalStorageBackend:
+    """本地文件系统存储，键对应 root 下的相对路径"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def touch(self, key):
+        """
+        将修改时间更新为当前时间
+
+        Returns:
+            bool: 文件是否存在
+        """
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def write(self, key, content):
+        """先写入临时文件再替换，读取方不会看到写了一半的文件"""
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=folder)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def write_stream(self, key, stream):
+        """分块写入文件对象的剩余内容"""
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=folder)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(stream, f, 1024 * 1024)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def read(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key):
+        """
+        Returns:
+            int: 删除的文件大小，文件不存在时返回None
+        """
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return None
+        return size
+
+    def local_path(self, key):
+        path = self._path(key)
+        return path if os.path.isfile(path) else None
+
+    def iter_keys(self):
+        """遍历全部文件，返回 (键, 大小, 修改时间戳)"""
+        if not os.path.isdir(self.root):
+            return
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                stat = os.stat(path)
+                yield key, stat.st_size, stat.st_mtime
+
+
+class S3StorageBackend:
+    """
+    S3 兼容对象存储（AWS S3、MinIO 等），需要安装 boto3
+
+    读取图片的本地路径时（AI识别、生成缩略图）先下载到本地缓存目录，
+    文件名即内容的MD5，缓存无需失效。
+    """
+
+    def __init__(
+        self,
+        bucket,
+        prefix="",
+        cache_folder=None,
+        endpoint_url=None,
+        region=None,
+        access_key_id=None,
+        secret_access_key=None,
+    ):
+        if boto3 is None:
+            raise RuntimeError("S3 存储需要安装 boto3")
+        if not bucket:
+            raise ValueError("S3_BUCKET not configured")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_folder = cache_folder or os.path.join(
+            tempfile.gettempdir(), "hamster_storage"
+        )
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+        )
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def touch(self, key):
+        """
+        将修改时间更新为当前时间（对象复制到自身）
+
+        Returns:
+            bool: 对象是否存在
+        """
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=self.prefix + key,
+                CopySource={"Bucket": self.bucket, "Key": self.prefix + key},
+                MetadataDirective="REPLACE",
+                ContentType="image/jpeg",
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def write(self, key, content):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=content,
+            ContentType="image/jpeg",
+        )
+
+    def write_stream(self, key, stream):
+        """分段上传文件对象的剩余内容"""
+        self.client.upload_fileobj(
+            stream,
+            self.bucket,
+            self.prefix + key,
+            ExtraArgs={"ContentType": "image/jpeg"},
+        )
+
+    def read(self, key):
+        response = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        return response["Body"].read()
+
+    def delete(self, key):
+        head = self._head(key)
+        if head is None:
+            return None
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+        cache_path = os.path.join(self.cache_folder, *key.split("/"))
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        return head["ContentLength"]
+
+    def local_path(self, key):
+        path = os.path.join(self.cache_folder, *key.split("/"))
+        if os.path.isfile(path):
+            return path
+        if not self.exists(key):
+            return None
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=folder)
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self.prefix + key, temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return path
+
+    def iter_keys(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                yield (
+                    obj["Key"][len(self.prefix) :],
+                    obj["Size"],
+                    obj["LastModified"].timestamp(),
+                )
+
+
+class StorageService:
+    """
+    图片存储
+
+    图片按内容MD5命名，存储键按 shard_key 分两级目录。后端由 STORAGE_BACKEND
+    选择（local / s3）。写入和删除时同步更新 storage_usage 台账，
+    存储用量直接读取台账，不遍历文件。
+    """
+
+    @staticmethod
+    def create_backend(config):
+        backend = config.get("STORAGE_BACKEND", "local")
+        if backend == "local":
+            return LocalStorageBackend(config["UPLOAD_FOLDER"])
+        if backend == "s3":
+            return S3StorageBackend(
+                bucket=config.get("S3_BUCKET"),
+                prefix=config.get("S3_PREFIX", ""),
+                cache_folder=config.get("STORAGE_CACHE_FOLDER"),
+                endpoint_url=config.get("S3_ENDPOINT_URL"),
+                region=config.get("S3_REGION"),
+                access_key_id=config.get("S3_ACCESS_KEY_ID"),
+                secret_access_key=config.get("S3_SECRET_ACCESS_KEY"),
+            )
+        raise ValueError(f"不支持的存储后端: {backend}")
+
+    @staticmethod
+    def get_backend():
+        """当前应用的存储后端（每个应用创建一次）"""
+        app = current_app._get_current_object()
+        backend = app.extensions.get("image_storage")
+        if backend is None:
+            backend = app.extensions["image_storage"] = StorageService.create_backend(
+                app.config
+            )
+        return backend
+
+    @staticmethod
+    def _resolve(filename):
+        """
+        查找文件的存储键，兼容迁移前平铺存放的文件
+
+        Returns:
+            str: 存储键，文件不存在时返回None
+        """
+        if not filename:
+            return None
+        backend = StorageService.get_backend()
+        key = shard_key(filename)
+        if backend.exists(key):
+            return key
+        if key != filename and backend.exists(filename):
+            return filename
+        return None
+
+    @staticmethod
+    def exists(filename):
+        return StorageService._resolve(filename) is not None
+
+    @staticmethod
+    def touch(filename):
+        """
+        复用已保存的文件时更新其修改时间
+
+        孤立图片回收不删除宽限期内修改过的文件，复用的文件在新的引用提交前
+        （如后台压缩完成、小票创建前）不会因修改时间较早而被回收。
+
+        Returns:
+            bool: 文件是否存在
+        """
+        key = StorageService._resolve(filename)
+        return key is not None and StorageService.get_backend().touch(key)
+
+    @staticmethod
+    def save(filename, content):
+        """
+        保存图片。文件名由内容决定，已存在时不再写入（只更新修改时间）
+
+        Returns:
+            bool: 是否写入了新文件
+        """
+        if StorageService.touch(filename):
+            return False
+        StorageService.get_backend().write(shard_key(filename), content)
+        StorageLedger.add(1, len(content))
+        return True
+
+    @staticmethod
+    def save_stream(filename, stream):
+        """
+        从文件对象分块保存图片，不把整个文件读入内存。文件名由内容决定，
+        已存在时不再写入（只更新修改时间）
+
+        Returns:
+            bool: 是否写入了新文件
+        """
+        if StorageService.touch(filename):
+            return False
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        StorageService.get_backend().write_stream(shard_key(filename), stream)
+        StorageLedger.add(1, size)
+        return True
+
+    @staticmethod
+    def save_file(filename, path):
+        """
+        保存本地文件
+
+        Returns:
+            bool: 是否写入了新文件
+        """
+        with open(path, "rb") as f:
+            return StorageService.save_stream(filename, f)
+
+    @staticmethod
+    def read(filename):
+        """
+        Returns:
+            bytes: 图片内容，文件不存在时返回None
+        """
+        key = StorageService._resolve(filename)
+        return StorageService.get_backend().read(key) if key else None
+
+    @staticmethod
+    def local_path(filename):
+        """
+        可直接读取的本地文件路径（远程存储先下载到本地缓存）
+
+        Returns:
+            str: 文件路径，文件不存在时返回None
+        """
+        key = StorageService._resolve(filename)
+        return StorageService.get_backend().local_path(key) if key else None
+
+    @staticmethod
+    def delete(filename):
+        """
+        Returns:
+            bool: 是否删除了文件
+        """
+        key = StorageService._resolve(filename)
+        if key is None:
+            return False
+        return StorageService.delete_key(key) is not None
+
+    @staticmethod
+    def delete_key(key):
+        """
+        按存储键删除文件
+
+        Returns:
+            int: 删除的文件大小，文件不存在时返回None
+        """
+        size = StorageService.get_backend().delete(key)
+        if size is not None:
+            StorageLedger.add(-1, -size)
+        return size
+
+    @staticmethod
+    def migrate_flat_files():
+        """
+        将平铺存放的旧文件移动到分级目录
+
+        Returns:
+            int: 移动的文件数
+        """
+        backend = StorageService.get_backend()
+        moved = 0
+        for key, *_ in list(backend.iter_keys()):
+            if "/" in key or shard_key(key) == key:
+                continue
+            target = shard_key(key)
+            if isinstance(backend, LocalStorageBackend):
+                os.makedirs(os.path.dirname(backend._path(target)), exist_ok=True)
+                os.replace(backend._path(key), backend._path(target))
+            else:
+                if not backend.exists(target):
+                    backend.write(target, backend.read(key))
+                backend.delete(key)
+            moved += 1
+        StorageLedger.rebuild()
+        return moved
+
+    @staticmethod
+    def backup_to(folder):
+        """将全部图片按存储键复制到 folder"""
+        backend = StorageService.get_backend()
+        if isinstance(backend, LocalStorageBackend):
+            if os.path.exists(backend.root):
+                shutil.copytree(backend.root, folder)
+            return
+        for key, *_ in backend.iter_keys():
+            path = os.path.join(folder, *key.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(backend.read(key))
+
+    @staticmethod
+    def restore_from(folder):
+        """
+        从备份目录恢复图片（兼容平铺和分级的备份）
+
+        本地存储整体替换上传目录（原目录移动到 <目录>.backup），
+        远程存储逐个上传备份中的文件。
+        """
+        backend = StorageService.get_backend()
+        if isinstance(backend, LocalStorageBackend):
+            if os.path.exists(backend.root):
+                shutil.move(backend.root, f"{backend.root}.backup")
+            shutil.copytree(folder, backend.root)
+            StorageService.migrate_flat_files()
+            return
+
+        for dirpath, _, filenames in os.walk(folder):
+            for filename in filenames:
+                target = shard_key(filename)
+                if not backend.exists(target):
+                    with open(os.path.join(dirpath, filename), "rb") as f:
+                        backend.write_stream(target, f)
+        StorageLedger.rebuild()
+
+
+class StorageLedger:
+    """
+    存储用量台账（storage_usage 表中的单行记录）
+
+    文件写入不属于数据库事务，台账在独立的连接中以增量方式更新。
+    """
+
+    ROW_ID = 1
+
+    @staticmethod
+    def add(file_count, total_bytes):
+        try:
+            with db.engine.begin() as conn:
+                result = conn.execute(
+                    update(StorageUsage)
+                    .where(StorageUsage.id == StorageLedger.ROW_ID)
+                    .values(
+                        file_count=StorageUsage.file_count + file_count,
+                        total_bytes=StorageUsage.total_bytes + total_bytes,
+                        updated_at=datetime.now(timezone.utc),
+                    )
+                )
+        except SQLAlchemyError as e:
+            # 台账表尚未创建时不影响文件写入
+            current_app.logger.warning(
+                f"更新存储台账失败（可运行 flask migrate-storage）: {e}"
+            )
+            return
+        if result.rowcount == 0:
+            # 台账尚未建立，完整统计一次（已包含本次变更）
+            StorageLedger.rebuild()
+
+    @staticmethod
+    def rebuild():
+        """
+        遍历存储重新统计用量
+
+        Returns:
+            tuple: (文件数, 总字节数)
+        """
+        file_count = 0
+        total_bytes = 0
+        for _, size, _ in StorageService.get_backend().iter_keys():
+            file_count += 1
+            total_bytes += size
+
+        values = {
+            "file_count": file_count,
+            "total_bytes": total_bytes,
+            "updated_at": datetime.now(timezone.utc),
+        }
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                update(StorageUsage)
+                .where(StorageUsage.id == StorageLedger.ROW_ID)
+                .values(**values)
+            )
+            if result.rowcount == 0:
+                conn.execute(
+                    insert(StorageUsage).values(id=StorageLedger.ROW_ID, **values)
+                )
+        return file_count, total_bytes
+
+    @staticmethod
+    def get_usage():
+        """
+        Returns:
+            tuple: (文件数, 总字节数)；台账不存在时先统计一次
+        """
+        usage = db.session.get(StorageUsage, StorageLedger.ROW_ID)
+        if usage is None:
+            return StorageLedger.rebuild()
+        return usage.file_count, usage.total_bytes
@@ -0,0 +1,121 @@
+# app/upload_index_service.py
+from .database import db
+from .models import Receipt, ImageUpload
+from .storage_service import StorageService
+
+
+class UploadIndexService:
+    """
+    上传图片去重索引
+
+    以原始上传内容的MD5记录压缩后保存的文件名。再次上传相同的图片时直接复用
+    已保存的文件，不再解码、压缩和写入；文件名对应的小票按 image_filename 查找。
+    后台压缩时先记录等待压缩的原图（upload_*），压缩完成后改为压缩后的文件名。
+    """
+
+    @staticmethod
+    def find(raw_hash):
+        """
+        查找相同内容的图片已保存的文件名
+
+        Returns:
+            str: 已保存的文件名；未上传过或文件已被删除时返回None
+        """
+        if not raw_hash:
+            return None
+        upload = ImageUpload.query.filter_by(raw_hash=raw_hash).first()
+        if upload is None:
+            return None
+        # 更新复用文件的修改时间，避免在新的小票提交前被孤立图片回收删除
+        if not StorageService.touch(upload.filename):
+            # 文件已被删除，记录失效
+            db.session.delete(upload)
+            return None
+        return upload.filename
+
+    @staticmethod
+    def current(raw_hash):
+        """索引中记录的文件名（不检查文件是否存在）"""
+        return (
+            db.session.query(ImageUpload.filename).filter_by(raw_hash=raw_hash).scalar()
+        )
+
+    @staticmethod
+    def forget(raw_hash, filename):
+        """删除仍指向该文件名的记录（随调用方的事务提交）"""
+        ImageUpload.query.filter_by(raw_hash=raw_hash, filename=filename).delete(
+            synchronize_session=False
+        )
+
+    @staticmethod
+    def record(raw_hash, filename):
+        """记录原始内容MD5对应的文件名（随调用方的事务提交）"""
+        if not raw_hash or not filename:
+            return
+        upload = ImageUpload.query.filter_by(raw_hash=raw_hash).first()
+        if upload is None:
+            db.session.add(ImageUpload(raw_hash=raw_hash, filename=filename))
+        else:
+            upload.filename = filename
+
+    @staticmethod
+    def find_many(raw_hashes):
+        """
+        批量查找相同内容的图片已保存的文件名
+
+        Returns:
+            dict: 原始内容MD5 -> 文件名；未上传过或文件已被删除的不包含在内
+        """
+        raw_hashes = list({raw_hash for raw_hash in raw_hashes if raw_hash})
+        found = {}
+        for start in range(0, len(raw_hashes), 500):
+            chunk = raw_hashes[start : start + 500]
+            for upload in ImageUpload.query.filter(ImageUpload.raw_hash.in_(chunk)):
+                if StorageService.touch(upload.filename):
+                    found[upload.raw_hash] = upload.filename
+                else:
+                    db.session.delete(upload)
+        return found
+
+    @staticmethod
+    def record_many(filenames):
+        """
+        批量记录原始内容MD5对应的文件名（随调用方的事务提交）
+
+        Args:
+            filenames: dict 原始内容MD5 -> 文件名
+        """
+        filenames = {
+            raw_hash: filename
+            for raw_hash, filename in filenames.items()
+            if raw_hash and filename
+        }
+        raw_hashes = list(filenames)
+        existing = {}
+        for start in range(0, len(raw_hashes), 500):
+            chunk = raw_hashes[start : start + 500]
+            for upload in ImageUpload.query.filter(ImageUpload.raw_hash.in_(chunk)):
+                existing[upload.raw_hash] = upload
+        for raw_hash, filename in filenames.items():
+            upload = existing.get(raw_hash)
+            if upload is None:
+                db.session.add(ImageUpload(raw_hash=raw_hash, filename=filename))
+            else:
+                upload.filename = filename
+
+    @staticmethod
+    def find_receipts(raw_hash):
+        """
+        使用相同图片的小票，最新创建的在前
+
+        Returns:
+            list: Receipt 列表
+        """
+        filename = UploadIndexService.find(raw_hash)
+        if filename is None:
+            return []
+        return (
+            Receipt.query.filter(Receipt.image_filename == filename)
+            .order_by(Receipt.id.desc())
+            .all()
+        )
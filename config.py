@@ -154,10 +154,101 @@ class Config:
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(basedir, "hamster.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # SQLite 连接参数（识别线程、批量分类线程和Web请求会并发写入）
+    SQLITE_PROFILE_ENABLED = True
+    SQLITE_JOURNAL_MODE = "WAL"
+    SQLITE_BUSY_TIMEOUT = 30000  # 等待写锁的毫秒数
+    SQLITE_SYNCHRONOUS = "NORMAL"
+    SQLITE_CACHE_SIZE = -64000  # 负数表示KB，即64MB页缓存
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_pre_ping": True,
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        "connect_args": {"timeout": 30, "check_same_thread": False},
+    }
+
     # 文件上传配置
     UPLOAD_FOLDER = os.path.join(basedir, "uploads")
     # MAX_CONTENT_LENGTH = None  # 去除文件大小限制
 
+    # 图片存储后端：local 存放在 UPLOAD_FOLDER，s3 存放在 S3 兼容对象存储（需要 boto3）
+    STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+    S3_BUCKET = os.environ.get("S3_BUCKET", "")
+    S3_PREFIX = os.environ.get("S3_PREFIX", "uploads/")
+    S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")  # MinIO 等兼容服务的地址
+    S3_REGION = os.environ.get("S3_REGION")
+    S3_ACCESS_KEY_ID = os.environ.get("S3_ACCESS_KEY_ID")
+    S3_SECRET_ACCESS_KEY = os.environ.get("S3_SECRET_ACCESS_KEY")
+    # 远程存储的图片在AI识别、生成缩略图前下载到的本地缓存目录
+    STORAGE_CACHE_FOLDER = os.path.join(basedir, "cache", "storage")
+
+    # 图片HTTP缓存：内容寻址的图片（文件名即内容MD5）永不改变，浏览器长期缓存
+    IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
+    # 由前端服务器发送图片文件：Apache/lighttpd 设置 USE_X_SENDFILE = True；
+    # nginx 为图片目录配置 internal location 后，在此填写 本地目录 -> 内部URI前缀，
+    # 例如 {UPLOAD_FOLDER: "/_protected/uploads/"}
+    IMAGE_ACCEL_REDIRECT = {}
+
+    # 孤立图片回收：修改时间在宽限期（秒）内的文件视为正在上传，不回收
+    IMAGE_GC_GRACE_PERIOD = 3600
+    # 等待后台压缩的原图（upload_*）的宽限期（秒），覆盖压缩队列积压的时间
+    IMAGE_GC_UPLOAD_GRACE_PERIOD = 24 * 3600
+
+    # 上传图片的压缩进程数，为0时在上传请求中同步压缩
+    IMAGE_COMPRESSION_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+    # 上传请求中同时解码图片（同步压缩、生成缩略图）的上限，限制内存峰值
+    IMAGE_DECODE_CONCURRENCY = 2
+
+    # 缩略图等派生图片配置（可随时由原图重新生成，不随备份保存）
+    IMAGE_DERIVATIVE_FOLDER = os.path.join(basedir, "cache", "images")
+    IMAGE_DERIVATIVE_SIZES = {
+        "thumb": (320, 320),  # 列表缩略图
+        "medium": (960, 960),  # 详情页预览
+    }
+    IMAGE_DERIVATIVE_QUALITY = 75
+
+    # AI识别前预处理图片：裁剪到小票区域、转为灰度并缩小到长边像素数
+    AI_IMAGE_PREPROCESS = True
+    AI_IMAGE_MAX_EDGE = 1600
+    AI_IMAGE_QUALITY = 85
+
+    # 批量上传后同时进行的AI识别请求数
+    AI_RECOGNITION_CONCURRENCY = 4
+
+    # 重复小票检测：上传时计算小票文字区域的256位感知哈希，与更早的小票海明距离
+    # 不超过阈值时标记为重复（可用 scripts/check_duplicate_hash.py 检查阈值）；
+    # 默认只标记，开启 DUPLICATE_SKIP_RECOGNITION 时被标记的小票跳过AI识别
+    DUPLICATE_DETECTION_ENABLED = True
+    DUPLICATE_PHASH_THRESHOLD = 24
+    DUPLICATE_SKIP_RECOGNITION = False
+
+    # 后台导出任务配置
+    EXPORT_JOB_FOLDER = os.path.join(tempfile.gettempdir(), "hamster_exports")
+    EXPORT_JOB_WORKERS = 2  # 同时运行的导出任务数
+    EXPORT_JOB_TTL = 3600  # 导出文件保留秒数
+    # 运行中的任务超过该秒数未更新进度时视为所在进程已退出
+    EXPORT_JOB_STALE_TIMEOUT = 600
+
+    # 全文检索配置（FTS5不可用时自动回退到模糊匹配）
+    SEARCH_FTS_ENABLED = True
+    # 不含中日韩文字的搜索词，每个词的最后一段短于该长度时使用模糊匹配
+    SEARCH_FTS_MIN_PREFIX_LENGTH = 3
+
+    # 增量导出的删除记录保留天数（flask prune-deleted-records 清理），
+    # 同步间隔超过保留期的客户端需要重新全量同步
+    DELTA_EXPORT_TOMBSTONE_RETENTION_DAYS = 90
+
+    # 列表和导出接口使用编译的序列化器，关闭时使用 marshmallow Schema
+    FAST_SERIALIZERS_ENABLED = True
+
+    # 分析结果缓存配置
+    ANALYTICS_CACHE_ENABLED = True
+    ANALYTICS_CACHE_MAX_ENTRIES = 256
+    ANALYTICS_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 缓存内存上限（字节）
+
     def __init__(self):
         """初始化配置"""
         self.load_from_settings()
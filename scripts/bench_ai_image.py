@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试：对比AI识别使用原图和预处理图片（裁剪小票区域、灰度、缩小）的请求大小
+
+按上传流程保存图片（压缩后的原图），再生成预处理图片，报告两者的尺寸、
+base64 后的请求图片大小和估算的图片token数（按 OpenAI 高精度图片的计费规则：
+缩放到 2048 以内、短边 768 后按 512 像素分块）。
+指定 --recognize 时用 settings.json 中配置的模型分别识别两种图片，报告识别耗时和实际输入token。
+用法: python scripts/bench_ai_image.py [图片目录] [--recognize]
+      未指定图片目录时生成模拟照片（深色桌面上的小票）
+"""
+
+import base64
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+from werkzeug.datastructures import FileStorage  # noqa: E402
+
+
+def make_config(folder):
+    """生成基准测试用的配置类"""
+    from config import Config
+
+    return type(
+        "BenchConfig",
+        (Config,),
+        {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(folder, "bench.db"),
+            "UPLOAD_FOLDER": os.path.join(folder, "uploads"),
+            "IMAGE_DERIVATIVE_FOLDER": os.path.join(folder, "cache"),
+        },
+    )
+
+
+def make_photos(folder, count=4):
+    """生成模拟照片：深色桌面上略微倾斜的白色小票"""
+    rnd = random.Random(7)
+    paths = []
+    for n in range(count):
+        width, height = (4000, 3000) if n % 2 == 0 else (3000, 4000)
+        background = Image.merge(
+            "RGB",
+            [
+                Image.effect_noise((width, height), 25).point(lambda v, b=b: v // 3 + b)
+                for b in (60, 40, 25)
+            ],
+        )
+        receipt_width = int(width * rnd.uniform(0.25, 0.4))
+        receipt_height = int(height * rnd.uniform(0.6, 0.8))
+        receipt = Image.new("RGB", (receipt_width, receipt_height), (245, 243, 236))
+        draw = ImageDraw.Draw(receipt)
+        line_height = receipt_height // 45
+        for line in range(2, 43):
+            length = int(receipt_width * rnd.uniform(0.3, 0.85))
+            draw.rectangle(
+                (
+                    receipt_width // 12,
+                    line * line_height,
+                    receipt_width // 12 + length,
+                    line * line_height + line_height // 2,
+                ),
+                fill=(40, 40, 40),
+            )
+        receipt = receipt.rotate(rnd.uniform(-4, 4), expand=True, fillcolor=(0, 0, 0))
+        mask = receipt.convert("L").point(lambda v: 255 if v > 0 else 0)
+        background.paste(
+            receipt,
+            (
+                int((width - receipt.width) * rnd.uniform(0.3, 0.7)),
+                int((height - receipt.height) * rnd.uniform(0.3, 0.7)),
+            ),
+            mask,
+        )
+        path = os.path.join(folder, f"photo_{n}.jpg")
+        background.filter(ImageFilter.GaussianBlur(1)).save(path, quality=92)
+        paths.append(path)
+    return paths
+
+
+def estimate_image_tokens(width, height):
+    """按 OpenAI 高精度图片的计费规则估算图片token数"""
+    scale = min(1, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def describe(path):
+    """(宽, 高, base64字节数, 估算token数)"""
+    with Image.open(path) as image:
+        width, height = image.size
+    with open(path, "rb") as f:
+        payload = len(base64.b64encode(f.read()))
+    return width, height, payload, estimate_image_tokens(width, height)
+
+
+def recognize(path):
+    """识别图片，返回 (耗时, 输入token数)"""
+    from app.ai_service import AIService
+
+    service = AIService()
+    start = time.perf_counter()
+    result = service.recognize_receipt(image_path=path)
+    elapsed = time.perf_counter() - start
+    if result is None or service.last_stats is None:
+        return elapsed, None
+    return service.last_stats["latency"], service.last_stats["prompt_tokens"]
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    run_recognition = "--recognize" in sys.argv
+
+    from app import create_app
+    from app.database import db
+    from app.file_service import AIImageService, FileService
+
+    folder = tempfile.mkdtemp()
+    if args:
+        source_folder = args[0]
+        photos = [
+            os.path.join(source_folder, name)
+            for name in sorted(os.listdir(source_folder))
+            if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+        ]
+    else:
+        print("生成模拟照片...")
+        photos = make_photos(folder)
+
+    app = create_app(make_config(folder))
+    totals = {"original": [0, 0, 0.0], "ai": [0, 0, 0.0]}
+    with app.app_context():
+        db.create_all()
+        for photo in photos:
+            with open(photo, "rb") as f:
+                filename = FileService.save_image_with_md5(
+                    FileStorage(stream=f, filename=os.path.basename(photo)),
+                    quality=app.config["IMAGE_COMPRESSION_QUALITY"],
+                    max_size=(app.config["IMAGE_MAX_WIDTH"], app.config["IMAGE_MAX_HEIGHT"]),
+                )
+            original_path = FileService.get_image_path(filename)
+            start = time.perf_counter()
+            ai_path = AIImageService.generate(filename)
+            preprocess_time = time.perf_counter() - start
+
+            print(f"{os.path.basename(photo)} (预处理 {preprocess_time * 1000:.0f}ms)")
+            for variant, path in (("original", original_path), ("ai", ai_path)):
+                width, height, payload, tokens = describe(path)
+                line = (
+                    f"  {variant:>8}: {width}x{height}, 请求图片 {payload / 1024:.0f}KB, "
+                    f"估算token {tokens}"
+                )
+                totals[variant][0] += payload
+                totals[variant][1] += tokens
+                if run_recognition:
+                    latency, prompt_tokens = recognize(path)
+                    totals[variant][2] += latency
+                    line += f", 识别耗时 {latency:.2f}s, 输入token {prompt_tokens}"
+                print(line)
+
+    original, ai = totals["original"], totals["ai"]
+    print(
+        f"合计: 请求图片 {original[0] / 1024:.0f}KB -> {ai[0] / 1024:.0f}KB "
+        f"({(1 - ai[0] / original[0]) * 100:.0f}% 减少), "
+        f"估算token {original[1]} -> {ai[1]}"
+    )
+    if run_recognition:
+        print(f"识别耗时: {original[2]:.2f}s -> {ai[2]:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试：批量上传从接收文件到识别任务排队的耗时
+
+对比逐个创建小票（每个文件单独压缩、写入、提交事务并启动识别线程）与批量创建
+（并行压缩、一个事务批量插入、识别作为一个批次排队），分别在同步压缩
+（IMAGE_COMPRESSION_WORKERS=0）和后台压缩下测试。识别不实际调用AI，只记录排队。
+同时报告将全部上传内容复制到磁盘的耗时作为写盘下限。
+用法: python scripts/bench_batch_upload.py [文件数]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("per-file", "batch")
+IMAGE_SIZE = (2000, 1500)
+
+
+def make_config(folder, workers):
+    """生成基准测试用的配置类"""
+    from config import Config
+
+    return type(
+        "BenchConfig",
+        (Config,),
+        {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(folder, "bench.db"),
+            "UPLOAD_FOLDER": os.path.join(folder, "uploads"),
+            "IMAGE_DERIVATIVE_FOLDER": os.path.join(folder, "cache"),
+            "IMAGE_COMPRESSION_WORKERS": workers,
+        },
+    )
+
+
+def make_images(folder, count):
+    """生成测试照片"""
+    from PIL import Image
+
+    paths = []
+    gradient = Image.linear_gradient("L").resize(IMAGE_SIZE)
+    for n in range(count):
+        noise = Image.effect_noise(IMAGE_SIZE, 10 + n % 50)
+        image = Image.merge("RGB", (gradient, noise, gradient.rotate(180)))
+        path = os.path.join(folder, f"photo_{n}.jpg")
+        # 写入序号使每个文件内容不同
+        image.save(path, format="JPEG", quality=90, comment=str(n).encode())
+        paths.append(path)
+    return paths
+
+
+def upload_per_file(image_files):
+    """改动前的批量上传：逐个创建小票"""
+    from app.file_service import FileService
+    from app.services import ReceiptService
+
+    for idx, image_file in enumerate(image_files):
+        ReceiptService.create_receipt(
+            {"name": f"批量小票_{idx + 1}"},
+            image_file,
+            raw_hash=FileService.hash_upload(image_file),
+        )
+
+
+def run_mode(folder, mode, workers, paths):
+    """在当前进程中批量上传（由子进程调用）"""
+    from werkzeug.datastructures import FileStorage
+    from app import create_app
+    from app.database import db
+    from app.services import ReceiptService
+
+    queued = []
+    ReceiptService.trigger_recognition = staticmethod(queued.append)
+    ReceiptService.trigger_batch_recognition = staticmethod(queued.extend)
+
+    app = create_app(make_config(folder, workers))
+    with app.app_context():
+        db.create_all()
+
+    files = [open(path, "rb") for path in paths]
+    image_files = [
+        FileStorage(stream=f, filename=os.path.basename(f.name)) for f in files
+    ]
+    with app.test_request_context():
+        start = time.perf_counter()
+        if mode == "batch":
+            ReceiptService.batch_create_and_recognize(image_files, "bench")
+        else:
+            upload_per_file(image_files)
+        elapsed = time.perf_counter() - start
+
+    # 后台压缩时等待识别全部排队
+    deadline = time.time() + 600
+    while len(queued) < len(paths) and time.time() < deadline:
+        time.sleep(0.05)
+    queued_elapsed = time.perf_counter() - start
+    for f in files:
+        f.close()
+    print(f"{elapsed:.3f} {queued_elapsed:.3f} {len(queued)}")
+
+
+def disk_write_floor(paths):
+    """将全部文件复制到新目录的耗时"""
+    folder = tempfile.mkdtemp()
+    start = time.perf_counter()
+    for path in paths:
+        shutil.copyfile(path, os.path.join(folder, os.path.basename(path)))
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(folder)
+    return elapsed
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--run":
+        run_mode(sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5:])
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    folder = tempfile.mkdtemp()
+    print(f"生成 {count} 张 {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]} 的照片...")
+    paths = make_images(folder, count)
+    total = sum(os.path.getsize(path) for path in paths)
+    print(
+        f"共 {total / 1024 / 1024:.0f}MB，写盘下限 {disk_write_floor(paths):.2f}s"
+    )
+
+    for workers in (0, max(1, min(4, (os.cpu_count() or 2) - 1))):
+        label = "同步压缩" if workers == 0 else f"后台压缩({workers}进程)"
+        for mode in MODES:
+            mode_folder = tempfile.mkdtemp(dir=folder)
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "--run",
+                    mode_folder,
+                    mode,
+                    str(workers),
+                ]
+                + paths,
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=ROOT,
+            ).stdout.split()
+            elapsed, queued_elapsed, queued = output[-3:]
+            print(
+                f"{label} {mode:>8}: 请求返回 {elapsed}s, "
+                f"识别全部排队 {queued_elapsed}s ({queued} 个)"
+            )
+
+
+if __name__ == "__main__":
+    main()
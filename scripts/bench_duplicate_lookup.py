@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试：重复小票检测的哈希查找耗时
+
+生成指定数量的小票图片哈希（按若干版式中心随机翻转位生成，模拟同类小票的哈希
+相互接近），对比：
+- scan: 逐个计算海明距离
+- index: 多索引哈希（HammingIndex.search）
+- service: DuplicateService.find_duplicate（含按 updated_at 增量同步和数据库校验）
+用法: python scripts/bench_duplicate_lookup.py [小票数] [查询次数]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 版式中心数和每个哈希相对中心翻转的位数（与 check_duplicate_hash.py 中版式相同的
+# 不同小票的距离相当）
+LAYOUTS = 500
+LAYOUT_FLIPS = 40
+BITS = 256
+
+
+def make_config(folder):
+    """生成基准测试用的配置类"""
+    from config import Config
+
+    return type(
+        "BenchConfig",
+        (Config,),
+        {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(folder, "bench.db"),
+            "UPLOAD_FOLDER": os.path.join(folder, "uploads"),
+            "IMAGE_DERIVATIVE_FOLDER": os.path.join(folder, "cache"),
+        },
+    )
+
+
+def flip(rnd, value, count):
+    for bit in rnd.sample(range(BITS), count):
+        value ^= 1 << bit
+    return value
+
+
+def make_hashes(count, rnd):
+    centers = [rnd.getrandbits(BITS) for _ in range(LAYOUTS)]
+    return [flip(rnd, rnd.choice(centers), LAYOUT_FLIPS) for _ in range(count)]
+
+
+def timed(func, queries):
+    """返回 (每次查询的平均耗时（微秒）, 找到相近哈希的查询数)"""
+    start = time.perf_counter()
+    found = sum(1 for query in queries if func(query))
+    return (time.perf_counter() - start) / len(queries) * 1e6, found
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    from app import create_app
+    from app.database import db
+    from app.duplicate_service import DuplicateService, HammingIndex
+    from app.models import Receipt
+
+    rnd = random.Random(42)
+    hashes = make_hashes(count, rnd)
+    # 一半查询是已有哈希的“重新拍照”（翻转少量位），一半是新小票
+    queries = [
+        flip(rnd, rnd.choice(hashes), rnd.randint(0, 24))
+        if n % 2 == 0
+        else make_hashes(1, rnd)[0]
+        for n in range(query_count)
+    ]
+
+    folder = tempfile.mkdtemp()
+    app = create_app(make_config(folder))
+    with app.app_context():
+        db.create_all()
+        threshold = app.config["DUPLICATE_PHASH_THRESHOLD"]
+
+        index = HammingIndex(threshold // 2 + 1, DuplicateService.HASH_BITS)
+        start = time.perf_counter()
+        for receipt_id, value in enumerate(hashes, 1):
+            index.add(receipt_id, value)
+        build_time = time.perf_counter() - start
+        print(
+            f"{count} 个哈希，阈值 {threshold}，建索引 {build_time * 1000:.0f}ms"
+        )
+
+        def scan(value):
+            return [
+                receipt_id
+                for receipt_id, other in index.values.items()
+                if (other ^ value).bit_count() <= threshold
+            ]
+
+        scan_time, scan_found = timed(scan, queries[:100])
+        index_time, index_found = timed(
+            lambda value: index.search(value, threshold), queries
+        )
+        # 两种方式的结果应一致
+        for value in queries[:100]:
+            assert sorted(scan(value)) == sorted(
+                receipt_id for _, receipt_id in index.search(value, threshold)
+            )
+
+        # 已有小票在一天前更新，增量同步时只读取最近更新的小票
+        updated_at = datetime.now(timezone.utc) - timedelta(days=1)
+        db.session.execute(
+            Receipt.__table__.insert(),
+            [
+                {
+                    "name": f"小票{n}",
+                    "image_phash": format(value, f"0{BITS // 4}x"),
+                    "updated_at": updated_at,
+                }
+                for n, value in enumerate(hashes)
+            ],
+        )
+        db.session.commit()
+        start = time.perf_counter()
+        DuplicateService.find_duplicate(format(queries[0], f"0{BITS // 4}x"))
+        load_time = time.perf_counter() - start
+        service_time, service_found = timed(
+            lambda value: DuplicateService.find_duplicate(format(value, f"0{BITS // 4}x")),
+            queries,
+        )
+
+    print(f"   scan: {scan_time:9.1f}us/次 (命中 {scan_found}/100)")
+    print(f"  index: {index_time:9.1f}us/次 (命中 {index_found}/{query_count})")
+    print(
+        f"service: {service_time:9.1f}us/次 (命中 {service_found}/{query_count}，"
+        f"首次加载索引 {load_time * 1000:.0f}ms)"
+    )
+
+
+if __name__ == "__main__":
+    main()
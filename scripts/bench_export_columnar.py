@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试：对比 /api/export (JSON) 与 /api/export/columnar 各格式的文件大小和加载耗时
+
+加载耗时模拟分析端读入数据：JSON 为 json.loads，类型化CSV 按 schema.json 转换各列，
+Arrow/Parquet 使用 pyarrow 读取（安装了 pandas 时同时统计 to_pandas 的耗时）。
+用法: python scripts/bench_export_columnar.py [商品行数]
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_export_streaming import make_config, seed  # noqa: E402
+from app import create_app  # noqa: E402
+from app.columnar_export_service import ColumnarExportService  # noqa: E402
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import pandas  # noqa: F401
+
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+
+def fetch(client, url):
+    """请求接口并返回 (响应体, 导出耗时)"""
+    start = time.perf_counter()
+    body = client.get(url).get_data()
+    return body, time.perf_counter() - start
+
+
+def load_json(body):
+    return json.loads(body)["data"]
+
+
+def load_typed_csv(body):
+    """按 schema.json 将类型化CSV读入为列"""
+    archive = zipfile.ZipFile(io.BytesIO(body))
+    schema = json.loads(archive.read("schema.json"))
+    converters = {
+        "int64": int,
+        "float64": float,
+        "bool": lambda value: value == "1",
+        "timestamp": datetime.fromisoformat,
+        "string": str,
+    }
+
+    reader = csv.reader(io.TextIOWrapper(archive.open("data.csv"), encoding="utf-8"))
+    names = next(reader)
+    columns = [list(column) for column in zip(*reader)] or [[] for _ in names]
+
+    for i, column_schema in enumerate(schema["columns"]):
+        if column_schema["type"] == "dictionary":
+            dictionary = schema["dictionaries"][column_schema["name"]]
+            convert = lambda value, d=dictionary: d[int(value)]  # noqa: E731
+        else:
+            convert = converters[column_schema["type"]]
+        columns[i] = [convert(value) if value != "" else None for value in columns[i]]
+    return dict(zip(names, columns))
+
+
+def load_arrow(body):
+    table = pa.ipc.open_stream(body).read_all()
+    return table.to_pandas() if HAS_PANDAS else table
+
+
+def load_parquet(body):
+    table = pq.read_table(io.BytesIO(body))
+    return table.to_pandas() if HAS_PANDAS else table
+
+
+def main():
+    item_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    print(f"生成 {item_rows} 条商品记录...")
+    seed(db_path, item_rows)
+
+    client = create_app(make_config(db_path)).test_client()
+
+    cases = [
+        ("json", "/api/export", load_json),
+        ("typed csv", "/api/export/columnar?format=csv", load_typed_csv),
+    ]
+    if ColumnarExportService.is_arrow_available():
+        cases += [
+            ("arrow", "/api/export/columnar?format=arrow", load_arrow),
+            ("parquet", "/api/export/columnar?format=parquet", load_parquet),
+        ]
+    else:
+        print("未安装 pyarrow，跳过 Arrow/Parquet")
+
+    load_target = "pandas DataFrame" if HAS_PANDAS else "Python/Arrow 对象"
+    print(f"加载目标: {load_target}")
+    for label, url, loader in cases:
+        body, export_time = fetch(client, url)
+        start = time.perf_counter()
+        loader(body)
+        load_time = time.perf_counter() - start
+        print(
+            f"{label:>10}: 大小 {len(body) / 1024 / 1024:.1f}MB, "
+            f"导出 {export_time:.2f}s, 加载 {load_time:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试：对比 /api/export (JSON) 与流式 /api/export.csv、/api/export.ndjson 的峰值内存
+
+先用 sqlite3 批量生成测试数据，再为每种导出方式启动独立子进程，
+读取完整响应后报告进程峰值RSS和耗时。
+用法: python scripts/bench_export_streaming.py [商品行数]
+"""
+
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENDPOINTS = {
+    "json": "/api/export",
+    "csv": "/api/export.csv",
+    "ndjson": "/api/export.ndjson",
+}
+
+
+def make_config(db_path):
+    """生成基准测试用的配置类"""
+    from config import Config
+
+    return type(
+        "BenchConfig",
+        (Config,),
+        {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_path,
+            "UPLOAD_FOLDER": os.path.join(os.path.dirname(db_path), "uploads"),
+        },
+    )
+
+
+def seed(db_path, item_rows, items_per_receipt=10):
+    """创建表结构并批量写入测试数据"""
+    from app import create_app
+    from app.database import db
+
+    app = create_app(make_config(db_path))
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # 三级分类 3 x 4 x 5
+    category_ids = []
+    next_id = 1
+    for i in range(3):
+        level1 = next_id
+        cursor.execute(
+            "INSERT INTO categories (id, name, level, parent_id) VALUES (?, ?, 1, NULL)",
+            (level1, f"一级{i}"),
+        )
+        next_id += 1
+        for j in range(4):
+            level2 = next_id
+            cursor.execute(
+                "INSERT INTO categories (id, name, level, parent_id) VALUES (?, ?, 2, ?)",
+                (level2, f"二级{i}{j}", level1),
+            )
+            next_id += 1
+            for k in range(5):
+                cursor.execute(
+                    "INSERT INTO categories (id, name, level, parent_id) "
+                    "VALUES (?, ?, 3, ?)",
+                    (next_id, f"三级{i}{j}{k}", level2),
+                )
+                category_ids.append(next_id)
+                next_id += 1
+
+    rnd = random.Random(42)
+    receipt_count = item_rows // items_per_receipt
+    receipts = []
+    items = []
+    item_id = 1
+    for receipt_id in range(1, receipt_count + 1):
+        day = 1 + receipt_id % 28
+        receipts.append(
+            (
+                receipt_id,
+                f"2024-03-{day:02d}_购物_店{receipt_id % 50}",
+                f"店{receipt_id % 50}",
+                "便利店",
+                f"2024-03-{day:02d} 03:{receipt_id % 60:02d}:00.000000",
+                f"2024-03-{day:02d}",
+                "SUCCESS",
+                "2024-03-01 00:00:00.000000",
+                "2024-03-01 00:00:00.000000",
+            )
+        )
+        for n in range(items_per_receipt):
+            price = rnd.randint(100, 3000)
+            items.append(
+                (
+                    item_id,
+                    receipt_id,
+                    f"明治おいしい牛乳{n}",
+                    f"牛奶{n}",
+                    price,
+                    round(price * 0.05, 2),
+                    rnd.choice(category_ids),
+                    "否",
+                    0,
+                    "2024-03-01 00:00:00.000000",
+                    "2024-03-01 00:00:00.000000",
+                )
+            )
+            item_id += 1
+
+    cursor.executemany(
+        "INSERT INTO receipts (id, name, store_name, store_category, transaction_time, "
+        "transaction_local_date, status, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        receipts,
+    )
+    cursor.executemany(
+        "INSERT INTO items (id, receipt_id, name_ja, name_zh, price_jpy, price_cny, "
+        "category_id, special_info, is_special_offer, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        items,
+    )
+    conn.commit()
+    conn.close()
+
+
+def run_mode(db_path, mode):
+    """在当前进程中请求导出接口并读取完整响应（由子进程调用）"""
+    from app import create_app
+
+    app = create_app(make_config(db_path))
+    client = app.test_client()
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    response = client.get(ENDPOINTS[mode], buffered=False)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss 在 Linux 下单位为KB
+    print(f"{baseline} {peak} {size} {elapsed:.2f}")
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--run":
+        run_mode(sys.argv[2], sys.argv[3])
+        return
+
+    item_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    print(f"生成 {item_rows} 条商品记录...")
+    seed(db_path, item_rows)
+
+    for mode in ENDPOINTS:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", db_path, mode],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=ROOT,
+        ).stdout.split()
+        baseline, peak, size, elapsed = output[-4:]
+        print(
+            f"{mode:>6}: 峰值RSS {int(peak) / 1024:.1f}MB "
+            f"(启动后 {int(baseline) / 1024:.1f}MB), "
+            f"响应 {int(size) / 1024 / 1024:.1f}MB, 耗时 {elapsed}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
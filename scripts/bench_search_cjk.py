@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试：对比中日文商品搜索使用 n-gram 全文索引与 LIKE 全表扫描的耗时
+
+生成名称各异的中日文商品后重建搜索索引，对若干搜索词分别在
+SEARCH_FTS_ENABLED 开启/关闭时调用 ItemService.get_all_items，并报告索引大小。
+用法: python scripts/bench_search_cjk.py [商品行数]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_export_streaming import make_config, seed  # noqa: E402
+from app import create_app  # noqa: E402
+from app.database import db  # noqa: E402
+from app.search_service import SearchService  # noqa: E402
+from app.services import ItemService  # noqa: E402
+
+BRANDS_JA = ["明治", "森永", "雪印", "カルビー", "日清", "キリン", "サントリー", "伊藤園"]
+PRODUCTS_JA = ["おいしい牛乳", "ヨーグルト", "ポテトチップス", "カップヌードル",
+               "午後の紅茶", "緑茶", "チョコレート", "食パン", "豆腐", "納豆"]
+PRODUCTS_ZH = ["牛奶", "酸奶", "薯片", "杯面", "红茶", "绿茶", "巧克力", "吐司", "豆腐", "纳豆"]
+SIZES = ["", "1L", "500ml", "200g", "6枚切", "大容量"]
+
+SEARCH_TERMS = ["牛乳", "牛奶", "紅茶", "チョコ", "明治", "1L"]
+REPEAT = 5
+
+
+def randomize_names(db_path):
+    """将生成的商品名改为多样的中日文名称"""
+    conn = sqlite3.connect(db_path)
+    rnd = random.Random(7)
+    ids = [row[0] for row in conn.execute("SELECT id FROM items")]
+    updates = []
+    for item_id in ids:
+        product = rnd.randrange(len(PRODUCTS_JA))
+        size = rnd.choice(SIZES)
+        updates.append(
+            (
+                f"{rnd.choice(BRANDS_JA)}{PRODUCTS_JA[product]}{size}",
+                f"{PRODUCTS_ZH[product]}{size}",
+                item_id,
+            )
+        )
+    conn.executemany("UPDATE items SET name_ja = ?, name_zh = ? WHERE id = ?", updates)
+    conn.commit()
+    conn.close()
+
+
+def index_size(db_path, table_name):
+    """统计 FTS5 表及其影子表占用的字节数（需要 dbstat 虚拟表）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE ?", (table_name + "%",)
+        ).fetchone()
+        return row[0] or 0
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def time_search(app, term):
+    """返回 (平均耗时, 结果总数)"""
+    with app.test_request_context():
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            _, pagination = ItemService.get_all_items({"search": term})
+        elapsed = (time.perf_counter() - start) / REPEAT
+    return elapsed, pagination.total
+
+
+def main():
+    item_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    print(f"生成 {item_rows} 条商品记录...")
+    seed(db_path, item_rows)
+    randomize_names(db_path)
+
+    config = make_config(db_path)
+    fts_app = create_app(config)
+    like_app = create_app(
+        type("LikeConfig", (config,), {"SEARCH_FTS_ENABLED": False})
+    )
+
+    with fts_app.app_context():
+        start = time.perf_counter()
+        SearchService.rebuild_indexes()
+        print(f"重建索引耗时 {time.perf_counter() - start:.1f}s")
+        db.engine.dispose()
+
+    for name in ("items_fts", SearchService.NGRAM_INDEXES["items_fts"]):
+        size = index_size(db_path, name)
+        if size is None:
+            print("当前SQLite未启用 dbstat，无法统计索引大小")
+            break
+        print(f"{name}: {size / 1024 / 1024:.1f}MB")
+    print(f"数据库文件: {os.path.getsize(db_path) / 1024 / 1024:.1f}MB")
+
+    for term in SEARCH_TERMS:
+        fts_time, fts_total = time_search(fts_app, term)
+        like_time, like_total = time_search(like_app, term)
+        print(
+            f"{term:>6}: 全文索引 {fts_time * 1000:.1f}ms ({fts_total}条), "
+            f"LIKE {like_time * 1000:.1f}ms ({like_total}条)"
+        )
+
+
+if __name__ == "__main__":
+    main()
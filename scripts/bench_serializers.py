@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试：对比 marshmallow Schema 与编译序列化器的序列化耗时
+
+分别序列化一页商品（/api/items 使用的 items_schema）、小票列表和导出记录，
+先校验两种方式输出一致，再报告各自的平均耗时。
+用法: python scripts/bench_serializers.py [商品行数] [每页记录数]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_export_streaming import make_config, seed  # noqa: E402
+from app import create_app  # noqa: E402
+from app.schemas import (  # noqa: E402
+    items_schema,
+    receipts_schema,
+    export_records_schema,
+)
+from app.serializers import CompiledSerializer  # noqa: E402
+from app.services import ReceiptService, ItemService, ExportService  # noqa: E402
+
+REPEAT = 20
+
+
+def measure(func):
+    """返回平均耗时（毫秒）"""
+    func()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main():
+    item_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    per_page = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    print(f"生成 {item_rows} 条商品记录...")
+    seed(db_path, item_rows)
+    app = create_app(make_config(db_path))
+
+    with app.test_request_context():
+        items, _ = ItemService.get_all_items({"per_page": per_page})
+        receipts, _ = ReceiptService.get_all_receipts({"per_page": per_page})
+        records, _ = ExportService.get_export_records({"per_page": per_page * 10})
+
+        cases = [
+            (f"商品 x{len(items)}", items_schema, items),
+            (f"小票 x{len(receipts)}", receipts_schema, receipts),
+            (f"导出记录 x{len(records)}", export_records_schema, records),
+        ]
+        for label, schema, data in cases:
+            compiled = CompiledSerializer(schema)
+            if compiled.dump(data) != schema.dump(data):
+                raise SystemExit(f"{label}: 编译序列化器的输出与 marshmallow 不一致")
+
+            marshmallow_ms = measure(lambda: schema.dump(data))
+            compiled_ms = measure(lambda: compiled.dump(data))
+            print(
+                f"{label:>14}: marshmallow {marshmallow_ms:.1f}ms, "
+                f"编译 {compiled_ms:.1f}ms ({marshmallow_ms / compiled_ms:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
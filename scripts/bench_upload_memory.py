@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试：上传大尺寸照片时每次上传的峰值内存
+
+为每种方式启动独立子进程，依次上传若干张 4000x3000 的 JPEG，每次上传前重置
+进程的峰值RSS（Linux /proc/self/clear_refs），报告上传期间峰值RSS相对上传前的
+最大增量（即单次上传的峰值内存）和平均耗时：
+- bytes: 改动前的实现，读入整个文件、全尺寸解码，压缩结果保存在 BytesIO 中
+- stream: POST /api/receipts，上传内容分块缓存到临时文件，JPEG 按目标尺寸降采样解码
+用法: python scripts/bench_upload_memory.py [图片数]
+"""
+
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("bytes", "stream")
+IMAGE_SIZE = (4000, 3000)
+
+
+def make_config(folder):
+    """生成基准测试用的配置类（同步压缩，不生成缩略图）"""
+    from config import Config
+
+    return type(
+        "BenchConfig",
+        (Config,),
+        {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(folder, "bench.db"),
+            "UPLOAD_FOLDER": os.path.join(folder, "uploads"),
+            "IMAGE_DERIVATIVE_SIZES": {},
+            "IMAGE_COMPRESSION_WORKERS": 0,
+        },
+    )
+
+
+def make_images(folder, count):
+    """生成测试照片（噪声叠加渐变，接近手机照片的JPEG大小）"""
+    from PIL import Image
+
+    paths = []
+    gradient = Image.linear_gradient("L").resize(IMAGE_SIZE)
+    for n in range(count):
+        noise = Image.effect_noise(IMAGE_SIZE, 20 + n)
+        image = Image.merge("RGB", (gradient, noise, gradient.rotate(180)))
+        path = os.path.join(folder, f"photo_{n}.jpg")
+        image.save(path, format="JPEG", quality=92)
+        paths.append(path)
+    return paths
+
+
+def upload_bytes(app, path):
+    """改动前的上传实现"""
+    from PIL import Image
+    from app.file_service import FileService, ImageCompressionService
+
+    with open(path, "rb") as f:
+        image_content = f.read()
+    image = ImageCompressionService.to_rgb(Image.open(io.BytesIO(image_content)))
+    max_width = app.config["IMAGE_MAX_WIDTH"]
+    max_height = app.config["IMAGE_MAX_HEIGHT"]
+    ratio = min(max_width / image.width, max_height / image.height)
+    image = image.resize(
+        (int(image.width * ratio), int(image.height * ratio)),
+        Image.Resampling.LANCZOS,
+    )
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=80, optimize=True)
+    FileService.write_md5_file(output.getvalue())
+
+
+def read_status(field):
+    """读取 /proc/self/status 中的内存字段（KB）"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise RuntimeError(f"/proc/self/status 中没有 {field}")
+
+
+def reset_peak_rss():
+    """将峰值RSS（VmHWM）重置为当前RSS"""
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def run_mode(folder, mode, paths):
+    """在当前进程中依次上传图片（由子进程调用）"""
+    from app import create_app
+    from app.database import db
+
+    app = create_app(make_config(folder))
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    def upload(path):
+        if mode == "bytes":
+            with app.app_context():
+                upload_bytes(app, path)
+            return
+        with open(path, "rb") as f:
+            response = client.post(
+                "/api/receipts",
+                data={"image": (f, os.path.basename(path)), "name": "bench"},
+                content_type="multipart/form-data",
+            )
+        assert response.status_code == 201, response.get_data(as_text=True)
+
+    # 第一张用于预热，不计入结果
+    upload(paths[0])
+    peak = 0
+    elapsed = 0
+    for path in paths[1:]:
+        reset_peak_rss()
+        before = read_status("VmRSS")
+        start = time.perf_counter()
+        upload(path)
+        elapsed += time.perf_counter() - start
+        peak = max(peak, read_status("VmHWM") - before)
+
+    print(f"{peak} {read_status('VmHWM')} {elapsed / (len(paths) - 1):.3f}")
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--run":
+        run_mode(sys.argv[2], sys.argv[3], sys.argv[4:])
+        return
+
+    count = max(2, int(sys.argv[1]) if len(sys.argv) > 1 else 5)
+    folder = tempfile.mkdtemp()
+    print(f"生成 {count} 张 {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]} 的照片...")
+    paths = make_images(folder, count)
+    average = sum(os.path.getsize(path) for path in paths) / count
+    print(f"平均文件大小 {average / 1024 / 1024:.1f}MB")
+
+    for mode in MODES:
+        mode_folder = tempfile.mkdtemp(dir=folder)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", mode_folder, mode]
+            + paths,
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=ROOT,
+        ).stdout.split()
+        peak, rss, elapsed = output[-3:]
+        print(
+            f"{mode:>6}: 单次上传峰值 {int(peak) / 1024:.1f}MB "
+            f"(进程RSS峰值 {int(rss) / 1024:.1f}MB), 平均耗时 {elapsed}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
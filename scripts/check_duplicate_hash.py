@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+检查：重复小票检测的哈希不会把不同的小票判为重复
+
+生成模拟小票（随机店名、商品名和金额的文字小票），每张小票模拟拍摄多次（不同的
+位置、距离、倾斜角度、亮度和模糊），用 DuplicateService.hash_image 计算哈希：
+- 不同的小票（包括版式相同、只有商品和金额不同的小票）的海明距离都必须大于阈值，
+  否则以非零状态退出；
+- 报告同一张小票的不同照片在阈值内的比例（召回率）和距离分布，供调整阈值参考。
+用法: python scripts/check_duplicate_hash.py [版式数] [阈值]
+      阈值默认为 DUPLICATE_PHASH_THRESHOLD
+"""
+
+import itertools
+import os
+import random
+import string
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont  # noqa: E402
+
+# 每种版式生成的不同小票数和每张小票的拍摄次数
+RECEIPTS_PER_LAYOUT = 3
+SHOTS = 3
+PHOTO_SIZE = (1536, 2048)
+
+FONT = ImageFont.load_default(size=30)
+BIG_FONT = ImageFont.load_default(size=60)
+
+
+def random_text(rnd, length):
+    letters = string.ascii_uppercase + string.digits + "  "
+    return "".join(rnd.choice(letters) for _ in range(length)).strip() or "X"
+
+
+def make_receipt(layout_seed, seed):
+    """
+    生成小票图片
+
+    layout_seed 相同的小票店名、抬头、商品行数和每行长度相同，只有商品名和金额不同。
+    """
+    layout = random.Random(layout_seed)
+    rnd = random.Random(seed)
+    item_count = layout.randint(5, 20)
+    width = 600
+    line_height = 40
+    receipt = Image.new("L", (width, line_height * (item_count + 16)), 240)
+    draw = ImageDraw.Draw(receipt)
+
+    draw.text(
+        (width // 2, 50), random_text(layout, 8), font=BIG_FONT, fill=20, anchor="mm"
+    )
+    y = 110
+    for _ in range(2):
+        draw.text(
+            (width // 2, y), random_text(layout, 18), font=FONT, fill=50, anchor="mm"
+        )
+        y += line_height
+    y += line_height // 2
+    for length in [layout.randint(6, 16) for _ in range(item_count)]:
+        draw.text((30, y), random_text(rnd, length), font=FONT, fill=40)
+        draw.text(
+            (width - 30, y),
+            str(rnd.randint(100, 9999)),
+            font=FONT,
+            fill=40,
+            anchor="ra",
+        )
+        y += line_height
+    draw.line((30, y, width - 30, y), fill=40, width=3)
+    y += line_height // 2
+    draw.text((30, y), "TOTAL", font=BIG_FONT, fill=20)
+    draw.text(
+        (width - 30, y),
+        str(rnd.randint(1000, 99999)),
+        font=BIG_FONT,
+        fill=20,
+        anchor="ra",
+    )
+    y += 90
+    draw.text((30, y), random_text(rnd, 20), font=FONT, fill=60)
+    return receipt.crop((0, 0, width, y + line_height + 40))
+
+
+def take_photo(receipt, seed):
+    """模拟拍摄：深色桌面上随机位置、大小、倾斜角度、亮度和模糊的小票"""
+    rnd = random.Random(seed)
+    width, height = PHOTO_SIZE
+    photo = Image.effect_noise(PHOTO_SIZE, 25).point(lambda v: v // 3 + 50)
+    scale = rnd.uniform(0.6, 0.85) * height / max(receipt.height, receipt.width * 1.3)
+    paper = receipt.resize(
+        (int(receipt.width * scale), int(receipt.height * scale)),
+        Image.Resampling.LANCZOS,
+    ).rotate(
+        rnd.uniform(-4, 4), expand=True, fillcolor=0, resample=Image.Resampling.BICUBIC
+    )
+    photo.paste(
+        paper,
+        (
+            int((width - paper.width) * rnd.uniform(0.3, 0.7)),
+            int((height - paper.height) * rnd.uniform(0.3, 0.7)),
+        ),
+        paper.point(lambda v: 255 if v > 0 else 0),
+    )
+    photo = ImageEnhance.Brightness(photo).enhance(rnd.uniform(0.8, 1.15))
+    return photo.filter(ImageFilter.GaussianBlur(rnd.uniform(0.5, 1.5)))
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    layout_count = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+
+    from config import Config
+    from app.duplicate_service import DuplicateService
+
+    threshold = (
+        int(sys.argv[2]) if len(sys.argv) > 2 else Config.DUPLICATE_PHASH_THRESHOLD
+    )
+
+    hashes = {}
+    elapsed = 0.0
+    for layout in range(layout_count):
+        for n in range(RECEIPTS_PER_LAYOUT):
+            receipt = make_receipt(layout, layout * 100 + n)
+            for shot in range(SHOTS):
+                photo = take_photo(receipt, (layout * 100 + n) * 10 + shot)
+                start = time.perf_counter()
+                hashes[(layout, n, shot)] = int(DuplicateService.hash_image(photo), 16)
+                elapsed += time.perf_counter() - start
+    print(
+        f"{len(hashes)} 张照片（{layout_count} 种版式 x {RECEIPTS_PER_LAYOUT} 张小票"
+        f" x {SHOTS} 次拍摄），阈值 {threshold}，"
+        f"平均计算耗时 {elapsed / len(hashes) * 1000:.0f}ms"
+    )
+
+    same, same_layout, different = [], [], []
+    false_matches = []
+    for a, b in itertools.combinations(sorted(hashes), 2):
+        distance = (hashes[a] ^ hashes[b]).bit_count()
+        if a[:2] == b[:2]:
+            same.append(distance)
+            continue
+        (same_layout if a[0] == b[0] else different).append(distance)
+        if distance <= threshold:
+            false_matches.append((distance, a, b))
+
+    same.sort()
+    same_layout.sort()
+    different.sort()
+    recall = sum(1 for distance in same if distance <= threshold) / len(same)
+    print(
+        f"同一张小票: 中位数 {percentile(same, 0.5)}，P90 {percentile(same, 0.9)}，"
+        f"最大 {same[-1]}，阈值内 {recall:.0%}"
+    )
+    print(f"版式相同的不同小票: 最小距离 {same_layout[0]}")
+    print(f"版式不同的小票: 最小距离 {different[0]}")
+
+    if false_matches:
+        print(f"失败: {len(false_matches)} 对不同的小票在阈值内")
+        for distance, a, b in sorted(false_matches)[:10]:
+            print(f"  距离 {distance}: 版式{a[0]}-小票{a[1]} / 版式{b[0]}-小票{b[1]}")
+        sys.exit(1)
+    print("通过: 不同的小票都不在阈值内")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库迁移脚本：增量导出改用数据版本号作为水位线
+新增 receipts.change_version, items.change_version, deleted_records.change_version
+字段及索引（已有记录保持为空，早于任何版本号水位线），以及记录已清理的删除记录
+范围的 deleted_record_pruning 表
+"""
+
+import sqlite3
+import sys
+
+TABLES = {
+    "receipts": "idx_receipt_change_version",
+    "items": "idx_item_change_version",
+    "deleted_records": "idx_deleted_records_change_version",
+}
+
+
+def migrate_change_version(db_path: str):
+    """执行数据版本号水位线迁移"""
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        for table, index in TABLES.items():
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [col[1] for col in cursor.fetchall()]
+
+            if "change_version" not in columns:
+                print(f"添加{table}.change_version字段...")
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN change_version INTEGER")
+
+            print(f"创建索引 {index}...")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {index} ON {table} (change_version)"
+            )
+
+        print("创建deleted_record_pruning表...")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS deleted_record_pruning (
+                id INTEGER NOT NULL PRIMARY KEY,
+                pruned_version INTEGER NOT NULL,
+                pruned_before DATETIME
+            )
+            """
+        )
+
+        conn.commit()
+
+    except Exception as e:
+        print(f"迁移过程中出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+    return True
+
+
+def main():
+    """主函数"""
+    db_path = "hamster.db"
+
+    print("开始迁移增量导出水位线...")
+    success = migrate_change_version(db_path)
+
+    if success:
+        print("迁移完成！")
+    else:
+        print("迁移失败！")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库迁移脚本：添加数据版本号表
+新增 data_version 表（单行记录），分析缓存按其中的版本号失效，
+多个工作进程共用同一个版本号
+"""
+
+import sqlite3
+import sys
+
+
+def migrate_data_version(db_path: str):
+    """执行数据版本号表迁移"""
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        print("创建data_version表...")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS data_version (
+                id INTEGER NOT NULL PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+            """
+        )
+        cursor.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+
+        conn.commit()
+
+    except Exception as e:
+        print(f"迁移过程中出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+    return True
+
+
+def main():
+    """主函数"""
+    db_path = "hamster.db"
+
+    print("开始迁移数据版本号表...")
+    success = migrate_data_version(db_path)
+
+    if success:
+        print("迁移完成！")
+    else:
+        print("迁移失败！")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库迁移脚本：创建上传图片去重索引表
+新增 image_uploads 表（原始上传内容MD5 -> 保存的文件名）及 receipts.image_filename 索引。
+已有图片的原始内容无法恢复，索引从迁移后的上传开始积累
+"""
+
+import sqlite3
+import sys
+
+
+def migrate_image_uploads(db_path: str):
+    """执行上传图片去重索引迁移"""
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        print("创建上传图片索引表 image_uploads...")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS image_uploads (
+                id INTEGER NOT NULL PRIMARY KEY,
+                raw_hash VARCHAR(32) NOT NULL UNIQUE,
+                filename VARCHAR(255) NOT NULL,
+                created_at DATETIME
+            )
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_image_uploads_filename "
+            "ON image_uploads (filename)"
+        )
+
+        print("创建索引 idx_receipt_image_filename...")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_receipt_image_filename "
+            "ON receipts (image_filename)"
+        )
+
+        conn.commit()
+
+    except Exception as e:
+        print(f"迁移过程中出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+    return True
+
+
+def main():
+    """主函数"""
+    db_path = "hamster.db"
+
+    print("开始迁移上传图片去重索引...")
+    success = migrate_image_uploads(db_path)
+
+    if success:
+        print("迁移完成！")
+    else:
+        print("迁移失败！")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
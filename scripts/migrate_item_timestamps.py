@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库迁移脚本：为商品表添加创建/修改时间，并创建删除记录表
+新增 items.created_at, items.updated_at 字段及索引（按所属小票的时间回填），
+以及增量导出使用的 deleted_records 表
+"""
+
+import sqlite3
+import sys
+
+
+def migrate_item_timestamps(db_path: str):
+    """执行商品时间字段迁移"""
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(items)")
+        columns = [col[1] for col in cursor.fetchall()]
+
+        if "created_at" not in columns:
+            print("添加created_at字段...")
+            cursor.execute("ALTER TABLE items ADD COLUMN created_at DATETIME")
+        if "updated_at" not in columns:
+            print("添加updated_at字段...")
+            cursor.execute("ALTER TABLE items ADD COLUMN updated_at DATETIME")
+
+        # 按所属小票的时间回填
+        cursor.execute(
+            """
+            UPDATE items SET
+                created_at = COALESCE(created_at,
+                    (SELECT receipts.created_at FROM receipts
+                     WHERE receipts.id = items.receipt_id)),
+                updated_at = COALESCE(updated_at,
+                    (SELECT receipts.updated_at FROM receipts
+                     WHERE receipts.id = items.receipt_id))
+            WHERE created_at IS NULL OR updated_at IS NULL
+            """
+        )
+        print(f"回填 {cursor.rowcount} 条商品的时间")
+
+        print("创建索引 idx_item_updated_at...")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_item_updated_at ON items (updated_at)"
+        )
+
+        print("创建删除记录表 deleted_records...")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS deleted_records (
+                id INTEGER NOT NULL PRIMARY KEY,
+                table_name VARCHAR(50) NOT NULL,
+                record_id INTEGER NOT NULL,
+                receipt_id INTEGER,
+                deleted_at DATETIME
+            )
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_deleted_records_deleted_at "
+            "ON deleted_records (deleted_at)"
+        )
+
+        conn.commit()
+
+    except Exception as e:
+        print(f"迁移过程中出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+    return True
+
+
+def main():
+    """主函数"""
+    db_path = "hamster.db"
+
+    print("开始迁移商品时间字段...")
+    success = migrate_item_timestamps(db_path)
+
+    if success:
+        print("迁移完成！")
+    else:
+        print("迁移失败！")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
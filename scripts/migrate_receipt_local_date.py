@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库迁移脚本：为小票表添加本地交易日期和小时字段
+新增 transaction_local_date, transaction_local_hour 字段及 (status, transaction_local_date) 索引，
+并按设定中的用户时区回填已有数据
+"""
+
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ConfigManager  # noqa: E402
+
+
+def parse_db_datetime(value: str) -> datetime:
+    """解析SQLite中存储的DateTime字符串"""
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return datetime.fromisoformat(value)
+
+
+def migrate_receipt_local_date(db_path: str, user_timezone: str):
+    """执行小票本地日期字段迁移"""
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(receipts)")
+        columns = [col[1] for col in cursor.fetchall()]
+
+        if "transaction_local_date" not in columns:
+            print("添加transaction_local_date字段...")
+            cursor.execute("ALTER TABLE receipts ADD COLUMN transaction_local_date DATE")
+        if "transaction_local_hour" not in columns:
+            print("添加transaction_local_hour字段...")
+            cursor.execute(
+                "ALTER TABLE receipts ADD COLUMN transaction_local_hour INTEGER"
+            )
+
+        print("创建索引 idx_receipt_status_local_date...")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_receipt_status_local_date "
+            "ON receipts (status, transaction_local_date)"
+        )
+
+        # 按用户时区回填
+        local_tz = pytz.timezone(user_timezone)
+        cursor.execute(
+            "SELECT id, transaction_time FROM receipts WHERE transaction_time IS NOT NULL"
+        )
+        rows = cursor.fetchall()
+        print(f"按时区 {user_timezone} 回填 {len(rows)} 条小票...")
+
+        updates = []
+        for receipt_id, transaction_time in rows:
+            local_time = pytz.UTC.localize(parse_db_datetime(transaction_time))
+            local_time = local_time.astimezone(local_tz)
+            updates.append(
+                (local_time.date().isoformat(), local_time.hour, receipt_id)
+            )
+
+        cursor.executemany(
+            "UPDATE receipts SET transaction_local_date = ?, transaction_local_hour = ? "
+            "WHERE id = ?",
+            updates,
+        )
+        conn.commit()
+
+        print(f"\n迁移完成: 回填 {len(updates)} 条小票")
+
+    except Exception as e:
+        print(f"迁移过程中出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+    return True
+
+
+def main():
+    """主函数"""
+    db_path = "hamster.db"
+    user_timezone = ConfigManager.load_settings().get("user_timezone", "Asia/Shanghai")
+
+    print("开始迁移小票本地交易日期字段...")
+    success = migrate_receipt_local_date(db_path, user_timezone)
+
+    if success:
+        print("迁移完成！")
+    else:
+        print("迁移失败！")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库迁移脚本：为小票表添加重复检测字段
+新增 receipts.image_phash, receipts.duplicate_of_id 字段及索引
+（已有小票的哈希使用 flask backfill-image-hashes 计算）
+
+早期版本保存的是16位十六进制的64位dHash，区分度不足，会把版式相同的不同小票
+标记为重复。再次运行本脚本会清除这些旧哈希和据此做的重复标记，之后重新计算。
+"""
+
+import sqlite3
+import sys
+
+
+def migrate_receipt_phash(db_path: str):
+    """执行小票重复检测字段迁移"""
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(receipts)")
+        columns = [col[1] for col in cursor.fetchall()]
+
+        if "image_phash" not in columns:
+            print("添加image_phash字段...")
+            cursor.execute("ALTER TABLE receipts ADD COLUMN image_phash VARCHAR(64)")
+        if "duplicate_of_id" not in columns:
+            print("添加duplicate_of_id字段...")
+            cursor.execute(
+                "ALTER TABLE receipts ADD COLUMN duplicate_of_id INTEGER "
+                "REFERENCES receipts (id) ON DELETE SET NULL"
+            )
+
+        cursor.execute(
+            "SELECT id FROM receipts WHERE duplicate_of_id IS NOT NULL "
+            "AND length(image_phash) = 16 AND status = 'PENDING'"
+        )
+        skipped_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "UPDATE receipts SET image_phash = NULL, duplicate_of_id = NULL "
+            "WHERE length(image_phash) = 16"
+        )
+        if cursor.rowcount:
+            print(f"清除了 {cursor.rowcount} 条旧格式的图片哈希和重复标记")
+        if skipped_ids:
+            print(f"以下待识别小票曾因重复标记跳过识别，可手动重新识别: {skipped_ids}")
+
+        print("创建索引 idx_receipt_duplicate_of_id...")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_receipt_duplicate_of_id "
+            "ON receipts (duplicate_of_id)"
+        )
+
+        conn.commit()
+
+    except Exception as e:
+        print(f"迁移过程中出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+    return True
+
+
+def main():
+    """主函数"""
+    db_path = "hamster.db"
+
+    print("开始迁移小票重复检测字段...")
+    success = migrate_receipt_phash(db_path)
+
+    if success:
+        print("迁移完成！请运行 flask backfill-image-hashes 计算已有小票的图片哈希。")
+    else:
+        print("迁移失败！")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库迁移脚本：为小票表添加商品数量和合计金额
+新增 receipts.item_count, receipts.total_jpy, receipts.total_cny 字段及索引，
+并按商品表回填（之后也可以使用 flask backfill-receipt-totals 重新计算）
+"""
+
+import sqlite3
+import sys
+
+
+def migrate_receipt_totals(db_path: str):
+    """执行小票合计字段迁移"""
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(receipts)")
+        columns = [col[1] for col in cursor.fetchall()]
+
+        if "item_count" not in columns:
+            print("添加item_count字段...")
+            cursor.execute(
+                "ALTER TABLE receipts ADD COLUMN item_count INTEGER NOT NULL DEFAULT 0"
+            )
+        if "total_jpy" not in columns:
+            print("添加total_jpy字段...")
+            cursor.execute(
+                "ALTER TABLE receipts ADD COLUMN total_jpy FLOAT NOT NULL DEFAULT 0"
+            )
+        if "total_cny" not in columns:
+            print("添加total_cny字段...")
+            cursor.execute(
+                "ALTER TABLE receipts ADD COLUMN total_cny FLOAT NOT NULL DEFAULT 0"
+            )
+
+        # 按商品表回填
+        cursor.execute(
+            """
+            UPDATE receipts SET
+                item_count = (SELECT COUNT(*) FROM items
+                              WHERE items.receipt_id = receipts.id),
+                total_jpy = (SELECT ROUND(COALESCE(SUM(price_jpy), 0), 2) FROM items
+                             WHERE items.receipt_id = receipts.id),
+                total_cny = (SELECT ROUND(COALESCE(SUM(price_cny), 0), 2) FROM items
+                             WHERE items.receipt_id = receipts.id)
+            """
+        )
+        print(f"回填 {cursor.rowcount} 张小票的商品数量和合计金额")
+
+        print("创建索引 idx_receipt_total_jpy...")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_receipt_total_jpy ON receipts (total_jpy)"
+        )
+
+        conn.commit()
+
+    except Exception as e:
+        print(f"迁移过程中出错: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+    return True
+
+
+def main():
+    """主函数"""
+    db_path = "hamster.db"
+
+    print("开始迁移小票合计字段...")
+    success = migrate_receipt_totals(db_path)
+
+    if success:
+        print("迁移完成！")
+    else:
+        print("迁移失败！")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()